@@ -1,8 +1,8 @@
 import pandas as pd
 import regex
-import random
 import logging
 from utilities import LibraryMangUntilities
+from indexes import normalize
 
 
 # Configure logging to show INFO and above
@@ -33,6 +33,10 @@ class BooksManager(LibraryMangUntilities):
     10. add_a_book := add a new row
     11. delete_a_book_based_on_isbn := deletes a record
     12. save_book_df_to_csv := save to .csv file
+    13. generate_unique_isbns := generate many unique isbn values at once
+    14. bulk_import_books := adds all the books of a .csv file with Title,Author columns in one go
+    15. autocomplete := titles or authors starting with the first few typed characters
+    16. find_books := searches by title, author and partial isbn from code, no input or printing, returns one page of books
     """
     # initialise
     def __init__(self):
@@ -58,9 +62,9 @@ class BooksManager(LibraryMangUntilities):
         isbn=isbn.strip()
 
         #format string
-        if not self.format_string(isbn):
-            return False
         isbn=self.format_string(isbn)
+        if not isbn:
+            return False
 
         #check if empty or spaces
         if isbn=="":
@@ -95,11 +99,11 @@ class BooksManager(LibraryMangUntilities):
     def validate_title(self,title):
         # check if formating is possible
         logging.info("check if formating is possible")
-        if not self.format_string(title):
+        title=self.format_string(title)
+        if not title:
             logging.error("formating of string not possible")
             return False
         logging.info("formatting successful")
-        title=self.format_string(title)
 
 
         #set max length limit for a name, should not exceed 255 chars
@@ -151,24 +155,25 @@ class BooksManager(LibraryMangUntilities):
         # choose the attributes you want to search by, input the values, validate it according to the type
         # 
 
-        print("\n Choose among the attributes to search from:")
-        print("1. isbn")
-        print("2. Title")
-        print("3. Author")
         # storing option number with attribute for easy access
         attribute_dict={1:"isbn",2:"Title",3:"Author"}
-        # getting the input from user, converting from string to int
-        selected_attribute= input("Enter corresponding number: ")
-        # validate the input to be one among [1,2,3]
-        try:
-            # converting from string to int
-            selected_attribute=int(selected_attribute)
-            if selected_attribute not in [1,2,3]:
-                logging.error("\nIncorrect input, choose among 1,2,3 only. Try again...")
-            print(f"You have chosen {selected_attribute}. {attribute_dict.get(selected_attribute, 'Incorrect input, choose among 1, 2, 3 only. Try again...')}")
-        except ValueError:
+        # asked again until the input is one among [1,2,3]
+        while True:
+            print("\n Choose among the attributes to search from:")
+            print("1. isbn")
+            print("2. Title")
+            print("3. Author")
+            # getting the input from user, converting from string to int
+            selected_attribute= input("Enter corresponding number: ")
+            try:
+                # converting from string to int
+                selected_attribute=int(selected_attribute)
+            except ValueError:
+                selected_attribute=None
+            if selected_attribute in attribute_dict:
+                break
             logging.error("\nIncorrect input, choose among 1,2,3 only. Try again...")
-            self.search_among_book_attributes()
+        print(f"You have chosen {selected_attribute}. {attribute_dict[selected_attribute]}")
 
         if selected_attribute==1:
             #search by isbn value
@@ -183,6 +188,75 @@ class BooksManager(LibraryMangUntilities):
             logging.info("author search selected")
             self.search_author()
 
+    # finds books without any input or printing
+    def find_books(self,title=None,author=None,isbn_fragment=None,limit=50,offset=0,typo_tolerant=False):
+        """
+        Searches the books from code, nothing is asked or printed, so it can be used by a service or a benchmark.
+        The CLI search methods (search_isbn, search_title, search_author) only ask for the input and print the result of this.
+        Every given criterion has to match, with no criteria all the books are returned page by page.
+
+        Rules:
+        1. title, validated like validate_title. Books having all the words of title are found, if there are none
+           the books containing title as a substring
+        2. author, validated like validate_name. Matched the same way as title
+        3. isbn_fragment, the whole or partial isbn number, only digits, max 13 digits, the "isbn" prefix is optional
+        4. typo_tolerant, if True and no author contains author, the authors within a couple of typos are used
+
+        Input:
+        title, author, isbn_fragment, type=string or None
+        limit, max number of books returned, None for all of them
+        offset, number of matching books skipped, used with limit to go page by page
+
+        Return:
+        QueryResult, with the page of books under rows and the number of matching books under total
+
+        Raises:
+        ValueError if a criterion does not follow its rules
+        """
+        outputs=[]
+        if isbn_fragment is not None:
+            digits=str(isbn_fragment).strip()
+            if digits.startswith("isbn"):
+                digits=digits[4:]
+            if digits=="":
+                raise ValueError("isbn cannot be whitespaces or empty")
+            if not digits.isdigit():
+                raise ValueError("isbn should only have numbers")
+            if len(digits)>13:
+                raise ValueError("isbn has at most 13 digits")
+            # only the rows having the digits of the input are checked, see search_digits
+            outputs.append(self.search_digits('books',"isbn",digits))
+        for column,value in [("Title",title),("Author",author)]:
+            if value is None:
+                continue
+            if column=="Title":
+                value=self.validate_title(str(value))
+            else:
+                value=self.validate_name(str(value))
+            if not value:
+                raise ValueError(f"{column} does not follow the rules, refer to validate_{'title' if column=='Title' else 'name'}")
+            # whole words are looked up in the token index, the substring search is the fallback for partial words
+            output=self.search_words('books',column,value)
+            if output.empty:
+                output=self.search_rows('books',column,value)
+            if output.empty and column=="Author" and typo_tolerant:
+                # the name may be misspelled, the closest names are used
+                output=self.search_similar('books',column,value)
+            outputs.append(output)
+        return self.combine_results('books',outputs,limit,offset)
+
+    # asks for a search input until find_books accepts it
+    def _ask_and_find_books(self,prompt,criterion,typo_tolerant=False):
+        while True:
+            sub_string=input(prompt)
+            try:
+                return self.find_books(**{criterion:sub_string},limit=None,typo_tolerant=typo_tolerant)
+            except ValueError as error:
+                print("="*50)
+                print(f"Invalid input, {error}. Try again...")
+                print("="*50)
+                logging.error(str(error))
+
     # search by isbn value
     def search_isbn(self):
         """
@@ -194,42 +268,17 @@ class BooksManager(LibraryMangUntilities):
         Returns:
         It does not return anything, it prints all rows that contain the entered string or substring to the terminal
         """
-        #Get isbn value as input from user
-        sub_string=input("enter the whole or partial isbn number to search for, (DO NOT include isbn as prefix): ")
-        
-        # Validate the input
-        #removing trailing spaces
-        sub_string=sub_string.strip()
-
-        #check if empty or spaces
-        if sub_string=="":
-            logging.error("\nError: input cannot be whitespaces or simpy empty, try again....\n")
-            #if input fails, we asks for input again
-            self.search_isbn()
-
-        #check that its only numbers
-        if not sub_string.isdigit():
-            logging.error("\nError: Ensure only numbers are entered, try again....\n")
-            # if input failed, we ask for input again
-            self.search_isbn()
-
-        # check if max length exceed 13
-        if len(sub_string)>13:
-            logging.error("\nError: The max possible input length is 13, try again\n")
-            self.search_isbn()
-        
-        #search for said substring in the isbn col of the dataframe
-        # print(self.books_df[self.books_df["isbn"].str.contains(sub_string,case=False,na=False)])
-        
-        output=self.books_df[self.books_df["isbn"].str.contains(sub_string,case=False,na=False)]
+        #Get isbn value as input from user, asked again if it is not valid
+        result=self._ask_and_find_books("enter the whole or partial isbn number to search for, (DO NOT include isbn as prefix): ","isbn_fragment")
         
         # if no match found
-        if (output.empty):
+        if result.total==0:
             error_message="Tried searching, no match found"
+            print(error_message)
             logging.error(error_message)
-            return self.search_isbn()
+            return
         logging.info("sub_string match found under isbn")
-        print(output)
+        print(result.rows)
    
     # search by authors name    
     def search_author(self):
@@ -237,6 +286,8 @@ class BooksManager(LibraryMangUntilities):
         Used to search for a string or substring within the column "Author"
         Rules:
         1. same validation rules from validate_name() function applies here, refer to validate_name's docstring
+        2. rows having all the entered words are found first, if there are none rows containing the entered text as a substring are shown
+        3. if nothing matches, authors within a couple of typos are shown, closest first
 
         Input:
         input is taken from user
@@ -254,28 +305,39 @@ class BooksManager(LibraryMangUntilities):
         6. trailing dots from end like MRS. DR. 'Dr. .Ram. will be automatically removed
         7. only ASCII inputs
         8. max 255 chars""")
-        #take authors name as input from user
-        sub_str=input("Enter partial or full name: ")
-        # validate the name
-        if not self.validate_name(sub_str):
-            print("="*50)
-            print("Invalid input, please follow naming rules")
-            print("="*50)
-            self.search_author()
-
-        sub_str=self.validate_name(sub_str)
-
-        output=self.users_df[self.users_df["Author"].str.contains(sub_str)]
+        #take authors name as input from user, asked again if it is not valid
+        result=self._ask_and_find_books("Enter partial or full name: ","author",typo_tolerant=True)
         
         # if no match found
-        if (output.empty):
+        if result.total==0:
             error_message="Tried searching, no match found"
             print(error_message)
             print("="*50)
             logging.error(error_message)
-            return self.search_name()
+            return
+        if 'distance' in result.rows.columns:
+            print("No exact match, closest authors:")
         logging.info("sub_string match found under Names name")
-        print(output)
+        print(result.rows)
+
+# completes a partially typed title or author
+    def autocomplete(self,prefix,column="Title",k=10):
+        """
+        Used to complete the first few characters of a title or author typed at the desk.
+        Answered by the sorted prefix index of the column, kept up to date by add_a_book,
+        update_an_existing_book_detail and delete_a_book_based_on_isbn
+
+        Input:
+        prefix, the typed characters, type=string
+        column, "Title" or "Author"
+        k, max number of completions
+
+        Return:
+        list of at most k titles/authors starting with prefix, in alphabetical order
+        """
+        if column not in ["Title","Author"]:
+            raise ValueError("column should be one among Title,Author")
+        return self.index_of('books',f"{column}_prefix").complete(prefix,k)
 
 # searches by title
     def search_title(self):
@@ -283,6 +345,7 @@ class BooksManager(LibraryMangUntilities):
         Used to search for a string or substring within the column "Title"
         Rules:
         1. same validation rules from validate_title() function applies here, refer to validate_title's docstring
+        2. rows having all the entered words are found first, if there are none rows containing the entered text as a substring are shown
 
         Input:
         input is taken from user
@@ -290,32 +353,18 @@ class BooksManager(LibraryMangUntilities):
         Return:
         Nothing is returned, rows that satisfies condition printed to screen
         """ 
-        #take authors name as input from user
-        sub_str=input("Enter partial or full Title: ")
-        # validate the name
-        # sub_str=self.validate_title(sub_str)
-
-        if not self.validate_title(sub_str):
-            print("="*50)
-            print("Invalid input, please follow Title rules")
-            print("="*50)
-            self.search_title()
-
-        sub_str=self.validate_title(sub_str)
-
-
-
-        # search for substring in column Author
-        output=self.books_df[self.books_df["Title"].str.contains(sub_str)]
+        #take title as input from user, asked again if it is not valid
+        result=self._ask_and_find_books("Enter partial or full Title: ","title")
         
         # if no match found
-        if output.empty:
+        if result.total==0:
             error_message="Tried searching, no match found\n"
+            print(error_message)
             logging.error(error_message)
-            return self.search_title()
+            return
         logging.info("sub_string match found under Title name")
         #printing matches
-        print(output)
+        print(result.rows)
 
 # generate unique_isbn value 
     def generate_unique_isbn(self):
@@ -324,36 +373,27 @@ class BooksManager(LibraryMangUntilities):
 
         The function generates an unique unique 17char isbn value for every new book entered into library
         Rules:
-        1. we have to check isbn in the dataset before assigning to prevent duplicates 
+        1. the isbn must not be used by another book, nor handed out to another writer that did not add its book yet
 
         Output:
         isbn
         type: string
         
         """
-        def unique_isbn():
-            """
-            generates the 13 digit isbn with the prefix "isbn", Totalling a 17 char long string
+        return self.allocate_keys("books")[0]
 
-            This is used in generate_unique_isbn function. Its nested to follow DRY principles
-
-            Output:
-            isbn
-            type: string
+    # generate many unique isbn values at once
+    def generate_unique_isbns(self,count):
+        """
+        generates count unique isbn values, none of them already used in the library
 
-            """
-            isbn="isbn"+"".join([str(random.randint(0,9)) for i in range(13)])
-            return isbn
-            
-    
-        #generated number with the prefix isbn
-        isbn=unique_isbn()
+        Input:
+        count, number of isbn values needed, type=int
 
-        #check for duplicates
-        while isbn in self.books_df["isbn"]:
-            isbn=unique_isbn()
-        
-        return isbn
+        Output:
+        list of isbn strings
+        """
+        return self.allocate_keys("books",count)
 
 # update value in a row    
     def update_an_existing_book_detail(self):
@@ -401,7 +441,8 @@ class BooksManager(LibraryMangUntilities):
             name, type=string
             """
             new_book_name=input("Enter new title: ")
-            if not self.validate_title(new_book_name):
+            validated_title=self.validate_title(new_book_name)
+            if not validated_title:
                 logging.error("failed to validate new title")
                 print("The entered title is not valid")
                 print("-"*20)
@@ -414,12 +455,11 @@ class BooksManager(LibraryMangUntilities):
                     print("Ensure entered choice is among the available choices")
                 if choice.strip()=="1":
                     # we try again
-                    get_new_title_and_validate_it()
-                    #isbn valdiated
-                if choice.strip()=="2":
-                    logging.info("Exiting")
-                    return
-            return new_book_name
+                    return get_new_title_and_validate_it()
+                logging.info("Exiting")
+                return
+            # the validated title, lowercase with single spaces, so the same title is always stored the same way
+            return normalize(validated_title)
         logging.info("getting the new title from user via CLI")
         updated_title=get_new_title_and_validate_it()
         logging.info("getting the new title from user via CLI")
@@ -436,7 +476,8 @@ class BooksManager(LibraryMangUntilities):
             name, type=string
             """
             new_name=input("Enter new Author's name: ")
-            if not self.validate_name(new_name):
+            validated_name=self.validate_name(new_name)
+            if not validated_name:
                 logging.error("failedn to validate new book name")
                 print("The entered Author's name is not valid")
                 print("-"*20)
@@ -449,28 +490,19 @@ class BooksManager(LibraryMangUntilities):
                     print("Ensure entered choice is among the available choices")
                 if choice.strip()=="1":
                     # we try again
-                    get_new_author_name_and_validate_it()
-                    #isbn valdiated
-                if choice.strip()=="2":
-                    logging.info("Exiting")
-                    return
-            return new_name
+                    return get_new_author_name_and_validate_it()
+                logging.info("Exiting")
+                return
+            return normalize(validated_name)
         logging.info("getting the new name from user via CLI")
         udpated_name=get_new_author_name_and_validate_it()
         logging.info("received the new name from user via CLI")
-        #remove the existing row
-        logging.info("Removing row based on isbn")
-        self.books_df=self.books_df[self.books_df['isbn']!=input_isbn]
-        logging.info("Record removed")
-        # Define the new values
-        # print(self.books_df)
-        logging.info("savinng data to .csv file")
-        new_book=pd.DataFrame({'isbn':[input_isbn],'Title':[updated_title],'Author':[udpated_name]})
-        self.books_df=pd.concat([self.books_df,new_book],ignore_index=True)
-
-        #save the updates to the .csv file
-
-        self.save_book_df_to_csv()
+        if updated_title is None or udpated_name is None:
+            logging.info("book not updated")
+            return
+        #update the existing row and save the updates
+        logging.info("updating row based on isbn")
+        self.update_row('books',input_isbn,{'Title':updated_title,'Author':udpated_name})
         logging.info("saved to file")
 
     #  list all contents to CLI
@@ -516,9 +548,8 @@ class BooksManager(LibraryMangUntilities):
         """
         # check if book already exists
         logging.info("checking if book already exists in the library")
-        output=self.books_df[(self.books_df['isbn']==isbn)]
         #if book already exists
-        if not output.empty:
+        if self.row_exists('books',isbn=isbn):
             error_message="book exists"
             logging.info(error_message)
             return True
@@ -544,9 +575,8 @@ class BooksManager(LibraryMangUntilities):
         """
         # check if book already exists
         logging.info("checking if book already exists in the library")
-        output=self.books_df[(self.books_df['Title']==Title)&(self.books_df["Author"]==Author)]
         #if book already exists
-        if not output.empty:
+        if self.row_exists('books',Title=Title,Author=Author):
             error_message="book exists"
             logging.info(error_message)
             return True
@@ -572,9 +602,8 @@ class BooksManager(LibraryMangUntilities):
         """
         # check if book already exists
         logging.info("checking if book already exists in the library")
-        output=self.books_df[(self.books_df['isbn']==isbn)&(self.books_df['Title']==Title)&(self.books_df["Author"]==Author)]
         #if book already exists
-        if not output.empty:
+        if self.row_exists('books',isbn=isbn,Title=Title,Author=Author):
             error_message="book exists"
             logging.info(error_message)
             return True
@@ -584,18 +613,8 @@ class BooksManager(LibraryMangUntilities):
 
     # add a new row
     def add_a_book(self):
-        # validate isbn, Title and Author
-        logging.info("validating isbn...")
-        isbn=self.generate_unique_isbn()
-        isbn=self.validate_isbn(isbn)
+        # validate Title and Author, the isbn is allocated once the book is known to be new
 
-        # check if another row has the same isbn
-        if not self.books_df[self.books_df['isbn']==isbn].empty:
-            error_message="\nError: duplicate isbn exits in library"
-            logging.error(error_message)
-            return False
-        logging.info("isbn validation complete")
-        
             # the updated book name
         def get_new_title_and_validate_it():
             """
@@ -608,7 +627,8 @@ class BooksManager(LibraryMangUntilities):
             name, type=string
             """
             new_book_name=input("Enter new title: ")
-            if not self.validate_title(new_book_name):
+            validated_title=self.validate_title(new_book_name)
+            if not validated_title:
                 logging.error("failed to validate new title")
                 print("The entered title is not valid")
                 print("-"*20)
@@ -621,12 +641,11 @@ class BooksManager(LibraryMangUntilities):
                     print("Ensure entered choice is among the available choices")
                 if choice.strip()=="1":
                     # we try again
-                    get_new_title_and_validate_it()
-                    #isbn valdiated
-                if choice.strip()=="2":
-                    logging.info("Exiting")
-                    return
-            return new_book_name
+                    return get_new_title_and_validate_it()
+                logging.info("Exiting")
+                return
+            # the validated title, lowercase with single spaces, so the same title is always stored the same way
+            return normalize(validated_title)
         logging.info("getting the new title from user via CLI")
         title=get_new_title_and_validate_it()
         logging.info("getting the new title from user via CLI")
@@ -643,7 +662,8 @@ class BooksManager(LibraryMangUntilities):
             name, type=string
             """
             new_name=input("Enter new Author's name: ")
-            if not self.validate_name(new_name):
+            validated_name=self.validate_name(new_name)
+            if not validated_name:
                 logging.error("failedn to validate new book name")
                 print("The entered Author's name is not valid")
                 print("-"*20)
@@ -656,20 +676,31 @@ class BooksManager(LibraryMangUntilities):
                     print("Ensure entered choice is among the available choices")
                 if choice.strip()=="1":
                     # we try again
-                    get_new_author_name_and_validate_it()
-                    #isbn valdiated
-                if choice.strip()=="2":
-                    logging.info("Exiting")
-                    return
-            return new_name
+                    return get_new_author_name_and_validate_it()
+                logging.info("Exiting")
+                return
+            return normalize(validated_name)
         logging.info("getting the new name from user via CLI")
         name=get_new_author_name_and_validate_it()
         logging.info("received the new name from user via CLI")
-        logging.info('creating and adding new row')
-        new_book=pd.DataFrame({'isbn':[isbn],'Title':[title],'Author':[name]})
-        self.books_df=pd.concat([self.books_df,new_book],ignore_index=True)
-        print(self.books_df[self.books_df['isbn']==isbn])
-        self.save_book_df_to_csv()
+        if title is None or name is None:
+            logging.info("book not added")
+            return False
+        # another terminal may add the same title and Author at the same time, the check and the insert hold its lock
+        with self.row_locks.hold(("book",(title,name))):
+            # check if the same book is already in the library, answered by the Title_Author index
+            if self.check_if_book_exists_using_title_author(title,name):
+                error_message="\nError: a book with the same title and Author exists in library"
+                logging.error(error_message)
+                print(error_message)
+                return False
+            # an allocated isbn stays reserved until its row is added, so it is only asked for right before adding it
+            logging.info("validating isbn...")
+            isbn=self.validate_isbn(self.generate_unique_isbn())
+            logging.info("isbn validation complete")
+            logging.info('creating and adding new row')
+            self.insert_row('books',{'isbn':isbn,'Title':title,'Author':name})
+        print(self.find_rows('books',isbn=isbn))
         logging.info("saved to file")
     
     # delete a row according to isbn or title, but not according to Author, since author could have written multiple books
@@ -707,7 +738,7 @@ class BooksManager(LibraryMangUntilities):
 
         input_isbn=self.validate_isbn(input_isbn)
         # check if another row has the same isbn
-        if self.books_df[self.books_df['isbn']==input_isbn].empty:
+        if not self.row_exists('books',isbn=input_isbn):
             error_message="\nError: isbn entered Not found in database"
             logging.error(error_message)
             # return self.delete_a_book_based_on_isbn()
@@ -732,18 +763,86 @@ class BooksManager(LibraryMangUntilities):
 
 
 
-        logging.info("inputted ISBN validated, proceeding to delete row")
-        print("ISBN value inputed exists in library, proceeding to delete")
-        logging.info("Removing row based on isbn")
-        self.books_df=self.books_df[self.books_df['isbn']!=input_isbn]
+        logging.info("inputted ISBN validated, checking if the book is on loan")
+        # the book cannot be borrowed by another terminal between the check and the delete
+        with self.row_locks.hold(("isbn",input_isbn)):
+            # the loans are indexed by isbn, so this does not scan the users
+            holders=self.holders_of(input_isbn)
+            if holders:
+                msg=f'Book is borrowed by {", ".join(holders)}, removing book after it has been returned'
+                logging.info(msg)
+                print(msg)
+                return
+            print("ISBN value inputed exists in library, proceeding to delete")
+            logging.info("Removing row based on isbn")
+            self.delete_row('books',input_isbn)
+            self.remove_holdings(input_isbn)
+            self.drop_holds(isbn=input_isbn)
         logging.info("Record removed")
-        self.save_book_df_to_csv()
         logging.info("saved to file")
 
+    # adds all the books of a .csv file in one go
+    def bulk_import_books(self,file_path,error_report_path=None):
+        """
+        Imports every book of a .csv file with the columns Title and Author.
+
+        All rows are validated in one vectorized pass using the same rules as validate_title and validate_name.
+        Rows that fail validation, repeat a Title/Author pair of the file or already exist in the library are rejected
+        into an error report, the rest get an isbn each and are added with a single write.
+
+        Input:
+        file_path, path of the .csv file
+        error_report_path, where the rejected rows are written, defaults to file_path+".errors.csv"
+
+        Return:
+        dict with "imported","rejected" and "error_report" (None if no row was rejected)
+        """
+        rows=self.read_import_file(file_path,['Title','Author'])
+        titles,title_reasons=self.validate_title_column(rows['Title'])
+        authors,author_reasons=self.validate_name_column(rows['Author'])
+        # the title's reason is reported first, like add_a_book asks for the title first
+        reasons=("author_"+author_reasons).where(author_reasons!="","")
+        reasons=("title_"+title_reasons).where(title_reasons!="",reasons)
+        # stored like add_a_book stores them, lowercase with single spaces
+        books=pd.DataFrame({'Title':titles.map(normalize),'Author':authors.map(normalize)})
+
+        # duplicates within the file and with the books already in the library
+        valid=reasons==""
+        repeated=valid&books.duplicated(subset=['Title','Author'])
+        reasons[repeated]="duplicate_in_file"
+        # the pairs of the library are looked up in the Title_Author index, which compares normalized values
+        with self.storage_lock:
+            title_author=self.index_of('books','Title_Author')
+            in_library=valid&pd.Series([bool(title_author.get(pair)) for pair in zip(books['Title'],books['Author'])],index=books.index)
+        reasons[in_library]="already_in_library"
+
+        accepted=books[reasons==""].copy()
+        accepted.insert(0,'isbn',self.generate_unique_isbns(len(accepted)))
+        self.insert_rows('books',accepted)
+
+        rejected=rows[reasons!=""].assign(reason=reasons[reasons!=""])
+        if error_report_path is None:
+            error_report_path=file_path+".errors.csv"
+        report=self.write_error_report(rejected,error_report_path)
+        summary={"imported":len(accepted),"rejected":len(rejected),"error_report":report}
+        logging.info(f"bulk import of books: {summary}")
+        return summary
+
     # modular so that 
-    def save_book_df_to_csv(self):
-        # to do: thsi replaces the entire contnets of the csv file, how to only reflect the changes that occured?
-        self.books_df.to_csv(self.book_df_file_path,index=False)
+    def save_book_df_to_csv(self,op=None,isbn=None):
+        """
+        saves changes of the dataset.
+        If op and isbn are given, only the change of that row is appended to the journal,
+        otherwise the entire dataset is written to the .csv file
+
+        Params:
+        op, one among "insert","update","delete", type=string
+        isbn, isbn of the changed row, type=string
+        """
+        if op is None:
+            self.compact_table('books')
+            return
+        self.record_change('books',op,isbn)
 
 if __name__=="__main__":
     pass
@@ -1,12 +1,37 @@
 import pandas as pd
+from collections import OrderedDict
 import logging
+from datetime import datetime,timedelta
 logging.basicConfig(level=logging.ERROR)
 from user import UsersManager
 from book import BooksManager
+from due_index import DueIndex
+from event_log import EventLog,EventReplay
 
 class CheckManager():
     """
-    Used to show borrowing and returning of books in a library. This is based on the "Users.csv" dataframe
+    Used to show borrowing and returning of books in a library. Loans are kept in their own table "Loans_csv.csv"
+    with the columns user_id, isbn, borrowed_at and due_at. In memory the loans are indexed both by user and by isbn,
+    so borrowing, returning and "who has this isbn" do not scan anything. The due dates are kept in a sorted array
+    (due_index.py), so overdue loans and loans due soon are found without looking at every loan.
+
+    The "Borrowed" column of "Users.csv" is no longer updated on every borrow/return, it is refreshed from the
+    loans when the users table is written, and when users are shown. The first time the program runs without
+    "Loans_csv.csv", the loans are migrated from the "Borrowed" column.
+    Migrated loans have no borrowing date and no due date, they are never overdue.
+
+    A library can own several copies of a book. The number of copies is kept in "Holdings_csv.csv" with the
+    columns isbn and copies, a book without a row there has a single copy. The number of copies on loan is the
+    number of holders in loans_by_isbn, so borrowing and returning update it together with the loan.
+
+    A user can place a hold on a book whose copies are all borrowed. Holds are kept in "Holds_csv.csv" with the
+    columns isbn, user_id and placed_at, and in memory as a first in first out queue per book plus the books each
+    user waits for. When a copy is returned it is lent straight away to the first user of the queue who may borrow it,
+    a user at the cap of 10 books keeps their place and the next one gets the copy.
+
+    Several desk terminals can borrow and return at the same time from different threads. Every borrow and return
+    holds the lock of its user and of its book (StorageManager.row_locks), so the 10 book cap of a user and the
+    copies of a book are checked and changed by one terminal at a time, while other users and books are not blocked.
 
     Functionalities:
     1. __init__ := loads the users_df dataframe, making it available for rest of code
@@ -15,15 +40,48 @@ class CheckManager():
     4.     borrow_book_internal :=  the internal code that is run when we borrow a book
     5. return_a_book := handles everything related to returning of a book
     6.     return_book_internal :=  the internal code that is run when we return a book
+    7. loans_df := the loans as a dataframe, assigning a dataframe rebuilds the indexes
+    8. loans_by_user, loans_by_isbn := the loan indexes, user_id -> {isbn: borrowed_at} and isbn -> {user_id}
+    9. add_loan, remove_loan := changes a single loan in the indexes and persists it
+    10. loans_from_borrowed_column := migrates the "Borrowed" column into loans
+    11. refresh_borrowed_column := fills the "Borrowed" column of users from the loans
+    12. holders_of := ids of the users currently holding a book
+    13. circulate_batch := applies many borrows and returns at once, with one outcome per item and a single write
+    14. borrow_refusal := the borrowing rule a user and book fail, None if the book can be borrowed
+    15. holdings_df, copies_by_isbn := the copies of every book as a dataframe and as isbn -> copies
+    16. copies_of, on_loan_count, available_count := copies owned, on loan and on the shelf of a book
+    17. set_copies := changes the number of copies of a book
+    18. available_books := the books with at least one copy on the shelf
+    19. renew_book_internal := pushes the due date of a loan loan_period_days after today
+    20. overdue_loans, loans_due_within := loans past their due date, loans due in the next days, earliest first
+    21. holds_df, holds_by_isbn, holds_by_user := the holds as a dataframe, isbn -> queue of user_id and user_id -> {isbn}
+    22. place_hold, cancel_hold := joins and leaves the queue of a book
+    23. hold_queue, holds_of := the users waiting for a book in order, the books a user waits for
+    24. dispatch_hold := lends the available copies of a book to the first users of its queue, called by return_book_internal
+    25. drop_holds := forgets the holds of a deleted book or user
+    26. event_log := every borrow, return, renewal and hold is also appended to "Circulation_events.jsonl", see event_log.py,
+        a new log starts with an "existing_loan"/"existing_hold" event for every loan and hold made before it
+    27. circulation_events, replay_circulation := the logged events, and computations over them in one streaming pass
+    28. loans_per_day, loans_per_title := number of borrows per day and per book, from the event log
     """
+    # number of days a book is lent for, and added by a renewal
+    loan_period_days=14
+    # size at which the circulation event log is rotated
+    event_log_max_bytes=8*1024*1024
+    # event of the log for every kind of change of the loans and holds tables
+    loan_events={"insert":"borrow","delete":"return","update":"renew"}
+    hold_events={"insert":"hold","delete":"hold_removed"}
+
     #intialises users_df
-    def __init__(self,user_df):
+    def __init__(self,user_df=None):
         """
         all operations are performed on the user_df dataset, which is first read from "Users.csv".
         Inputs:
-        pandas_data_frame, is the dataframe read from Users.csv file
+        pandas_data_frame, is the dataframe read from Users.csv file.
+        If None, the dataframe is the one loaded by StorageManager the first time it is used
         """
-        self.users_df=user_df
+        if user_df is not None:
+            self.users_df=user_df
         self.user_obj=UsersManager()
         self.book_obj=BooksManager()
     
@@ -39,12 +97,553 @@ class CheckManager():
         Output:
         list_of_all_borrowed_books, type=list
         """
-        borrowed_books_string=(self.users_df.loc[self.users_df['id'] == id, 'Borrowed'].fillna("").astype(str).values[0])
-        list_of_all_borrowed_books=borrowed_books_string.split("-")
-        #remove "" from list_of_all_borrowed
-        list_of_all_borrowed_books=[book for book in list_of_all_borrowed_books if book.strip()!=""]
+        # in the order they were borrowed
+        list_of_all_borrowed_books=list(self.loans_by_user.get(id,{}))
         return (list_of_all_borrowed_books)
-        # print(type(borrowed_books))
+
+    # the loans as a dataframe
+    @property
+    def loans_df(self):
+        """
+        The loans are kept in loans_by_user and loans_by_isbn, the dataframe is built when it is needed,
+        for example when the loans table is written to its .csv file
+        """
+        due=self.due_index.due
+        rows=[(user_id,isbn,borrowed_at,due.get((user_id,isbn),"")) for user_id,books in self.loans_by_user.items() for isbn,borrowed_at in books.items()]
+        return pd.DataFrame(rows,columns=['user_id','isbn','borrowed_at','due_at'],dtype=object)
+
+    @loans_df.setter
+    def loans_df(self,frame):
+        loans_by_user={}
+        loans_by_isbn={}
+        due={}
+        for user_id,isbn,borrowed_at,due_at in frame[['user_id','isbn','borrowed_at','due_at']].itertuples(index=False,name=None):
+            loans_by_user.setdefault(user_id,{})[isbn]=borrowed_at
+            loans_by_isbn.setdefault(isbn,set()).add(user_id)
+            due[(user_id,isbn)]=due_at
+        due_index=DueIndex()
+        due_index.build(due)
+        self.__dict__['_loans_by_user']=loans_by_user
+        self.__dict__['_loans_by_isbn']=loans_by_isbn
+        self.__dict__['_due_index']=due_index
+
+    # user_id -> {isbn: borrowed_at}
+    @property
+    def loans_by_user(self):
+        self._load_circulation_table('loans','_loans_by_user')
+        return self.__dict__['_loans_by_user']
+
+    # loans ordered by due date
+    @property
+    def due_index(self):
+        self._load_circulation_table('loans','_due_index')
+        return self.__dict__['_due_index']
+
+    # isbn -> {user_id}
+    @property
+    def loans_by_isbn(self):
+        self._load_circulation_table('loans','_loans_by_isbn')
+        return self.__dict__['_loans_by_isbn']
+
+    # loads the loans or holds table the first time it is used
+    def _load_circulation_table(self,table,attribute):
+        """
+        The existing loans or holds are written to a new event log before any change of them can be made:
+        other threads wait on storage_lock until the table is loaded and logged, only the loading thread
+        itself reads the table while it is being loaded (example, replaying its journal)
+
+        Args:
+        table = "loans" or "holds"
+        attribute = the attribute set by loading the table, example "_loans_by_user"
+        """
+        if self.__dict__.get(f'_{table}_ready'):
+            return
+        with self.storage_lock:
+            if self.__dict__.get(f'_{table}_ready') or self.__dict__.get(f'_{table}_loading'):
+                return
+            self.__dict__[f'_{table}_loading']=True
+            try:
+                if self.__dict__.get(attribute) is None:
+                    self.load_table(table)
+                self._log_existing_circulation(table)
+                self.__dict__[f'_{table}_ready']=True
+            finally:
+                self.__dict__[f'_{table}_loading']=False
+
+    # the holds as a dataframe
+    @property
+    def holds_df(self):
+        rows=[(isbn,user_id,placed_at) for isbn,queue in self.holds_by_isbn.items() for user_id,placed_at in queue.items()]
+        return pd.DataFrame(rows,columns=['isbn','user_id','placed_at'],dtype=object)
+
+    @holds_df.setter
+    def holds_df(self,frame):
+        holds_by_isbn={}
+        holds_by_user={}
+        # the queues are rebuilt in the order the holds were placed
+        frame=frame.sort_values('placed_at',kind='stable')
+        for isbn,user_id,placed_at in frame[['isbn','user_id','placed_at']].itertuples(index=False,name=None):
+            holds_by_isbn.setdefault(isbn,OrderedDict())[user_id]=placed_at
+            holds_by_user.setdefault(user_id,set()).add(isbn)
+        self.__dict__['_holds_by_isbn']=holds_by_isbn
+        self.__dict__['_holds_by_user']=holds_by_user
+
+    # isbn -> OrderedDict user_id -> placed_at, first placed first
+    @property
+    def holds_by_isbn(self):
+        self._load_circulation_table('holds','_holds_by_isbn')
+        return self.__dict__['_holds_by_isbn']
+
+    # user_id -> {isbn}
+    @property
+    def holds_by_user(self):
+        self._load_circulation_table('holds','_holds_by_user')
+        return self.__dict__['_holds_by_user']
+
+    # joins the queue of a book
+    def place_hold(self,user_id,isbn):
+        """
+        Rules:
+        1. the user and the book must exist
+        2. the user has not borrowed the book and is not already waiting for it
+        3. every copy of the book is borrowed, otherwise it can be borrowed straight away
+
+        Args:
+        user_id, isbn = string, already validated
+
+        Return:
+        "on_hold", or the failed rule: "unknown_user","unknown_book","already_borrowed","already_on_hold","available"
+        """
+        with self.row_locks.hold(("user",user_id),("isbn",isbn)):
+            if not self.row_exists('users',id=user_id):
+                return "unknown_user"
+            if not self.row_exists('books',isbn=isbn):
+                return "unknown_book"
+            if isbn in self.loans_by_user.get(user_id,{}):
+                return "already_borrowed"
+            if isbn in self.holds_by_user.get(user_id,()):
+                return "already_on_hold"
+            if self.available_count(isbn)>0:
+                return "available"
+            self._save_holds([self._queue_hold(user_id,isbn)])
+            logging.info(f"{user_id} is number {len(self.holds_by_isbn[isbn])} in the queue of {isbn}")
+            return "on_hold"
+
+    # leaves the queue of a book
+    def cancel_hold(self,user_id,isbn):
+        """
+        Return:
+        False if the user is not waiting for the book, True otherwise
+        """
+        with self.row_locks.hold(("user",user_id),("isbn",isbn)):
+            if isbn not in self.holds_by_user.get(user_id,()):
+                logging.error("the person has no hold on this book")
+                return False
+            self._save_holds([self._unqueue_hold(user_id,isbn)])
+            return True
+
+    # users waiting for a book
+    def hold_queue(self,isbn):
+        """
+        Return:
+        list of user ids, the first one gets the next returned copy
+        """
+        return list(self.holds_by_isbn.get(isbn,()))
+
+    # books a user waits for
+    def holds_of(self,user_id):
+        return sorted(self.holds_by_user.get(user_id,()))
+
+    # adds a hold to the end of the queue
+    def _queue_hold(self,user_id,isbn):
+        """
+        Return:
+        the journal entry of the hold, to be persisted by the caller
+        """
+        # microseconds, so the queue order survives a reload
+        placed_at=datetime.now().isoformat()
+        with self.storage_lock:
+            self.holds_by_isbn.setdefault(isbn,OrderedDict())[user_id]=placed_at
+            self.holds_by_user.setdefault(user_id,set()).add(isbn)
+        return {"op":"insert","key":[isbn,user_id],"row":{'isbn':isbn,'user_id':user_id,'placed_at':placed_at}}
+
+    # removes a hold from its queue
+    def _unqueue_hold(self,user_id,isbn):
+        """
+        Return:
+        the journal entry of the removal, to be persisted by the caller
+        """
+        with self.storage_lock:
+            queue=self.holds_by_isbn.get(isbn,{})
+            queue.pop(user_id,None)
+            if not queue:
+                self.holds_by_isbn.pop(isbn,None)
+            books=self.holds_by_user.get(user_id,set())
+            books.discard(isbn)
+            if not books:
+                self.holds_by_user.pop(user_id,None)
+        return {"op":"delete","key":[isbn,user_id]}
+
+    # forgets the holds of a deleted book or user
+    def drop_holds(self,isbn=None,user_id=None):
+        """
+        Args:
+        isbn = string, drops every hold on the book
+        user_id = string, drops every hold of the user, used when isbn is None
+        """
+        if isbn is not None:
+            holds=[(holder,isbn) for holder in self.hold_queue(isbn)]
+        else:
+            holds=[(user_id,book) for book in self.holds_of(user_id)]
+        if holds:
+            self._save_holds([self._unqueue_hold(holder,book) for holder,book in holds])
+
+    # lends the returned copies to the users waiting for them
+    def dispatch_hold(self,isbn):
+        """
+        Gives every available copy of the book to the first user of its queue allowed to borrow it and saves the changes
+
+        Args:
+        isbn = string
+
+        Return:
+        list of the user ids the book was lent to
+        """
+        # every change of the loans and holds of the book takes its lock, it is kept until they are written
+        with self.row_locks.hold(("isbn",isbn)):
+            loan_entries,hold_entries,lent_to=self._dispatch_hold(isbn)
+            if loan_entries:
+                self._save_loans(loan_entries)
+            if hold_entries:
+                self._save_holds(hold_entries)
+        for user_id in lent_to:
+            print(f"{isbn} was on hold and is now lent to {user_id}")
+        return lent_to
+
+    def _dispatch_hold(self,isbn):
+        """
+        Rules of borrow_book_internal for the user at the head of the queue:
+        1. a user at the cap of 10 books keeps their place, the copy goes to the next user
+        2. the hold of a user or book that no longer exists, or of a user who already has the book, is dropped
+
+        Return:
+        journal entries of the loans, journal entries of the holds, user ids the book was lent to
+        """
+        loan_entries=[]
+        hold_entries=[]
+        lent_to=[]
+        # users at the cap, skipped this time
+        skipped=set()
+        with self.row_locks.hold(("isbn",isbn)):
+            while self.available_count(isbn)>0:
+                queue=self.holds_by_isbn.get(isbn,())
+                # the head of the queue, only the skipped users are looked at besides it
+                user_id=next((user_id for user_id in queue if user_id not in skipped),None)
+                if user_id is None:
+                    break
+                with self.row_locks.hold(("user",user_id)):
+                    refusal=self.borrow_refusal(user_id,isbn)
+                    if refusal=="cap_reached":
+                        skipped.add(user_id)
+                        continue
+                    hold_entries.append(self._unqueue_hold(user_id,isbn))
+                    if refusal is None:
+                        loan_entries.append(self._index_loan(user_id,isbn))
+                        lent_to.append(user_id)
+        return loan_entries,hold_entries,lent_to
+
+    # the copies of every book as a dataframe
+    @property
+    def holdings_df(self):
+        rows=[(isbn,str(copies)) for isbn,copies in self.copies_by_isbn.items()]
+        return pd.DataFrame(rows,columns=['isbn','copies'],dtype=object)
+
+    @holdings_df.setter
+    def holdings_df(self,frame):
+        self.__dict__['_copies_by_isbn']={isbn:int(copies) for isbn,copies in frame[['isbn','copies']].itertuples(index=False,name=None)}
+
+    # isbn -> number of copies, only for books with more or less than one copy
+    @property
+    def copies_by_isbn(self):
+        if self.__dict__.get('_copies_by_isbn') is None:
+            with self.storage_lock:
+                if self.__dict__.get('_copies_by_isbn') is None:
+                    self.load_table('holdings')
+        return self.__dict__['_copies_by_isbn']
+
+    # number of copies the library owns
+    def copies_of(self,isbn):
+        """
+        Input:
+        isbn, string, of an existing book
+
+        Output:
+        number of copies, type=int
+        """
+        return self.copies_by_isbn.get(isbn,1)
+
+    # number of copies borrowed
+    def on_loan_count(self,isbn):
+        return len(self.loans_by_isbn.get(isbn,()))
+
+    # number of copies on the shelf
+    def available_count(self,isbn):
+        return self.copies_of(isbn)-self.on_loan_count(isbn)
+
+    # changes the number of copies of a book
+    def set_copies(self,isbn,copies):
+        """
+        Rules:
+        1. the book must exist
+        2. the library cannot own less copies than the ones on loan
+
+        Input:
+        isbn, string
+        copies, type=int, 0 keeps the book in the catalog without any copy to borrow
+
+        Output:
+        False if any of the above rules fail, True otherwise
+        """
+        with self.row_locks.hold(("isbn",isbn)):
+            if not self.row_exists('books',isbn=isbn):
+                logging.error("book does not exist")
+                return False
+            if copies<self.on_loan_count(isbn):
+                logging.error("less copies than the ones on loan")
+                return False
+            with self.storage_lock:
+                self.copies_by_isbn[isbn]=copies
+                self.record_change('holdings',"insert",(isbn,),{'isbn':isbn,'copies':copies})
+            return True
+
+    # forgets the copies of a deleted book
+    def remove_holdings(self,isbn):
+        with self.storage_lock:
+            if self.copies_by_isbn.pop(isbn,None) is not None:
+                self.record_change('holdings',"delete",(isbn,))
+
+    # books with a copy on the shelf
+    def available_books(self):
+        """
+        Counts come from copies_by_isbn and loans_by_isbn, the "Borrowed" strings of users are not read
+
+        Output:
+        dataframe of the books with at least one available copy, with the extra columns copies, on_loan and available
+        """
+        books=self.books_df[['isbn','Title','Author']].copy()
+        books['copies']=[self.copies_of(isbn) for isbn in books['isbn']]
+        books['on_loan']=[self.on_loan_count(isbn) for isbn in books['isbn']]
+        books['available']=books['copies']-books['on_loan']
+        return books[books['available']>0].reset_index(drop=True)
+
+    # users currently holding a book
+    def holders_of(self,isbn):
+        """
+        Answered by loans_by_isbn, so no user and no "Borrowed" string is looked at
+
+        Input:
+        isbn, string
+
+        Output:
+        sorted list of the ids of the users holding the book, empty if nobody has it
+        """
+        return sorted(self.loans_by_isbn.get(isbn,()))
+
+    # saves changes of the loans and logs them as circulation events
+    def _save_loans(self,entries):
+        self.persist_changes('loans',entries)
+        self.event_log.append([self._event(self.loan_events,entry) for entry in entries])
+
+    # saves changes of the holds and logs them as circulation events
+    def _save_holds(self,entries):
+        self.persist_changes('holds',entries)
+        self.event_log.append([self._event(self.hold_events,entry) for entry in entries])
+
+    # circulation event of a journal entry of the loans or holds table
+    def _event(self,events,entry):
+        if entry["op"]=="delete":
+            user_id,isbn=(entry["key"][0],entry["key"][1]) if events is self.loan_events else (entry["key"][1],entry["key"][0])
+            return {"event":events["delete"],"user_id":user_id,"isbn":isbn}
+        return {"event":events[entry["op"]],**entry["row"]}
+
+    # the circulation event log
+    @property
+    def event_log(self):
+        if self.__dict__.get('_event_log') is None:
+            with self.storage_lock:
+                if self.__dict__.get('_event_log') is None:
+                    event_log=EventLog(self.return_complete_file_path("Circulation_events.jsonl"),self.event_log_max_bytes)
+                    # True if the log did not exist before this run, it then gets the loans and holds made before it
+                    self.__dict__['_event_log_is_new']=not event_log.files()
+                    self.__dict__['_event_log']=event_log
+        return self.__dict__['_event_log']
+
+    # logs the loans or holds existing when a new event log is started
+    def _log_existing_circulation(self,table):
+        """
+        Called when the loans or holds are loaded, before any of them changes, so replaying a new log gives
+        the current loans, including the ones migrated from the "Borrowed" column
+
+        Args:
+        table = "loans" or "holds"
+        """
+        event_log=self.event_log
+        if not self.__dict__['_event_log_is_new']:
+            return
+        if table=="loans":
+            due=self.__dict__['_due_index'].due
+            events=[{"event":"existing_loan","user_id":user_id,"isbn":isbn,"borrowed_at":borrowed_at,"due_at":due.get((user_id,isbn),"")}
+                    for user_id,books in self.__dict__['_loans_by_user'].items() for isbn,borrowed_at in books.items()]
+        else:
+            events=[{"event":"existing_hold","isbn":isbn,"user_id":user_id,"placed_at":placed_at}
+                    for isbn,queue in self.__dict__['_holds_by_isbn'].items() for user_id,placed_at in queue.items()]
+        event_log.append(events)
+
+    # the logged circulation events
+    def circulation_events(self,since=None,until=None):
+        """
+        Args:
+        since, until = ISO dates, only the events at or after since and before until
+
+        Return:
+        generator of events, oldest first, the log is read one line at a time
+        """
+        return self.event_log.read(since,until)
+
+    # computations over the logged events
+    def replay_circulation(self,since=None,until=None):
+        """
+        Example: replay_circulation().current_loans() rebuilds the loans from the log alone
+
+        Return:
+        EventReplay over the events between since and until
+        """
+        return EventReplay(self.circulation_events(since,until))
+
+    # borrows per day
+    def loans_per_day(self,since=None,until=None):
+        """
+        Return:
+        dataframe with the columns day and loans, oldest day first
+        """
+        counts=self.replay_circulation(since,until).loans_per_day()
+        return pd.DataFrame(sorted(counts.items()),columns=['day','loans'])
+
+    # borrows per book
+    def loans_per_title(self,since=None,until=None):
+        """
+        Return:
+        dataframe with the columns isbn, Title and loans, most borrowed first
+        """
+        counts=self.replay_circulation(since,until).loans_per_isbn()
+        loans=pd.DataFrame(counts.most_common(),columns=['isbn','loans'])
+        titles=self.books_df[['isbn','Title']]
+        # books deleted since have no title
+        return loans.merge(titles,on='isbn',how='left').fillna({'Title':''})[['isbn','Title','loans']]
+
+    # records a new loan
+    def add_loan(self,user_id,isbn,borrowed_at=None,due_at=None):
+        """
+        adds the loan to the indexes and persists it as a single row insert
+
+        Args:
+        user_id, isbn = string, already validated
+        borrowed_at = string, ISO date and time, defaults to now
+        due_at = string, ISO date and time, defaults to loan_period_days after borrowed_at
+        """
+        self._save_loans([self._index_loan(user_id,isbn,borrowed_at,due_at)])
+
+    # adds a loan to both indexes
+    def _index_loan(self,user_id,isbn,borrowed_at=None,due_at=None):
+        """
+        Return:
+        the journal entry of the loan, to be persisted by the caller
+        """
+        if borrowed_at is None:
+            borrowed_at=datetime.now().isoformat(timespec="seconds")
+        if due_at is None:
+            due_at=self.due_date_after(borrowed_at)
+        # the indexes are read by other threads writing the loans table
+        with self.storage_lock:
+            self.loans_by_user.setdefault(user_id,{})[isbn]=borrowed_at
+            self.loans_by_isbn.setdefault(isbn,set()).add(user_id)
+            self.due_index.set((user_id,isbn),due_at)
+        return {"op":"insert","key":[user_id,isbn],"row":{'user_id':user_id,'isbn':isbn,'borrowed_at':borrowed_at,'due_at':due_at}}
+
+    # the due date of a loan starting at a date
+    def due_date_after(self,start):
+        """
+        Args:
+        start = string, ISO date and time, empty for loans migrated without a date
+
+        Return:
+        ISO date and time loan_period_days after start, empty if start is empty
+        """
+        if not start:
+            return ""
+        return (datetime.fromisoformat(start)+timedelta(days=self.loan_period_days)).isoformat(timespec="seconds")
+
+    # removes a loan
+    def remove_loan(self,user_id,isbn):
+        """
+        removes the loan from both indexes and persists it as a single row delete
+
+        Args:
+        user_id, isbn = string, already validated
+        """
+        self._save_loans([self._unindex_loan(user_id,isbn)])
+
+    # removes a loan from both indexes
+    def _unindex_loan(self,user_id,isbn):
+        """
+        Return:
+        the journal entry of the removal, to be persisted by the caller
+        """
+        with self.storage_lock:
+            books=self.loans_by_user.get(user_id,{})
+            books.pop(isbn,None)
+            if not books:
+                self.loans_by_user.pop(user_id,None)
+            holders=self.loans_by_isbn.get(isbn,set())
+            holders.discard(user_id)
+            if not holders:
+                self.loans_by_isbn.pop(isbn,None)
+            self.due_index.remove((user_id,isbn))
+        return {"op":"delete","key":[user_id,isbn]}
+
+    # migrates the "Borrowed" column into loans
+    def loans_from_borrowed_column(self):
+        """
+        Builds the loans from the hyphen joined "Borrowed" column of the users, used the first time
+        the program runs without "Loans_csv.csv". The borrowing date of these loans is not known and left empty.
+
+        Return:
+        dataframe with the columns user_id, isbn, borrowed_at
+        """
+        logging.info("migrating the Borrowed column of users into loans")
+        rows=[]
+        # (user_id, isbn) already migrated, a set so a repeated isbn is found in constant time
+        seen=set()
+        for user_id,borrowed in self.users_df[['id','Borrowed']].itertuples(index=False,name=None):
+            for isbn in str(borrowed).split("-"):
+                isbn=isbn.strip()
+                if isbn!="" and (user_id,isbn) not in seen:
+                    seen.add((user_id,isbn))
+                    rows.append((user_id,isbn,"",""))
+        return pd.DataFrame(rows,columns=['user_id','isbn','borrowed_at','due_at'],dtype=object)
+
+    # fills the "Borrowed" column of users from the loans
+    def refresh_borrowed_column(self,users):
+        """
+        Input:
+        users, dataframe of users
+
+        Return:
+        a copy of users with "Borrowed" holding the hyphen joined isbns each user currently has
+        """
+        users=users.copy()
+        users['Borrowed']=[" " if not self.loans_by_user.get(user_id) else "-".join(self.loans_by_user[user_id]) for user_id in users['id']]
+        return users
         
     #the internal code that is run when we borrow a book.
     def borrow_book_internal(self,borrower_id,book_id):
@@ -53,6 +652,7 @@ class CheckManager():
         Rules:
         1. a person can add a maximim of 10 books. 
         2. You are only allowed one copy of a book
+        3. the book must exist and have a copy that is not borrowed
         Note: borrower_id and book_id inputed would have to be already validated
         
         Args: 
@@ -62,8 +662,8 @@ class CheckManager():
         Return:
         False if any of the above rules fail.
         
-        if rules are satisfied, adds bool_id to the users.csv file under
-        "Borrow" column if existing books borrowed is less than 10
+        if rules are satisfied, adds a loan of book_id to borrower_id
+        if existing books borrowed is less than 10
         """
         #enter the id of the person that wants to borrow a book, validate
         #check if he has crossed max borrowing cap of 10 books
@@ -71,28 +671,61 @@ class CheckManager():
         # check if ISBN
         # Let the valdiatoisn be taken care of by the library manager
 
+        with self.row_locks.hold(("user",borrower_id),("isbn",book_id)):
+            refusal=self.borrow_refusal(borrower_id,book_id)
+            if refusal=="unknown_user":
+                logging.error("user does not exist")
+                return False
+            if refusal=="unknown_book":
+                logging.error("book does not exist")
+                return False
+            if refusal=="already_borrowed":
+                logging.error("only one copy of a book per person")
+                return False
+            if refusal=="cap_reached":
+                print("You have reached max borrowig capacity of 10 books")
+                return False
+            if refusal=="not_available":
+                print("All the copies of this book are borrowed")
+                return False
+            logging.info("saving to loans file")
+            self.add_loan(borrower_id,book_id)
+            print(f"{borrower_id} has borrowed: {self.all_borrowed_book(borrower_id)}")
+            logging.info("saved")
+
+    # the rule that stops a user from borrowing a book
+    def borrow_refusal(self,borrower_id,book_id,user_exists=None,book_exists=None):
+        """
+        Rules of borrow_book_internal, without printing or saving anything
+
+        Args:
+        borrower_id=string
+        book_id=string
+        user_exists=bool, if the caller already knows whether borrower_id exists, looked up otherwise
+        book_exists=bool, same for book_id
+
+        Return:
+        None if the book can be borrowed, else the failed rule:
+        "unknown_user","unknown_book","already_borrowed","cap_reached" or "not_available"
+        """
+        if user_exists is None:
+            user_exists=self.row_exists('users',id=borrower_id)
+        if not user_exists:
+            return "unknown_user"
+        if book_exists is None:
+            book_exists=self.row_exists('books',isbn=book_id)
+        if not book_exists:
+            return "unknown_book"
         #check if max borrowing of 10 reached
-        already_borrowed_books=self.all_borrowed_book(borrower_id)
+        already_borrowed_books=self.loans_by_user.get(borrower_id,{})
         # check if the person has already borrowed the same book, only one per person
         if book_id in already_borrowed_books:
-            logging.error("only one copy of a book per person")
-            return False
-
-        if len(already_borrowed_books)<10:
-            
-            already_borrowed_books.append(book_id)
-            #conver from list to string to store in .csv file
-            output="-".join(already_borrowed_books)
-            self.users_df.loc[self.users_df['id']==borrower_id,'Borrowed']=output
-            print(self.users_df)
-
-            logging.info("saving to users.csv file")
-            # Saving to .csv file
-            self.save_user_df_to_csv()   
-            logging.info("saved")
-        else:
-            print("You have reached max borrowig capacity of 10 books")
-            return False
+            return "already_borrowed"
+        if len(already_borrowed_books)>=10:
+            return "cap_reached"
+        if self.available_count(book_id)<=0:
+            return "not_available"
+        return None
     
     # the internal code that is run when we return a book
     def return_book_internal(self,borrower_id,book_id):
@@ -108,23 +741,151 @@ class CheckManager():
         Return:
         False if any of the above rules fail.
         
-        if rules are satisfied, removes bool_id from users.csv
-        """
-        already_borrowed_books=self.all_borrowed_book(borrower_id)
-        # check if the person has borrowed this book
-        if not (book_id in already_borrowed_books):
-            logging.error("the person has not borrowed this book, recheck inputs")
-            return False
-        logging.info("borrowed book is present in the borrowed_list")
-        already_borrowed_books.remove(book_id)
-        output="-".join(already_borrowed_books)
-        self.users_df.loc[self.users_df['id']==borrower_id,'Borrowed']=output
-        print(self.users_df)
-
-        logging.info("saving to users.csv file")
-        # Saving to .csv file
-        self.save_user_df_to_csv()   
-        logging.info("saved")
+        if rules are satisfied, removes the loan of book_id from borrower_id,
+        and lends the book to the first user waiting for it, see dispatch_hold
+        """
+        with self.row_locks.hold(("isbn",book_id)):
+            with self.row_locks.hold(("user",borrower_id)):
+                # check if the person has borrowed this book
+                if not (book_id in self.loans_by_user.get(borrower_id,{})):
+                    logging.error("the person has not borrowed this book, recheck inputs")
+                    return False
+                logging.info("borrowed book is present in the borrowed_list")
+                logging.info("saving to loans file")
+                self.remove_loan(borrower_id,book_id)
+                print(f"{borrower_id} has borrowed: {self.all_borrowed_book(borrower_id)}")
+                logging.info("saved")
+            # the lock of the returned book is kept, so nobody takes the copy before the users waiting for it
+            self.dispatch_hold(book_id)
+
+    # renews a borrowed book
+    def renew_book_internal(self,borrower_id,book_id):
+        """
+        gives the borrower loan_period_days more, counted from today
+        Rules:
+        1. the bookid needs to be present in the already borrowed book list
+        2. nobody is waiting for the book
+
+        Args:
+        borrower_id=string
+        book_id=string
+
+        Return:
+        False if any of the above rules fail, the new due date otherwise
+        """
+        with self.row_locks.hold(("user",borrower_id),("isbn",book_id)):
+            borrowed_at=self.loans_by_user.get(borrower_id,{}).get(book_id)
+            if borrowed_at is None:
+                logging.error("the person has not borrowed this book, recheck inputs")
+                return False
+            if self.holds_by_isbn.get(book_id):
+                print("Other users are waiting for this book, it cannot be renewed")
+                return False
+            due_at=self.due_date_after(datetime.now().isoformat(timespec="seconds"))
+            with self.storage_lock:
+                self.due_index.set((borrower_id,book_id),due_at)
+            self._save_loans([{"op":"update","key":[borrower_id,book_id],
+                              "row":{'user_id':borrower_id,'isbn':book_id,'borrowed_at':borrowed_at,'due_at':due_at}}])
+            print(f"{book_id} is now due on {due_at}")
+            return due_at
+
+    # loans past their due date
+    def overdue_loans(self,as_of=None):
+        """
+        Args:
+        as_of = string, ISO date and time, defaults to now
+
+        Return:
+        dataframe of the loans due before as_of with the columns user_id, isbn, borrowed_at, due_at, earliest first
+        """
+        if as_of is None:
+            as_of=datetime.now().isoformat(timespec="seconds")
+        with self.storage_lock:
+            return self._due_loans_frame(self.due_index.due_before(as_of))
+
+    # dataframe of the loans found in the due index
+    def _due_loans_frame(self,found):
+        rows=[(user_id,isbn,self.loans_by_user[user_id][isbn],due_at) for due_at,user_id,isbn in found]
+        return pd.DataFrame(rows,columns=['user_id','isbn','borrowed_at','due_at'],dtype=object)
+
+    # loans due in the next days
+    def loans_due_within(self,days,as_of=None):
+        """
+        Args:
+        days = number of days from as_of
+        as_of = string, ISO date and time, defaults to now
+
+        Return:
+        dataframe of the loans not overdue yet and due in the next days, same columns as overdue_loans, earliest first
+        """
+        if as_of is None:
+            as_of=datetime.now().isoformat(timespec="seconds")
+        until=(datetime.fromisoformat(as_of)+timedelta(days=days)).isoformat(timespec="seconds")
+        # only the loans due between the two dates are read, the overdue ones are never looked at
+        with self.storage_lock:
+            return self._due_loans_frame(self.due_index.due_between(as_of,until))
+
+    # many borrows and returns at once
+    def circulate_batch(self,operations):
+        """
+        Applies a list of borrows and returns in order, example the returns of the drop box at the end of the day.
+        Every item is checked with the rules of borrow_book_internal and return_book_internal against the loans
+        as left by the items before it, nothing is printed and all the accepted items are saved with a single write.
+
+        Args:
+        operations, iterable of (action, borrower_id, book_id), action is "borrow" or "return", ids already validated
+
+        Return:
+        list with one dict per operation, with the keys "action","user_id","isbn" and "outcome":
+        "borrowed","returned", or the failed rule: "unknown_user","unknown_book","already_borrowed","cap_reached",
+        "not_available","not_borrowed","unknown_action"
+        returned books are lent to the users waiting for them as in return_book_internal, listed under "lent_to"
+        """
+        operations=list(operations)
+        outcomes=[]
+        entries=[]
+        hold_entries=[]
+        # user id / isbn -> exists, each user and book is looked up once per batch
+        known_users={}
+        known_books={}
+        # the books and users of the batch stay locked until its changes are written, otherwise a change
+        # another terminal makes to one of them in between is written first and replaced on replay by the older
+        # change of the batch. The isbn locks come first, like everywhere else
+        with self.row_locks.hold(*[("isbn",book_id) for action,borrower_id,book_id in operations]):
+            # the queues of the books cannot change while they are locked, so the users a returned book
+            # may be lent to are known and locked too
+            waiting=[user_id for action,borrower_id,book_id in operations if action=="return"
+                     for user_id in self.holds_by_isbn.get(book_id,())]
+            with self.row_locks.hold(*[("user",user_id) for user_id in [operation[1] for operation in operations]+waiting]):
+                for action,borrower_id,book_id in operations:
+                    if action=="borrow":
+                        if borrower_id not in known_users:
+                            known_users[borrower_id]=self.row_exists('users',id=borrower_id)
+                        if book_id not in known_books:
+                            known_books[book_id]=self.row_exists('books',isbn=book_id)
+                        outcome=self.borrow_refusal(borrower_id,book_id,known_users[borrower_id],known_books[book_id])
+                        if outcome is None:
+                            entries.append(self._index_loan(borrower_id,book_id))
+                            outcome="borrowed"
+                    elif action=="return":
+                        outcome="not_borrowed"
+                        if book_id in self.loans_by_user.get(borrower_id,{}):
+                            entries.append(self._unindex_loan(borrower_id,book_id))
+                            outcome="returned"
+                            loan_entries,queue_entries,lent_to=self._dispatch_hold(book_id)
+                            entries.extend(loan_entries)
+                            hold_entries.extend(queue_entries)
+                    else:
+                        outcome="unknown_action"
+                    outcomes.append({"action":action,"user_id":borrower_id,"isbn":book_id,"outcome":outcome})
+                    if outcome=="returned":
+                        outcomes[-1]["lent_to"]=lent_to
+                if entries:
+                    logging.info("saving %d loan changes to loans file",len(entries))
+                    self._save_loans(entries)
+                if hold_entries:
+                    self._save_holds(hold_entries)
+        return outcomes
 
     # handles everything related to borrowing of a book
     def borrow_a_book(self):
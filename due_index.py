@@ -0,0 +1,77 @@
+import logging
+from bisect import bisect_left,insort
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class DueIndex:
+    """
+    Sorted array of the loans ordered by due date, used to find overdue loans and loans due soon without looking at every loan.
+
+    Due dates are ISO strings ("2026-10-18T09:30:00"), they sort the same way as the dates they stand for.
+    The loans due in a range of dates are next to each other in the array, so finding the k loans of a range
+    is two binary searches followed by reading the k loans, O(log n + k), whatever the number of loans outside the range.
+    Adding, renewing or returning a loan is a binary search and a single insert into / delete from the array.
+
+    Functionalities:
+    1. build := indexes every loan of a dict (user_id, isbn) -> due date
+    2. set := adds a loan or changes its due date
+    3. remove := forgets a returned loan
+    4. due_before := the loans due before a date, earliest first
+    5. due_between := the loans due from a date and before another, earliest first
+    """
+    def __init__(self):
+        # (user_id, isbn) -> due date, the current due date of every loan having one
+        self.due={}
+        # (due date, user_id, isbn) of every loan in "due", sorted
+        self.entries=[]
+
+    def build(self,due):
+        """
+        Params:
+        due, dict (user_id, isbn) -> due date, loans with an empty due date are left out
+        """
+        self.due={loan:due_at for loan,due_at in due.items() if due_at}
+        self.entries=sorted((due_at,)+loan for loan,due_at in self.due.items())
+
+    def set(self,loan,due_at):
+        """
+        Params:
+        loan, tuple (user_id, isbn)
+        due_at, the new due date, empty to keep the loan without a due date
+        """
+        if not due_at:
+            self.remove(loan)
+            return
+        if self.due.get(loan)==due_at:
+            return
+        self.remove(loan)
+        self.due[loan]=due_at
+        insort(self.entries,(due_at,)+loan)
+
+    def remove(self,loan):
+        due_at=self.due.pop(loan,None)
+        if due_at is not None:
+            del self.entries[bisect_left(self.entries,(due_at,)+loan)]
+
+    def due_before(self,date):
+        """
+        Params:
+        date, ISO date and time
+
+        Return:
+        list of (due date, user_id, isbn), earliest first
+        """
+        # (date,) sorts before every entry due at that date
+        return self.entries[:bisect_left(self.entries,(date,))]
+
+    def due_between(self,start,end):
+        """
+        Params:
+        start, ISO date and time, loans due at it are included
+        end, ISO date and time, loans due at it are left out
+
+        Return:
+        list of (due date, user_id, isbn), earliest first
+        """
+        return self.entries[bisect_left(self.entries,(start,)):bisect_left(self.entries,(end,))]
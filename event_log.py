@@ -0,0 +1,154 @@
+import json
+import os
+import glob
+import threading
+import logging
+from collections import Counter
+from datetime import datetime
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class EventLog:
+    """
+    Append-only log of every circulation event (borrow, return, renew, hold, hold_removed), kept for history and analytics.
+
+    Every event is a line of json, example:
+    {"at": "2026-10-18T09:30:00.123456", "event": "borrow", "user_id": "id293310818420656", "isbn": "isbn6865062031291"}
+    Events are written in the order they happen. When the file reaches max_bytes it is renamed with a sequence number
+    (example: Circulation_events.000001.jsonl) and a new file is started, so no file grows without limit and
+    old files can be archived or deleted.
+
+    Functionalities:
+    1. append := appends events with a single write, rotating the file when it is full
+    2. files := the rotated files oldest first, then the current file
+    3. read := the events one at a time, oldest first, without loading a whole file
+    """
+    def __init__(self,file_path,max_bytes=8*1024*1024):
+        """
+        Params:
+        file_path, path of the current file, example Circulation_events.jsonl
+        max_bytes, size at which the file is rotated
+        """
+        self.file_path=file_path
+        self.max_bytes=max_bytes
+        self.lock=threading.Lock()
+
+    def _rotated_path(self,number):
+        base,extension=os.path.splitext(self.file_path)
+        return f"{base}.{number:06d}{extension}"
+
+    def files(self):
+        """
+        Return:
+        list of paths, oldest first
+        """
+        base,extension=os.path.splitext(self.file_path)
+        rotated=sorted(glob.glob(glob.escape(base)+".[0-9][0-9][0-9][0-9][0-9][0-9]"+extension))
+        if os.path.exists(self.file_path):
+            rotated.append(self.file_path)
+        return rotated
+
+    def append(self,events):
+        """
+        Params:
+        events, list of dict with the keys "event","user_id","isbn" and any detail of the event,
+        "at" is set to the time of writing if it is missing
+        """
+        if not events:
+            return
+        with self.lock:
+            at=datetime.now().isoformat()
+            lines="".join(json.dumps({"at":at,**event})+"\n" for event in events).encode("utf-8")
+            if os.path.exists(self.file_path) and os.path.getsize(self.file_path)+len(lines)>self.max_bytes:
+                self._rotate()
+            with open(self.file_path,"ab") as log_file:
+                log_file.write(lines)
+
+    def _rotate(self):
+        rotated=self.files()[:-1]
+        number=int(os.path.splitext(rotated[-1])[0].rsplit(".",1)[1])+1 if rotated else 1
+        os.replace(self.file_path,self._rotated_path(number))
+        logging.info(f"event log rotated into {self._rotated_path(number)}")
+
+    def read(self,since=None,until=None):
+        """
+        Generator of the events, oldest first, reading one line at a time
+
+        Params:
+        since, ISO date and time, events before it are skipped
+        until, ISO date and time, reading stops at the first event at or after it
+
+        Yield:
+        dict, one event
+        """
+        for path in self.files():
+            try:
+                log_file=open(path,"r",encoding="utf-8")
+            except FileNotFoundError:
+                # rotated away while reading, its events are in the next file
+                continue
+            with log_file:
+                for line in log_file:
+                    try:
+                        event=json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partially written last line from a crash
+                        logging.error("skipping corrupt event log line")
+                        continue
+                    if until is not None and event["at"]>=until:
+                        return
+                    if since is None or event["at"]>=since:
+                        yield event
+
+
+class EventReplay:
+    """
+    Computations over a stream of circulation events. Each of them reads every event once and keeps only
+    its result in memory, so a log much larger than the memory can be replayed.
+
+    Functionalities:
+    1. current_loans := the loans left by the events, user_id -> {isbn: borrowed_at}, starting from the
+       "existing_loan" events written when the log was created
+    2. count := number of events of a kind per key, example borrows per day or per isbn
+    3. loans_per_day, loans_per_isbn := the borrows counted per day and per isbn
+    """
+    def __init__(self,events):
+        """
+        Params:
+        events, iterable of events, example EventLog.read(), it is consumed by the first computation
+        """
+        self.events=events
+
+    def current_loans(self):
+        loans={}
+        for event in self.events:
+            if event["event"] in ("borrow","existing_loan"):
+                loans.setdefault(event["user_id"],{})[event["isbn"]]=event.get("borrowed_at",event["at"])
+            elif event["event"]=="return":
+                books=loans.get(event["user_id"],{})
+                books.pop(event["isbn"],None)
+                if not books:
+                    loans.pop(event["user_id"],None)
+        return loans
+
+    def count(self,event_kind,key):
+        """
+        Params:
+        event_kind, example "borrow"
+        key, function event -> key counted
+
+        Return:
+        Counter, key -> number of events
+        """
+        counts=Counter()
+        for event in self.events:
+            if event["event"]==event_kind:
+                counts[key(event)]+=1
+        return counts
+
+    def loans_per_day(self):
+        return self.count("borrow",lambda event: event["at"][:10])
+
+    def loans_per_isbn(self):
+        return self.count("borrow",lambda event: event["isbn"])
@@ -0,0 +1,489 @@
+import logging
+from bisect import bisect_left,insort
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class KeyIndex:
+    """
+    In-memory hash index from the key of a table to the label of its row in the dataframe.
+
+    Point lookups by key (example: does isbn X exist, which row is user id Y) are a dict lookup
+    instead of comparing the key against every row of the dataframe.
+    StorageManager keeps the index in sync in insert_row, update_row and delete_row, and drops it
+    whenever the whole dataframe is replaced, it is then rebuilt on the next lookup.
+
+    Every in-memory index of a table has the same functionalities, so they are kept in sync the same way:
+    1. build := indexes every row of a dataframe
+    2. extend := indexes the rows of a dataframe on top of the ones already indexed, example the chunks of a .csv file
+    3. add := indexes a single row
+    4. remove := removes a single row from the index
+    5. get := the label of the row with the given key, None if there is none, the other indexes have search instead
+    """
+    def __init__(self,key_columns):
+        """
+        Params:
+        key_columns, list of the key columns of the table
+        """
+        self.key_columns=key_columns
+        self.labels={}
+
+    def _key(self,row):
+        return tuple(str(row[column]) for column in self.key_columns)
+
+    def build(self,frame):
+        """
+        Params:
+        frame, the dataframe of the table
+        """
+        self.labels={}
+        self.extend(frame)
+
+    def extend(self,frame):
+        """
+        Params:
+        frame, rows added to the table, example a chunk of a .csv file being read
+        """
+        keys=zip(*[frame[column].astype(str).tolist() for column in self.key_columns])
+        size=len(self.labels)
+        self.labels.update(zip(keys,frame.index))
+        if len(self.labels)!=size+len(frame):
+            logging.error("key index: the table has rows with the same key, the last one is indexed")
+
+    def add(self,label,row):
+        """
+        Params:
+        label, label of the row in the dataframe
+        row, dict or series of column -> value
+        """
+        self.labels[self._key(row)]=label
+
+    def remove(self,label,row):
+        if self.labels.get(self._key(row))==label:
+            del self.labels[self._key(row)]
+
+    def get(self,key):
+        """
+        Params:
+        key, tuple of key values
+
+        Return:
+        label of the row, None if no row has the key
+        """
+        return self.labels.get(tuple(str(value) for value in key))
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class TokenIndex:
+    """
+    Inverted index from the words of a column to the labels of the rows having them.
+
+    Words are normalized like format_string: lowercase, split on whitespace. A query of one or more words
+    is answered by intersecting the rows of each word, starting from the rarest, so the cost depends
+    on the number of matching rows and not on the size of the table.
+    """
+    def __init__(self,column):
+        """
+        Params:
+        column, the column to index, example "Title"
+        """
+        self.column=column
+        # word -> set of row labels
+        self.postings={}
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Return:
+        set of the normalized words of the text
+        """
+        return set(str(text).lower().split())
+
+    def build(self,frame):
+        self.postings={}
+        self.extend(frame)
+
+    def extend(self,frame):
+        for label,text in zip(frame.index,frame[self.column].tolist()):
+            for token in self.tokenize(text):
+                self.postings.setdefault(token,set()).add(label)
+
+    def add(self,label,row):
+        for token in self.tokenize(row[self.column]):
+            self.postings.setdefault(token,set()).add(label)
+
+    def remove(self,label,row):
+        for token in self.tokenize(row[self.column]):
+            labels=self.postings.get(token)
+            if labels is None:
+                continue
+            labels.discard(label)
+            if not labels:
+                del self.postings[token]
+
+    def search(self,query):
+        """
+        Params:
+        query, one or more words
+
+        Return:
+        set of labels of the rows having every word of the query
+        """
+        tokens=self.tokenize(query)
+        if not tokens:
+            return set()
+        postings=sorted((self.postings.get(token,set()) for token in tokens),key=len)
+        labels=set(postings[0])
+        for other in postings[1:]:
+            labels&=other
+            if not labels:
+                break
+        return labels
+
+
+
+class NgramIndex:
+    """
+    Index from every n digits in a row of an isbn/id column to the labels of the rows, example "isbn6865062031291"
+    is indexed under "686", "865", "650" ... of its digits, the "isbn"/"id" prefix is not indexed.
+
+    A partial number is answered by intersecting the rows of each of its n-grams and then checking that the
+    candidates really contain it, only the candidate rows are touched. Queries shorter than n digits match
+    most of the table anyway and are answered by checking every row.
+    """
+    def __init__(self,column,prefix,n=3):
+        """
+        Params:
+        column, the column to index, example "isbn"
+        prefix, text before the digits, example "isbn"
+        n, number of digits per n-gram
+        """
+        self.column=column
+        self.prefix=prefix
+        self.n=int(n)
+        # n-gram -> set of row labels
+        self.postings={}
+        # row label -> digits of the row, used to verify candidates
+        self.bodies={}
+
+    def _body(self,value):
+        value=str(value)
+        if value.startswith(self.prefix):
+            return value[len(self.prefix):]
+        return value
+
+    def _grams(self,body):
+        return {body[position:position+self.n] for position in range(len(body)-self.n+1)}
+
+    def build(self,frame):
+        self.postings={}
+        self.bodies={}
+        self.extend(frame)
+
+    def extend(self,frame):
+        postings=self.postings
+        n=self.n
+        for label,value in zip(frame.index,frame[self.column].tolist()):
+            body=self._body(value)
+            self.bodies[label]=body
+            for position in range(len(body)-n+1):
+                gram=body[position:position+n]
+                if gram in postings:
+                    postings[gram].add(label)
+                else:
+                    postings[gram]={label}
+
+    def add(self,label,row):
+        body=self._body(row[self.column])
+        self.bodies[label]=body
+        for gram in self._grams(body):
+            self.postings.setdefault(gram,set()).add(label)
+
+    def remove(self,label,row):
+        body=self.bodies.pop(label,None)
+        if body is None:
+            return
+        for gram in self._grams(body):
+            labels=self.postings.get(gram)
+            if labels is None:
+                continue
+            labels.discard(label)
+            if not labels:
+                del self.postings[gram]
+
+    def search(self,digits):
+        """
+        Params:
+        digits, the whole or partial number, without the prefix
+
+        Return:
+        set of labels of the rows whose number contains the digits
+        """
+        digits=str(digits).strip()
+        if len(digits)<self.n:
+            return {label for label,body in self.bodies.items() if digits in body}
+        postings=sorted((self.postings.get(gram,set()) for gram in self._grams(digits)),key=len)
+        candidates=set(postings[0])
+        for other in postings[1:]:
+            candidates&=other
+            if not candidates:
+                return candidates
+        # the n-grams can be in the row in another order, every candidate is checked
+        return {label for label in candidates if digits in self.bodies[label]}
+
+
+
+# lowercase with single spaces, like format_string, the form in which names are compared by the indexes
+def normalize(value):
+    return " ".join(str(value).lower().split())
+
+
+# number of single character insertions, deletions and substitutions turning one string into the other
+def edit_distance(first,second):
+    """
+    Levenshtein distance using the bit-parallel algorithm of Myers/Hyyro: a column of the distance table
+    is kept as the bits of two python ints, so every character of the second string costs a few
+    int operations instead of a loop over the first string
+
+    Return:
+    int
+    """
+    if not first:
+        return len(second)
+    if not second:
+        return len(first)
+    # bits of the positions of every character in first
+    positions={}
+    for position,char in enumerate(first):
+        positions[char]=positions.get(char,0)|(1<<position)
+    mask=(1<<len(first))-1
+    last=1<<(len(first)-1)
+    # vertical +1/-1 differences of the current column
+    plus=mask
+    minus=0
+    distance=len(first)
+    for char in second:
+        equal=positions.get(char,0)
+        vertical=equal|minus
+        horizontal=(((equal&plus)+plus)^plus)|equal
+        horizontal_plus=minus|~(horizontal|plus)
+        horizontal_minus=plus&horizontal
+        if horizontal_plus&last:
+            distance+=1
+        elif horizontal_minus&last:
+            distance-=1
+        horizontal_plus=(horizontal_plus<<1)|1
+        horizontal_minus=horizontal_minus<<1
+        plus=(horizontal_minus|~(vertical|horizontal_plus))&mask
+        minus=(horizontal_plus&vertical)&mask
+    return distance
+
+
+class FuzzyIndex:
+    """
+    Typo tolerant index over the distinct names of a column, example "agata christi" finds "agatha christie".
+
+    The distinct names are kept in a BK-tree: every child hangs under its parent by their edit distance, and by the
+    triangle inequality a search within distance k only has to visit the children at distance d-k..d+k of each node,
+    so most names are never compared with the query. A name whose rows are all removed stays in the tree but
+    is no longer returned, and is reused if it is added again.
+    """
+    def __init__(self,column):
+        """
+        Params:
+        column, the column to index, example "Author"
+        """
+        self.column=column
+        # name -> set of row labels
+        self.labels={}
+        # BK-tree node: [name, {distance: child node}]
+        self.root=None
+
+    def _insert_name(self,name):
+        if self.root is None:
+            self.root=[name,{}]
+            return
+        node=self.root
+        while True:
+            distance=edit_distance(name,node[0])
+            if distance==0:
+                return
+            if distance not in node[1]:
+                node[1][distance]=[name,{}]
+                return
+            node=node[1][distance]
+
+    def build(self,frame):
+        self.labels={}
+        self.root=None
+        self.extend(frame)
+
+    def extend(self,frame):
+        for label,name in zip(frame.index,frame[self.column].tolist()):
+            self.add(label,{self.column:name})
+
+    def add(self,label,row):
+        name=normalize(row[self.column])
+        if name=="":
+            return
+        if name not in self.labels:
+            self._insert_name(name)
+            self.labels[name]=set()
+        self.labels[name].add(label)
+
+    def remove(self,label,row):
+        self.labels.get(normalize(row[self.column]),set()).discard(label)
+
+    def search(self,query,max_distance=2):
+        """
+        Params:
+        query, the name, possibly misspelled
+        max_distance, largest edit distance of a returned name
+
+        Return:
+        list of (distance, name, set of labels), closest names first
+        """
+        query=normalize(query)
+        found=[]
+        nodes=[self.root] if self.root is not None else []
+        while nodes:
+            name,children=nodes.pop()
+            distance=edit_distance(query,name)
+            if distance<=max_distance and self.labels.get(name):
+                found.append((distance,name,self.labels[name]))
+            for child_distance,child in children.items():
+                if distance-max_distance<=child_distance<=distance+max_distance:
+                    nodes.append(child)
+        return sorted(found,key=lambda match: (match[0],match[1]))
+
+
+
+class PrefixIndex:
+    """
+    Sorted array of the distinct values of a column, used for autocompletion, example "alice in" -> "alice in wonderland".
+
+    All the values starting with a prefix are next to each other in the sorted array, so completing a prefix
+    is one binary search followed by reading the next k values. Adding or removing a value is a binary search
+    and a single insert into / delete from the array.
+    """
+    def __init__(self,column):
+        """
+        Params:
+        column, the column to index, example "Title"
+        """
+        self.column=column
+        # distinct values, sorted
+        self.values=[]
+        # value -> set of row labels
+        self.labels={}
+
+    def build(self,frame):
+        self.labels={}
+        self.values=[]
+        self.extend(frame)
+
+    def extend(self,frame):
+        new_values=[]
+        for label,value in zip(frame.index,frame[self.column].tolist()):
+            value=normalize(value)
+            if value!="":
+                if value not in self.labels:
+                    self.labels[value]=set()
+                    new_values.append(value)
+                self.labels[value].add(label)
+        # two sorted runs, merged by sorted in a single pass
+        self.values=sorted(self.values+sorted(new_values))
+
+    def add(self,label,row):
+        value=normalize(row[self.column])
+        if value=="":
+            return
+        if value not in self.labels:
+            insort(self.values,value)
+            self.labels[value]=set()
+        self.labels[value].add(label)
+
+    def remove(self,label,row):
+        value=normalize(row[self.column])
+        labels=self.labels.get(value)
+        if labels is None:
+            return
+        labels.discard(label)
+        if not labels:
+            del self.labels[value]
+            del self.values[bisect_left(self.values,value)]
+
+    def complete(self,prefix,k=10):
+        """
+        Params:
+        prefix, the first characters typed
+        k, max number of completions
+
+        Return:
+        list of at most k values starting with the prefix, in alphabetical order
+        """
+        prefix=normalize(prefix)
+        completions=[]
+        position=bisect_left(self.values,prefix)
+        while position<len(self.values) and len(completions)<k and self.values[position].startswith(prefix):
+            completions.append(self.values[position])
+            position+=1
+        return completions
+
+
+class CompositeIndex:
+    """
+    Hash index from the normalized values of several columns to the labels of the rows having them,
+    example (Title, Author) -> books, used to find duplicates without comparing against every row.
+    Values are normalized like format_string (lowercase, single spaces), so "Dune" by "Frank  Herbert"
+    and "dune" by "frank herbert" are under the same entry.
+    """
+    def __init__(self,columns):
+        """
+        Params:
+        columns, list of the indexed columns, example ["Title","Author"]
+        """
+        self.columns=list(columns)
+        # tuple of normalized values -> set of row labels
+        self.labels={}
+
+    def _values(self,row):
+        return tuple(normalize(row[column]) for column in self.columns)
+
+    def build(self,frame):
+        self.labels={}
+        self.extend(frame)
+
+    def extend(self,frame):
+        values=zip(*[[normalize(value) for value in frame[column].tolist()] for column in self.columns])
+        for label,value in zip(frame.index,values):
+            self.labels.setdefault(value,set()).add(label)
+
+    def add(self,label,row):
+        self.labels.setdefault(self._values(row),set()).add(label)
+
+    def remove(self,label,row):
+        labels=self.labels.get(self._values(row))
+        if labels is None:
+            return
+        labels.discard(label)
+        if not labels:
+            del self.labels[self._values(row)]
+
+    def get(self,values):
+        """
+        Params:
+        values, list of values in the order of columns
+
+        Return:
+        set of labels of the rows having the values, after normalization
+        """
+        return self.labels.get(tuple(normalize(value) for value in values),set())
+
+
+
+# index type names used in StorageManager.table_specs "memory_indexes"
+index_types={'KeyIndex':KeyIndex,'TokenIndex':TokenIndex,'NgramIndex':NgramIndex,'FuzzyIndex':FuzzyIndex,
+             'PrefixIndex':PrefixIndex,'CompositeIndex':CompositeIndex}
@@ -0,0 +1,97 @@
+import json
+import os
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class ChangeJournal:
+    """
+    Append-only journal of row level changes made to one of the .csv tables.
+
+    Instead of re-writing the whole .csv file after every add, update, borrow or return, the change is
+    appended as a single line to a journal file kept next to the .csv file (example: Books_csv.csv.journal).
+    On startup the journal is replayed on top of the .csv file, and compaction folds it back into the .csv file.
+
+    Every line is a json object:
+    {"op": "insert"|"update"|"delete", "key": [key values], "row": {column: value}}
+
+    Functionalities:
+    1. append := appends one or more changes to the journal with a single write
+    2. read := returns all the changes recorded in the journal, in order
+    3. fold := folds the changes into a dict of final row state per key
+    4. truncate := empties the journal, used after compaction
+    """
+    def __init__(self,file_path):
+        """
+        Params:
+        file_path, path of the journal file, type=string
+        """
+        self.file_path=file_path
+        # number of changes currently in the journal, used to decide when to compact
+        self.entry_count=0
+
+    def append(self,entries):
+        """
+        Appends the changes to the journal file using a single write
+
+        Params:
+        entries, list of dict with the keys "op","key" and "row"
+        """
+        if not entries:
+            return
+        lines="".join(json.dumps(entry)+"\n" for entry in entries)
+        with open(self.file_path,"a",encoding="utf-8") as journal_file:
+            journal_file.write(lines)
+            journal_file.flush()
+        self.entry_count+=len(entries)
+
+    def read(self):
+        """
+        Reads all the changes from the journal file
+
+        Return:
+        list of dict, empty list if there is no journal
+        """
+        entries=[]
+        if not os.path.exists(self.file_path):
+            return entries
+        with open(self.file_path,"r",encoding="utf-8") as journal_file:
+            for line in journal_file:
+                line=line.strip()
+                if line=="":
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a partially written last line from a crash, everything before it is still valid
+                    logging.error("skipping corrupt journal line")
+        self.entry_count=len(entries)
+        return entries
+
+    def fold(self,entries=None):
+        """
+        Folds the changes into the final state of every changed key, so replaying costs one pass
+        over the table no matter how many times a row was changed.
+
+        Return:
+        dict, key(tuple) -> row(dict) for inserted/updated rows or None for deleted rows
+        """
+        if entries is None:
+            entries=self.read()
+        state={}
+        for entry in entries:
+            key=tuple(entry["key"])
+            if entry["op"]=="delete":
+                state[key]=None
+            else:
+                state[key]=entry["row"]
+        return state
+
+    def truncate(self):
+        """
+        Empties the journal, called once its changes are folded into the .csv file
+        """
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+        self.entry_count=0
@@ -0,0 +1,62 @@
+import random
+import threading
+import logging
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class KeyAllocator:
+    """
+    Hands out new unique keys of a table, example "isbn" followed by 13 random digits.
+
+    A random key is checked against the keys already in the table (a dict lookup in the key index) and against
+    the keys handed out but not added to the table yet, so two writers asking at the same time never get the
+    same key. With 10^13 possible isbns a collision is rare, so a key costs one random number and two set
+    lookups on average, also when thousands are asked for at once by a bulk import.
+
+    Functionalities:
+    1. allocate := one or more new unique keys
+    2. release := forgets keys that were added to the table, or that are not going to be used
+    """
+    def __init__(self,prefix,digit_count,is_used):
+        """
+        Params:
+        prefix, text before the digits, example "isbn"
+        digit_count, number of random digits, example 13
+        is_used, function telling if a key is already in the table
+        """
+        self.prefix=prefix
+        self.digit_count=digit_count
+        self.is_used=is_used
+        # keys handed out and not added to the table yet
+        self.reserved=set()
+        self.lock=threading.Lock()
+        self.collisions=0
+
+    def allocate(self,count=1):
+        """
+        Params:
+        count, number of keys needed
+
+        Return:
+        list of count keys, not used in the table and not handed out before
+        """
+        limit=10**self.digit_count
+        keys=[]
+        with self.lock:
+            while len(keys)<count:
+                key=f"{self.prefix}{random.randrange(limit):0{self.digit_count}d}"
+                if key in self.reserved or self.is_used(key):
+                    self.collisions+=1
+                    continue
+                self.reserved.add(key)
+                keys.append(key)
+        return keys
+
+    def release(self,keys):
+        """
+        Params:
+        keys, iterable of keys, keys that were never handed out are ignored
+        """
+        with self.lock:
+            self.reserved.difference_update(keys)
@@ -17,19 +17,24 @@ class LibraryManager(BooksManager, UsersManager, CheckManager, StorageManager):
     # class variable to keep track if an instance has already been created
     _instance = None
     
-    def __init__(self):
+    def __init__(self,data_dir=None,backend="csv"):
         """
         we combine the __init__ part from all the classes from which we inherit, giving access to all of its attributes
         The design is kept singleton so that only a single instance can be created. if attempt is made to create a second
         instance, an Exception would be raised.
+
+        Params:
+        data_dir, directory holding the .csv files, defaults to the directory of the program
+        backend, "csv" to keep the data in the .csv files, "sqlite" to keep it in an embedded SQLite database
         """
         if LibraryManager._instance is None:
             # Initialization logic
-            StorageManager.__init__(self)
+            StorageManager.__init__(self,data_dir,backend)
             # Initialize other managers if needed
             BooksManager.__init__(self)
             UsersManager.__init__(self)
-            CheckManager.__init__(self, self.users_df)
+            # users_df is not passed, so the users .csv is only read when a user or circulation operation needs it
+            CheckManager.__init__(self)
             #initialising the class vairable to prevent the creation of a second instance in singleton
             LibraryManager._instance = self
             logging.info("LibraryManager initialized.")
@@ -1,4 +1,6 @@
 from library_manager import LibraryManager
+import os
+import sys
 
 # validate_choice_and_available_choices
 import logging
@@ -30,8 +32,19 @@ class Run:
     def __init__(self):
         #initialise the Library manager which run on singleton design pattern
 
-        self.library_obj=LibraryManager()
+        # set LMS_STARTUP_REPORT=1 to also print the progress of reading large .csv files
+        LibraryManager.show_ingest_progress=os.environ.get("LMS_STARTUP_REPORT")=="1"
+        # set LMS_VALIDATE_ON_LOAD=1 to check the loaded tables against the validation rules
+        LibraryManager.validate_on_load=os.environ.get("LMS_VALIDATE_ON_LOAD")=="1"
+        # the storage backend can be chosen with the LMS_STORAGE_BACKEND environment variable, csv or sqlite
+        self.library_obj=LibraryManager(backend=os.environ.get("LMS_STORAGE_BACKEND","csv"))
         logging.info("Created an a single instance of LibraryManager")
+        # set LMS_WRITE_BEHIND_MS to a number of milliseconds to persist changes in the background at that interval
+        if os.environ.get("LMS_WRITE_BEHIND_MS"):
+            self.library_obj.enable_write_behind(interval_ms=int(os.environ["LMS_WRITE_BEHIND_MS"]))
+        # set LMS_STARTUP_REPORT=1 to see how long loading the files took
+        if os.environ.get("LMS_STARTUP_REPORT")=="1":
+            print(self.library_obj.startup_report())
         # self.library_obj.main_menu()
         self.menu_dict={'1':'List Books','2':'List users','3':'Add a Books','4':'Add a User',
                     '5':"update a book's detail",'6':"update a user's detail",
@@ -153,11 +166,23 @@ class Run:
             print("="*50)
             print("Exiting program Gracefully via Keyboard Interrupt")
             print("="*50)
+            # Exit also writes the changes still waiting in write-behind mode
             self.library_obj.Exit()
         
 
 
 
 if __name__ == "__main__":
+    # bulk import: python main.py import-books books.csv  or  python main.py import-users users.csv
+    if len(sys.argv)==3 and sys.argv[1] in ["import-books","import-users"]:
+        library_obj=LibraryManager(backend=os.environ.get("LMS_STORAGE_BACKEND","csv"))
+        if sys.argv[1]=="import-books":
+            summary=library_obj.bulk_import_books(sys.argv[2])
+        else:
+            summary=library_obj.bulk_import_users(sys.argv[2])
+        print(f"imported {summary['imported']} rows, rejected {summary['rejected']} rows")
+        if summary['error_report']:
+            print(f"rejected rows and reasons written to {summary['error_report']}")
+        library_obj.Exit()
     run_obj=Run()
     run_obj.run()
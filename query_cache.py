@@ -0,0 +1,86 @@
+import threading
+import logging
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class QueryCache:
+    """
+    Least recently used cache of search results.
+
+    Every result is stored with the version of the table it was computed from. StorageManager bumps the
+    version of a table whenever the table changes, so a result computed before the change is never returned,
+    it is dropped the next time it is looked up. When the cache is full the least recently used result is dropped.
+    The cache can be shared by several threads, every method holds its lock.
+
+    Functionalities:
+    1. get := the cached result of a query, None if it is not cached or the table changed since
+    2. put := caches the result of a query
+    3. clear := drops every cached result
+    4. stats := hits, misses and size, used to tune max_entries
+    """
+    def __init__(self,max_entries=256):
+        """
+        Params:
+        max_entries, max number of cached results, 0 turns the cache off
+        """
+        self.max_entries=max_entries
+        # (table, operation, query) -> (table version, result)
+        self.entries=OrderedDict()
+        self.hits=0
+        self.misses=0
+        self.lock=threading.Lock()
+
+    def get(self,table,key,version):
+        """
+        Params:
+        table, table the query reads
+        key, tuple of the operation and the normalized query
+        version, current version of the table
+
+        Return:
+        the cached result, None if there is none
+        """
+        with self.lock:
+            entry=self.entries.get((table,)+key)
+            if entry is None or entry[0]!=version:
+                if entry is not None:
+                    del self.entries[(table,)+key]
+                self.misses+=1
+                return None
+            self.entries.move_to_end((table,)+key)
+            self.hits+=1
+            return entry[1]
+
+    def put(self,table,key,version,result):
+        """
+        Return:
+        result, so a computed result can be cached and returned in one line
+        """
+        if self.max_entries<=0:
+            return result
+        with self.lock:
+            entry=self.entries.get((table,)+key)
+            if entry is not None and entry[0]>version:
+                # computed before a change, a result of the changed table is already cached
+                return result
+            self.entries[(table,)+key]=(version,result)
+            self.entries.move_to_end((table,)+key)
+            while len(self.entries)>self.max_entries:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Return:
+        dict with "hits","misses","hit_rate","size" and "max_entries"
+        """
+        with self.lock:
+            lookups=self.hits+self.misses
+            return {"hits":self.hits,"misses":self.misses,"hit_rate":self.hits/lookups if lookups else 0.0,
+                    "size":len(self.entries),"max_entries":self.max_entries}
@@ -0,0 +1,36 @@
+class QueryResult:
+    """
+    One page of the rows found by find_books or find_users.
+
+    Attributes:
+    1. rows := pandas dataframe of the rows of this page
+    2. total := number of rows matching the query, on all pages
+    3. offset := number of matching rows skipped before this page
+    4. limit := max number of rows per page, None if all the rows are on this page
+    5. has_more := True if there are matching rows after this page
+    """
+    def __init__(self,rows,total,offset=0,limit=None):
+        self.rows=rows
+        self.total=total
+        self.offset=offset
+        self.limit=limit
+
+    @property
+    def has_more(self):
+        return self.offset+len(self.rows)<self.total
+
+    def to_records(self):
+        """
+        Return:
+        list of dict, one per row of the page
+        """
+        return self.rows.to_dict('records')
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.to_records())
+
+    def __repr__(self):
+        return f"QueryResult(rows={len(self.rows)}, total={self.total}, offset={self.offset}, limit={self.limit})"
@@ -0,0 +1,46 @@
+import threading
+import logging
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class RowLocks:
+    """
+    One lock per user id and per isbn, so desk terminals working on different users and books run at the same time,
+    while two checkouts of the same book or by the same user wait for each other. A ("book", (title, Author)) lock
+    keeps two terminals from adding the same book.
+
+    The locks of an operation are always taken in sorted order, so two operations needing the same locks
+    cannot wait for each other forever. The locks are re-entrant, an operation holding a lock can call
+    another operation taking the same lock.
+
+    Functionalities:
+    1. hold := context manager holding the locks of the given keys, example hold(("user",id),("isbn",isbn))
+    """
+    def __init__(self):
+        # key -> lock, a lock is created the first time its key is used
+        self.locks={}
+        self.registry_lock=threading.Lock()
+
+    def _lock_of(self,key):
+        lock=self.locks.get(key)
+        if lock is None:
+            with self.registry_lock:
+                lock=self.locks.setdefault(key,threading.RLock())
+        return lock
+
+    @contextmanager
+    def hold(self,*keys):
+        """
+        Params:
+        keys, tuples of (kind, value), example ("user","id293310818420656")
+        """
+        locks=[self._lock_of(key) for key in sorted(set(keys))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
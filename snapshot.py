@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import logging
+import mmap
+import pandas as pd
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class ColumnarSnapshot:
+    """
+    Columnar binary copy of a .csv table, used to skip parsing the .csv file on startup.
+
+    The snapshot is a directory next to the .csv file (example: Books_csv.csv.snapshot) holding one binary
+    file per column: the utf-8 values of the column one after the other, separated by a NUL byte.
+    Loading memory-maps the column files and turns every column into strings with a single decode and split,
+    there is no per row parsing of quotes, delimiters or types as with the .csv file.
+    The .csv file stays the interchange format; the snapshot remembers the size and modification time of the .csv
+    it was built from and is rebuilt whenever the .csv changes.
+
+    Functionalities:
+    1. is_fresh := True if the snapshot was built from the current .csv file
+    2. write := writes the snapshot of a dataframe
+    3. load := loads the snapshot into a dataframe
+    """
+    def __init__(self,csv_path):
+        """
+        Params:
+        csv_path, path of the .csv file the snapshot belongs to
+        """
+        self.csv_path=csv_path
+        self.dir_path=csv_path+".snapshot"
+        self.meta_path=os.path.join(self.dir_path,"meta.json")
+
+    # separates the values of a column in the column file
+    separator="\x00"
+
+    def _csv_signature(self):
+        stat=os.stat(self.csv_path)
+        return {"size":stat.st_size,"mtime_ns":stat.st_mtime_ns}
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path,"r",encoding="utf-8") as meta_file:
+                return json.load(meta_file)
+        except (FileNotFoundError,json.JSONDecodeError):
+            return None
+
+    # True if the snapshot was built from the current .csv file
+    def is_fresh(self,columns):
+        """
+        Params:
+        columns, the expected column names
+
+        Return:
+        Bool, False if there is no snapshot, the columns differ or the .csv file changed after the snapshot was written
+        """
+        meta=self._read_meta()
+        if meta is None or not os.path.exists(self.csv_path):
+            return False
+        return meta.get("columns")==list(columns) and meta.get("csv")==self._csv_signature()
+
+    # writes the snapshot of a dataframe
+    def write(self,frame):
+        """
+        Writes every column of the dataframe as a binary file, the metadata is written last
+        so a half written snapshot is never considered fresh
+
+        Params:
+        frame, the dataframe read from the .csv file
+
+        Return:
+        False if a value contains the NUL separator and no snapshot was written, True otherwise
+        """
+        temp_dir=self.dir_path+".tmp"
+        shutil.rmtree(temp_dir,ignore_errors=True)
+        os.makedirs(temp_dir)
+        for position,column in enumerate(frame.columns):
+            values=frame[column].fillna("").astype(str).tolist()
+            joined=self.separator.join(values)
+            if joined.count(self.separator)!=max(len(values)-1,0):
+                logging.error("value contains the snapshot separator, snapshot not written")
+                shutil.rmtree(temp_dir,ignore_errors=True)
+                return False
+            with open(os.path.join(temp_dir,f"{position}.bin"),"wb") as column_file:
+                column_file.write(joined.encode("utf-8"))
+        meta={"columns":list(frame.columns),"rows":len(frame),"csv":self._csv_signature()}
+        with open(os.path.join(temp_dir,"meta.json"),"w",encoding="utf-8") as meta_file:
+            json.dump(meta,meta_file)
+        shutil.rmtree(self.dir_path,ignore_errors=True)
+        os.replace(temp_dir,self.dir_path)
+        logging.info(f"snapshot written for {self.csv_path}")
+        return True
+
+    # loads the snapshot into a dataframe
+    def load(self):
+        """
+        Return:
+        pandas dataframe with every column as python strings
+        """
+        meta=self._read_meta()
+        data={}
+        for position,column in enumerate(meta["columns"]):
+            data[column]=self._load_column(os.path.join(self.dir_path,f"{position}.bin"),meta["rows"])
+        return pd.DataFrame(data,columns=meta["columns"])
+
+    def _load_column(self,column_path,rows):
+        if rows==0:
+            return pd.Series([],dtype=object)
+        with open(column_path,"rb") as column_file:
+            if os.fstat(column_file.fileno()).st_size==0:
+                return pd.Series([""]*rows,dtype=object)
+            with mmap.mmap(column_file.fileno(),0,access=mmap.ACCESS_READ) as mapped:
+                values=str(mapped,"utf-8").split(self.separator)
+        return pd.Series(values,dtype=object)
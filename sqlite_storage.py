@@ -0,0 +1,174 @@
+import sqlite3
+import logging
+import threading
+import pandas as pd
+
+logging.basicConfig(level=logging.ERROR)
+
+
+class SQLiteStorage:
+    """
+    Embedded SQLite storage used as an alternative to the .csv files.
+
+    Every table of StorageManager.table_specs becomes an SQLite table with a primary key on its key columns
+    and secondary indexes on the columns listed under "indexes", so point lookups and searches are
+    indexed queries and every write is a transaction.
+
+    Functionalities:
+    1. create_tables := creates the tables and indexes if they do not exist
+    2. import_frame := replaces the contents of a table with a dataframe, used for migrating from .csv
+    3. load_frame := reads a complete table into a dataframe
+    4. apply_changes := applies a list of insert/update/delete changes in a single transaction
+    5. find_rows := rows where the given columns are equal to the given values
+    6. row_exists := True if any row matches the given column values
+    7. search_rows := rows where a column contains a substring
+    """
+    def __init__(self,db_path,table_specs):
+        """
+        Params:
+        db_path, path of the .db file, type=string
+        table_specs, StorageManager.table_specs
+        """
+        self.db_path=db_path
+        self.table_specs=table_specs
+        # check_same_thread is off so a background flusher can write using the same connection,
+        # the lock makes sure only one thread uses the connection at a time
+        self.connection=sqlite3.connect(db_path,check_same_thread=False)
+        self.lock=threading.RLock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+    # creates the tables and indexes if they do not exist
+    def create_tables(self):
+        """
+        Creates every table with its primary key and secondary indexes
+
+        Return:
+        list of table names that did not exist before and were created now
+        """
+        with self.lock:
+            existing={row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        created=[]
+        with self.lock,self.connection:
+            for table,spec in self.table_specs.items():
+                columns=", ".join(f'"{column}" TEXT NOT NULL DEFAULT \'\'' for column in spec['columns'])
+                keys=", ".join(f'"{column}"' for column in spec['key'])
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns}, PRIMARY KEY ({keys})) WITHOUT ROWID')
+                # columns added to the table after the database was created
+                present=[row[1] for row in self.connection.execute(f'PRAGMA table_info("{table}")')]
+                for column in spec['columns'][len(present):]:
+                    self.connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" TEXT NOT NULL DEFAULT \'\'')
+                for index_columns in spec.get('indexes',[]):
+                    index_name=f"idx_{table}_"+"_".join(index_columns)
+                    indexed=", ".join(f'"{column}"' for column in index_columns)
+                    self.connection.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({indexed})')
+                if table not in existing:
+                    created.append(table)
+        return created
+
+    # replaces the contents of a table with a dataframe
+    def import_frame(self,table,frame,replace=True):
+        """
+        Replaces all rows of the table with the rows of the dataframe in one transaction
+
+        Params:
+        table, name of the table
+        frame, pandas dataframe with the table's columns
+        replace, if False the rows are added to the existing ones, used to import a .csv file chunk by chunk
+        """
+        spec=self.table_specs[table]
+        placeholders=", ".join("?" for column in spec['columns'])
+        rows=frame[spec['columns']].astype(str).itertuples(index=False,name=None)
+        with self.lock,self.connection:
+            if replace:
+                self.connection.execute(f'DELETE FROM "{table}"')
+            self.connection.executemany(f'INSERT OR REPLACE INTO "{table}" VALUES ({placeholders})',rows)
+        logging.info(f"imported {len(frame)} rows into {table}")
+
+    # reads a complete table into a dataframe
+    def load_frame(self,table):
+        """
+        Return:
+        pandas dataframe with all the rows of the table, ordered by the primary key
+        """
+        spec=self.table_specs[table]
+        columns=", ".join(f'"{column}"' for column in spec['columns'])
+        with self.lock:
+            return pd.read_sql_query(f'SELECT {columns} FROM "{table}"',self.connection,dtype=object)
+
+    # applies a list of changes in a single transaction
+    def apply_changes(self,table,entries):
+        """
+        Applies changes of the same format as the journal entries, all or none of them
+
+        Params:
+        table, name of the table
+        entries, list of dict with the keys "op","key" and "row"
+        """
+        spec=self.table_specs[table]
+        placeholders=", ".join("?" for column in spec['columns'])
+        key_condition=" AND ".join(f'"{column}"=?' for column in spec['key'])
+        with self.lock,self.connection:
+            for entry in entries:
+                if entry["op"]=="delete":
+                    self.connection.execute(f'DELETE FROM "{table}" WHERE {key_condition}',list(entry["key"]))
+                else:
+                    # changes journaled before a column was added do not have it
+                    values=[entry["row"].get(column,"") for column in spec['columns']]
+                    self.connection.execute(f'INSERT OR REPLACE INTO "{table}" VALUES ({placeholders})',values)
+
+    # rows where the given columns are equal to the given values
+    def find_rows(self,table,equals,limit=None):
+        """
+        Params:
+        table, name of the table
+        equals, dict of column -> value, uses the primary key or a secondary index
+        limit, max number of rows to return, all rows if None
+
+        Return:
+        pandas dataframe of the matching rows
+        """
+        spec=self.table_specs[table]
+        columns=", ".join(f'"{column}"' for column in spec['columns'])
+        condition=" AND ".join(f'"{column}"=?' for column in equals)
+        query=f'SELECT {columns} FROM "{table}" WHERE {condition}'
+        if limit is not None:
+            query+=f" LIMIT {int(limit)}"
+        with self.lock:
+            return pd.read_sql_query(query,self.connection,params=list(equals.values()),dtype=object)
+
+    # True if any row matches the given column values
+    def row_exists(self,table,equals):
+        """
+        Params:
+        table, name of the table
+        equals, dict of column -> value
+
+        Return:
+        Bool
+        """
+        condition=" AND ".join(f'"{column}"=?' for column in equals)
+        with self.lock:
+            cursor=self.connection.execute(f'SELECT 1 FROM "{table}" WHERE {condition} LIMIT 1',list(equals.values()))
+            return cursor.fetchone() is not None
+
+    # rows where a column contains a substring
+    def search_rows(self,table,column,sub_string):
+        """
+        Params:
+        table, name of the table
+        column, column to search in
+        sub_string, the substring to look for, matched literally
+
+        Return:
+        pandas dataframe of the matching rows
+        """
+        spec=self.table_specs[table]
+        columns=", ".join(f'"{name}"' for name in spec['columns'])
+        query=f'SELECT {columns} FROM "{table}" WHERE instr("{column}",?)>0'
+        with self.lock:
+            return pd.read_sql_query(query,self.connection,params=[sub_string],dtype=object)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
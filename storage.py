@@ -1,96 +1,1220 @@
 import pandas as pd
 import logging
+from journal import ChangeJournal
+from sqlite_storage import SQLiteStorage
+from snapshot import ColumnarSnapshot
+from indexes import KeyIndex,index_types,normalize
+from query_cache import QueryCache
+from query_result import QueryResult
+from key_allocator import KeyAllocator
+from row_locks import RowLocks
+import time
+import threading
+import atexit
 
 logging.basicConfig(level=logging.ERROR)
 
 
+class LazyFrame:
+    """
+    Descriptor holding the dataframe of a table, the table is loaded by StorageManager.load_table
+    the first time the dataframe is used
+    """
+    def __init__(self,table):
+        self.table=table
+
+    def __set_name__(self,owner,name):
+        self.attribute="_"+name
+
+    def __get__(self,obj,owner):
+        if obj is None:
+            return self
+        if obj.__dict__.get(self.attribute) is None:
+            with obj.storage_lock:
+                # two threads using the table for the first time load it once
+                if obj.__dict__.get(self.attribute) is None:
+                    obj.load_table(self.table)
+        return obj.__dict__[self.attribute]
+
+    def __set__(self,obj,frame):
+        obj.__dict__[self.attribute]=frame
+        # the in-memory indexes point at the rows of the replaced dataframe, they are rebuilt on the next lookup
+        obj.__dict__.get('row_indexes',{}).pop(self.table,None)
+        if obj.__dict__.get('table_versions') is not None:
+            obj.bump_version(self.table)
+
+
 class StorageManager:
     """
     Class deals with:
     1. checks if the user required .csv files are present in the same directory as one we are running hte program from
     2. if not found, a file is creted, initialised and loaded into a dataframe to be used.
-    
+    3. keeps an append-only journal of row changes next to every .csv file, so a mutation costs one small append
+    4. optionally keeps the data in an embedded SQLite database instead, backend="sqlite"
+    5. keeps a columnar binary snapshot next to every .csv file, loaded instead of parsing the .csv when it is up to date
+    6. optionally persists changes write-behind: changes are coalesced in memory and written by a background flusher
+    7. can be used by several threads, a lock is held for the short time a dataframe, its indexes or its journal change
+
     functionalities:
     1. __init__ := loads the dataframe from .csv
-    2. storage_operation := checks file existance, creates one if one doesn't exitst, and intialises it
-    3. return_complete_file_path := used to get the directory path we are opeating from. 
+    2. storage_operation := checks file existance, creates one if one doesn't exitst, and intialises it, returns the dataframe
+    3. return_complete_file_path := used to get the directory path we are opeating from.
+    4. record_change := appends an insert/update/delete of a single row to the table's journal
+    5. replay_journal := applies the journal on top of the dataframe loaded from .csv
+    6. compact_table := folds the journal back into the .csv file
+    7. compact_all_tables := compacts every table
+    8. find_rows := rows of a table matching column values, an indexed query with the sqlite backend
+    9. row_exists := True if a row matching column values exists
+    10. search_rows := rows of a table where a column contains a substring
+    11. insert_row, update_row, delete_row := single row changes, applied to the dataframe and persisted
+    11.1 insert_rows := adds many rows with a single concat and a single write
+    12. load_table := loads a table, at startup for eager_tables and on first use for the rest
+    13. startup_report := breakdown of the time spent loading the tables
+    14. stream_table_csv, stream_indexed_frame := reads a large .csv file in chunks with bounded memory, reporting rows/sec, and indexes every chunk as it is read
+    15. enable_write_behind, disable_write_behind := turns the write-behind mode on and off
+    16. flush_pending_writes := writes every change still waiting in memory, one write per table
+    17. index_of := an in-memory index of a table, built on first use and kept in sync by the row changes
+    18. search_words := rows of a table where a column has all the words of a query, answered by the token index
+    19. search_digits := rows of a table whose isbn/id contains a partial number, answered by the n-gram index
+    20. search_similar := rows whose name is within a few typos of a query, closest first, answered by the BK-tree index
+    21. bump_version := marks a table as changed, cached search results of the table are no longer used
+    22. query_cache_stats := hits and misses of the search result cache
+    23. combine_results := rows found by every one of several searches, one page of them, used by find_books/find_users
+    24. integrity_report := rows of a table breaking the validation rules of their columns
+    25. allocate_keys := one or many new unique isbn/id values, safe with several writers
     """
+    # name of each table -> .csv file, column names, key columns and the instance attribute holding the dataframe
+    # "indexes" are the secondary indexes created by the sqlite backend
+    # "initial_rows" names the method giving the rows of a table whose .csv file does not exist yet
+    # "before_write" names the method preparing the dataframe right before the whole table is written
+    # "memory_indexes" are the in-memory indexes of the table besides the key index, name -> [index type, parameters]
+    # "validation" is the kind of value of every validated column, see LibraryMangUntilities.validate_column
+    # "generated_key" is the prefix and number of random digits of the keys handed out by allocate_keys
+    table_specs={
+        'users':{'file':'Users_csv.csv','columns':['id','Name','Borrowed'],'key':['id'],'frame':'users_df',
+                 'indexes':[['Name']],'before_write':'refresh_borrowed_column',
+                 'memory_indexes':{'id_digits':['NgramIndex','id','id'],'Name_fuzzy':['FuzzyIndex','Name']},
+                 'validation':{'id':'id','Name':'name'},'generated_key':['id',15]},
+        'books':{'file':'Books_csv.csv','columns':['isbn','Title','Author'],'key':['isbn'],'frame':'books_df',
+                 'indexes':[['Title'],['Author'],['Title','Author']],
+                 'memory_indexes':{'Title_tokens':['TokenIndex','Title'],'Author_tokens':['TokenIndex','Author'],
+                                   'isbn_digits':['NgramIndex','isbn','isbn'],'Author_fuzzy':['FuzzyIndex','Author'],
+                                   'Title_prefix':['PrefixIndex','Title'],'Author_prefix':['PrefixIndex','Author'],
+                                   'Title_Author':['CompositeIndex',['Title','Author']]},
+                 'validation':{'isbn':'isbn','Title':'title','Author':'name'},'generated_key':['isbn',13]},
+        'loans':{'file':'Loans_csv.csv','columns':['user_id','isbn','borrowed_at','due_at'],'key':['user_id','isbn'],'frame':'loans_df',
+                 'indexes':[['isbn']],'initial_rows':'loans_from_borrowed_column'},
+        'holdings':{'file':'Holdings_csv.csv','columns':['isbn','copies'],'key':['isbn'],'frame':'holdings_df'},
+        'holds':{'file':'Holds_csv.csv','columns':['isbn','user_id','placed_at'],'key':['isbn','user_id'],'frame':'holds_df',
+                 'indexes':[['user_id']]},
+    }
+    # file name of the database used by the sqlite backend
+    sqlite_file_name='Library.db'
+    # number of journal entries after which the journal is folded back into the .csv file
+    journal_compaction_threshold=1000
+    # load from and write the columnar snapshots next to the .csv files
+    use_snapshots=True
+    # .csv files of at least this size are read in chunks instead of in one shot
+    streaming_threshold_bytes=64*1024*1024
+    # memory a single chunk may take while streaming a .csv file
+    streaming_memory_budget_bytes=32*1024*1024
+    # check every loaded table against the validation rules of its columns, invalid rows are logged
+    validate_on_load=False
+    # print the progress of streaming a .csv file, it is always logged
+    show_ingest_progress=False
+    # max number of search results kept by the query cache, 0 turns it off
+    query_cache_size=256
+    # largest number of typos tolerated by search_similar
+    fuzzy_max_distance=2
+    # tables loaded at startup, the rest are loaded the first time they are used
+    eager_tables=['books']
+    # the dataframes, loaded on first access if they are not loaded yet
+    books_df=LazyFrame('books')
+    users_df=LazyFrame('users')
 
     #loads the dataframes
-    def __init__(self):
+    def __init__(self,data_dir=None,backend="csv"):
         """
         Runs automatically when we create an object
         used to validate file exitance and column name existances
 
-        Loads the dataframe from the valdiated file paths
-        Uses the instances variables to load into pandas dataframe
+        Loads the books dataframe, the users dataframe is only loaded the first time it is used
+        by a user or circulation operation. Every .csv file is read a single time, the frame read for
+        validating the columns is the one that is used.
+        Replays the journal of every table on top of the loaded dataframe
+
+        With the sqlite backend the tables are loaded from the database instead. The first time the database
+        is created, the .csv files (with their journals) are migrated into it.
+
+        Params:
+        data_dir, directory holding the .csv files, defaults to the directory of this file
+        backend, "csv" or "sqlite"
         """
-        self.users_df_file_path,self.book_df_file_path=self.storage_operation()
+        startup_begin=time.perf_counter()
+        if backend not in ["csv","sqlite"]:
+            raise ValueError("backend should be one among csv,sqlite")
+        self.data_dir=data_dir
+        self.storage_backend=backend
+        self.users_df_file_path=self.return_complete_file_path(self.table_specs['users']['file'])
+        self.book_df_file_path=self.return_complete_file_path(self.table_specs['books']['file'])
+        # held while a dataframe, its indexes or its journal change, and while a table is loaded
+        self.storage_lock=threading.RLock()
+        # per user id and per isbn locks of the circulation operations
+        self.row_locks=RowLocks()
+        self.journals={}
+        for table in self.table_specs:
+            self.journals[table]=ChangeJournal(self.return_complete_file_path(self.table_specs[table]['file'])+".journal")
+        # table -> {"csv_read" or "snapshot_load": seconds, "replay": seconds, "total": seconds}
+        self.load_timings={}
+        # table -> {"rows","seconds","rows_per_sec","chunk_rows"} for tables read in chunks
+        self.ingest_stats={}
+        # write-behind state, table -> {key: latest change of that key} waiting to be written
+        self.pending_changes={}
+        self.pending_mutations=0
+        self.write_behind=False
+        # the same lock, so the waiting changes and the tables are never locked in two different orders
+        self.pending_lock=self.storage_lock
+        self.write_behind_thread=None
+        self.sqlite_store=None
+        self.tables_to_migrate=[]
+        # table -> {name: index}, the in-memory indexes of the tables held by a LazyFrame
+        self.row_indexes={}
+        # table -> KeyAllocator, created the first time keys of the table are allocated
+        self.key_allocators={}
+        self.key_allocators_lock=threading.Lock()
+        # table -> number of changes, search results are cached per version of the table
+        self.table_versions={table:0 for table in self.table_specs}
+        self.query_cache=QueryCache(self.query_cache_size)
+        if backend=="sqlite":
+            self.sqlite_store=SQLiteStorage(self.return_complete_file_path(self.sqlite_file_name),self.table_specs)
+            self.tables_to_migrate=self.sqlite_store.create_tables()
         logging.info("loading from files into dataframe")
-        # self.book_df_file_path=book_df_file_path
-        self.books_df=pd.read_csv(self.book_df_file_path)
-        self.users_df=pd.read_csv(self.users_df_file_path)
+        # tables that still have to be migrated into the database are loaded now, the migration happens once
+        for table in self.table_specs:
+            if table in self.eager_tables or table in self.tables_to_migrate:
+                self.load_table(table)
+        self.load_timings['startup']={'total':time.perf_counter()-startup_begin}
+        logging.info(self.startup_report())
         logging.info("successfully created dataframe")
 
+    # loads a single table into its dataframe
+    def load_table(self,table):
+        """
+        Loads a table from the database, or from its validated .csv file followed by replaying its journal.
+        If the columnar snapshot of the .csv file is up to date it is loaded instead of parsing the .csv file,
+        otherwise the snapshot is rebuilt from the .csv file.
+        .csv files larger than streaming_threshold_bytes are read in chunks and indexed chunk by chunk, see stream_indexed_frame,
+        this bounds the memory of parsing, the loaded dataframe and its indexes still hold the whole table
+        Called at startup for eager_tables, and by LazyFrame the first time any other table is used
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        """
+        spec=self.table_specs[table]
+        begin=time.perf_counter()
+        timings={}
+        if self.sqlite_store is not None and table in self.tables_to_migrate and self.is_large_csv(table):
+            # streamed straight into the database, the .csv file is never completely parsed in memory,
+            # the table is then read back from the database below like any other table
+            logging.info(f"migrating {spec['file']} into the database in chunks")
+            self.stream_table_csv(table,lambda chunk: self.sqlite_store.import_frame(table,chunk,replace=False))
+            self.sqlite_store.apply_changes(table,self.journals[table].read())
+            self.tables_to_migrate.remove(table)
+            timings['migrate']=time.perf_counter()-begin
+        if self.sqlite_store is not None and table not in self.tables_to_migrate:
+            read_begin=time.perf_counter()
+            setattr(self,spec['frame'],self.sqlite_store.load_frame(table))
+            timings['read']=time.perf_counter()-read_begin
+        else:
+            snapshot=ColumnarSnapshot(self.return_complete_file_path(spec['file']))
+            streamed_indexes=None
+            if self.use_snapshots and snapshot.is_fresh(spec['columns']):
+                setattr(self,spec['frame'],snapshot.load())
+                timings['snapshot_load']=time.perf_counter()-begin
+            else:
+                if self.is_large_csv(table):
+                    # only the parsing is bounded to one chunk, the dataframe built from the chunks holds the whole table
+                    streamed_frame,streamed_indexes=self.stream_indexed_frame(table)
+                    setattr(self,spec['frame'],streamed_frame)
+                else:
+                    setattr(self,spec['frame'],self.storage_operation(table))
+                timings['csv_read']=time.perf_counter()-begin
+                if self.use_snapshots:
+                    snapshot_begin=time.perf_counter()
+                    snapshot.write(getattr(self,spec['frame']))
+                    timings['snapshot_write']=time.perf_counter()-snapshot_begin
+            replay_begin=time.perf_counter()
+            self.replay_journal(table)
+            timings['replay']=time.perf_counter()-replay_begin
+            # the indexes built while streaming stay valid unless the journal replaced the dataframe
+            if streamed_indexes is not None and getattr(self,spec['frame']) is streamed_frame:
+                self.row_indexes[table]=streamed_indexes
+            if table in self.tables_to_migrate:
+                logging.info(f"migrating {spec['file']} into the database")
+                self.sqlite_store.import_frame(table,getattr(self,spec['frame']))
+                self.tables_to_migrate.remove(table)
+        if self.validate_on_load and spec.get('validation'):
+            validate_begin=time.perf_counter()
+            invalid=self.integrity_report(table)
+            timings['validate']=time.perf_counter()-validate_begin
+            if not invalid.empty:
+                logging.error(f"{table}: {len(invalid)} values break the validation rules, see integrity_report('{table}')")
+        timings['total']=time.perf_counter()-begin
+        self.load_timings[table]=timings
+        logging.info(f"{table} loaded in {timings['total']:.4f}s")
+
+    # breakdown of the time spent loading the tables
+    def startup_report(self):
+        """
+        Return:
+        string with the time spent on reading and replaying every loaded table, and the total startup time
+        """
+        lines=["startup timings:"]
+        for name,timings in self.load_timings.items():
+            parts=", ".join(f"{step}={seconds*1000:.2f}ms" for step,seconds in timings.items())
+            lines.append(f"  {name}: {parts}")
+        for table in self.table_specs:
+            if table not in self.load_timings:
+                lines.append(f"  {table}: not loaded yet")
+        for table,stats in self.ingest_stats.items():
+            lines.append(f"  {table}: streamed {stats['rows']} rows in chunks of {stats['chunk_rows']}, {stats['rows_per_sec']:.0f} rows/sec")
+        return "\n".join(lines)
+
     #checks file existance, creates one if one doesn't exitst, and intialises it
-    def storage_operation(self):
+    def storage_operation(self,table):
         """
-        # check if file path exits for Users_csv.csv
+        # check if file path exits for the .csv file of the table, example Users_csv.csv
             # if it doesn't,create the file and initialise the colums name ['id','Name','Borrowed']
         # if does exits, check if the columsn are intilised with ['id','Name','Borrowed']
 
-        # check if file path exits for Books_csv.csv
-            # if it doesn't,create the file and initialise the colums name ['isbn','Title','Author']
-        # if does exits, check if the columsn are intilised with ['isbn','Title','Author']
-        
+        The file is read only once, the dataframe used for validating the columns is returned
+        so it can be used directly.
+
         Params:
-        complete_file_path to the .csv file
-        column_names is the names of the attributes ex:['isbn','Title','Author']
-        
+        table, one among the keys of table_specs, type=string
+
         Return:
-        Does not return anything, but creates the column names in the .csv files
+        the validated dataframe, every column read as string
         """
-        csv_files={'Users_csv.csv': ['id','Name','Borrowed'],'Books_csv.csv':['isbn','Title','Author']}
-        validated_filepaths=[]
-        for csv_name,column_names in csv_files.items():
-            #check if csv file exitst already in the operating directory
-            file_path=self.return_complete_file_path(csv_name)
-            try:
-                df=pd.read_csv(file_path)
-                logging.info(".csv file exitst at the mentioned file_path")
-                # .csv file exitst at the mentioned file_path
-                if not all(df.columns.values==column_names):
-                    logging.info("column names are not a match")
-                    #if they are not a match,set the attributes
-                    df.columns=column_names
-                    # save to file, making the changes
-                    logging.info('column names matched to predetermined column names')
-                    df.to_csv(file_path,index=False)
-            except (FileNotFoundError,pd.errors.EmptyDataError):
-                logging.error('file not found at file_path or columns not initialised')
-                # print(f"File not found at file_path or columns not initialised")
-                logging.info("creating a dataframe, initialise the column names to fix error")
-                df = pd.DataFrame(columns=column_names)
-                logging.info("Saving to file")
+        spec=self.table_specs[table]
+        column_names=spec['columns']
+        #check if csv file exitst already in the operating directory
+        file_path=self.return_complete_file_path(spec['file'])
+        try:
+            df=self.read_table_csv(file_path)
+            logging.info(".csv file exitst at the mentioned file_path")
+            # .csv file exitst at the mentioned file_path
+            if list(df.columns)==column_names[:len(df.columns)] and len(df.columns)<len(column_names):
+                # columns added to the table after the file was written are filled with empty values
+                logging.info("adding the new columns to the file")
+                for column in column_names[len(df.columns):]:
+                    df[column]=""
+                df.to_csv(file_path,index=False)
+            elif list(df.columns)!=column_names:
+                logging.info("column names are not a match")
+                #if they are not a match,set the attributes
+                df.columns=column_names
+                # save to file, making the changes
+                logging.info('column names matched to predetermined column names')
                 df.to_csv(file_path,index=False)
-            validated_filepaths.append(file_path)
-        return validated_filepaths
+        except (FileNotFoundError,pd.errors.EmptyDataError):
+            logging.error('file not found at file_path or columns not initialised')
+            # print(f"File not found at file_path or columns not initialised")
+            logging.info("creating a dataframe, initialise the column names to fix error")
+            df = pd.DataFrame({column:pd.Series(dtype=object) for column in column_names})
+            if spec.get('initial_rows'):
+                # tables added later are filled from the existing data the first time
+                df=getattr(self,spec['initial_rows'])()
+            logging.info("Saving to file")
+            df.to_csv(file_path,index=False)
+        return df
 
     # used to get the directory path we are opeating from
     def return_complete_file_path(self,csv_file_name):
         """
         Checks to see if a .csv files has already been created
-        
+
         Params:
         the file name of the .csv file
         Returns:
         Path
         """
-        dir_path=os.path.dirname(os.path.abspath(__file__))
+        dir_path=getattr(self,"data_dir",None) or os.path.dirname(os.path.abspath(__file__))
         file_path = os.path.join(dir_path,csv_file_name)
         # return os.path.exists(file_path)
         return file_path
-    
+
+    # True if the .csv file of the table should be read in chunks
+    def is_large_csv(self,table):
+        """
+        Params:
+        table, one among the keys of table_specs, type=string
+
+        Return:
+        Bool, True if the .csv file exists and is at least streaming_threshold_bytes large
+        """
+        file_path=self.return_complete_file_path(self.table_specs[table]['file'])
+        return os.path.exists(file_path) and os.path.getsize(file_path)>=self.streaming_threshold_bytes
+
+    # checks the columns of a .csv file by reading its header only
+    def validate_csv_header(self,table):
+        """
+        Same check as storage_operation, but only the header line is read
+
+        Params:
+        table, one among the keys of table_specs, type=string
+
+        Return:
+        True if the column names match, False if only the names differ (the predetermined names are used while reading)
+        Raises ValueError if the number of columns differ
+        """
+        spec=self.table_specs[table]
+        header=list(pd.read_csv(self.return_complete_file_path(spec['file']),nrows=0).columns)
+        if header==spec['columns']:
+            return True
+        if len(header)!=len(spec['columns']):
+            raise ValueError(f"{spec['file']} should have the columns {spec['columns']}")
+        logging.info("column names are not a match, using the predetermined column names")
+        return False
+
+    # number of rows of a .csv file that fit into the memory budget
+    def estimate_chunk_rows(self,file_path,column_count,memory_budget_bytes):
+        """
+        Estimates the memory of a parsed row from the first 64KB of the file
+
+        Params:
+        file_path, path of the .csv file
+        column_count, number of columns
+        memory_budget_bytes, memory a chunk may take
+
+        Return:
+        int, rows per chunk, at least 1
+        """
+        with open(file_path,"rb") as csv_file:
+            sample=csv_file.read(1<<16)
+        bytes_per_row=len(sample)/max(sample.count(b"\n"),1)
+        # a parsed cell is a python string, roughly 50 bytes of overhead on top of its characters
+        row_memory=bytes_per_row+50*column_count
+        return max(1,int(memory_budget_bytes//row_memory))
+
+    # reads a .csv file in chunks
+    def stream_table_csv(self,table,on_chunk,memory_budget_bytes=None):
+        """
+        Reads the .csv file of the table in chunks, the schema is validated from the header alone
+        and every chunk is handed to on_chunk, so at most one chunk is parsed in memory at a time.
+        Progress and rows/sec are logged after every chunk.
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        on_chunk, called with every chunk as a dataframe
+        memory_budget_bytes, memory a chunk may take, defaults to streaming_memory_budget_bytes
+
+        Return:
+        dict with "rows","seconds","rows_per_sec","chunk_rows", also kept under ingest_stats
+        """
+        spec=self.table_specs[table]
+        file_path=self.return_complete_file_path(spec['file'])
+        self.validate_csv_header(table)
+        if memory_budget_bytes is None:
+            memory_budget_bytes=self.streaming_memory_budget_bytes
+        chunk_rows=self.estimate_chunk_rows(file_path,len(spec['columns']),memory_budget_bytes)
+        begin=time.perf_counter()
+        rows=0
+        reader=pd.read_csv(file_path,dtype=object,keep_default_na=False,names=spec['columns'],header=0,chunksize=chunk_rows)
+        with reader:
+            for chunk in reader:
+                on_chunk(chunk)
+                rows+=len(chunk)
+                self.report_ingest_progress(table,rows,time.perf_counter()-begin)
+        seconds=time.perf_counter()-begin
+        stats={'rows':rows,'seconds':seconds,'rows_per_sec':rows/seconds if seconds else 0.0,'chunk_rows':chunk_rows}
+        self.ingest_stats[table]=stats
+        return stats
+
+    # reads a large .csv file in chunks, indexing every chunk as it is read
+    def stream_indexed_frame(self,table):
+        """
+        Every chunk is added to the key index and the memory_indexes of the table while it is in hand,
+        so the indexes are not built afterwards from the whole dataframe
+
+        Params:
+        table, one among the keys of table_specs, type=string
+
+        Return:
+        the dataframe of the table, dict name -> index (None if the table is not indexed)
+        """
+        spec=self.table_specs[table]
+        indexes=None
+        if isinstance(getattr(type(self),spec['frame'],None),LazyFrame):
+            indexes={name:self._new_index(table,name) for name in ["key"]+list(spec.get('memory_indexes',{}))}
+        chunks=[]
+        def on_chunk(chunk):
+            chunks.append(chunk)
+            for index in (indexes or {}).values():
+                index.extend(chunk)
+        self.stream_table_csv(table,on_chunk)
+        if not chunks:
+            return self.storage_operation(table),None
+        # the chunks are labelled 0..n-1 in the order of the file, like the dataframe
+        return pd.concat(chunks,ignore_index=True),indexes
+
+    # reports the progress of streaming a .csv file
+    def report_ingest_progress(self,table,rows,seconds):
+        """
+        Params:
+        table, the table being read
+        rows, rows read so far
+        seconds, time since reading started
+        """
+        message=f"{table}: {rows} rows read, {rows/seconds if seconds else 0.0:.0f} rows/sec"
+        logging.info(message)
+        if self.show_ingest_progress:
+            print(message)
+
+    # reads a validated .csv file into a dataframe
+    def read_table_csv(self,file_path):
+        """
+        Reads a .csv file with every column as string, so empty cells are "" and not NaN,
+        this keeps the dtypes stable when single cells are later updated in place
+
+        Params:
+        file_path, path of the .csv file
+
+        Return:
+        pandas dataframe
+        """
+        return pd.read_csv(file_path,dtype=object,keep_default_na=False)
+
+    # appends a single row change to the journal of the table
+    def record_change(self,table,op,key,row=None):
+        """
+        Records the change of a single row in the journal of the table, instead of re-writing the .csv file.
+        With the sqlite backend the change is written to the database in a transaction instead.
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        op, one among "insert","update","delete", type=string
+        key, value of the key column, tuple of values if the table has multiple key columns
+        row, dict of the complete row after the change, looked up from the dataframe if not given
+        """
+        spec=self.table_specs[table]
+        if not isinstance(key,(tuple,list)):
+            key=(key,)
+        entry={"op":op,"key":list(key)}
+        if op!="delete" and row is not None:
+            entry["row"]={column:str(row[column]) for column in spec['columns']}
+        elif op!="delete":
+            frame=getattr(self,spec['frame'])
+            label=self._key_label(table,key)
+            if label is None:
+                logging.error("row to journal not found, nothing recorded")
+                return False
+            entry["row"]={column:str(value) for column,value in frame.loc[label,spec['columns']].items()}
+        self.persist_changes(table,[entry])
+        return True
+
+    # persists a list of journal entries with a single write
+    def persist_changes(self,table,entries):
+        """
+        Appends the changes to the journal with one write, or applies them in one transaction with the sqlite backend.
+        If the journal grows past journal_compaction_threshold it is compacted into the .csv file.
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        entries, list of dict with the keys "op","key" and "row"
+        """
+        with self.storage_lock:
+            self.bump_version(table)
+            if self.write_behind:
+                self.queue_changes(table,entries)
+                return
+            self.write_changes(table,entries)
+
+    # writes a list of journal entries straight away
+    def write_changes(self,table,entries):
+        """
+        Params:
+        table, one among the keys of table_specs, type=string
+        entries, list of dict with the keys "op","key" and "row"
+        """
+        if self.sqlite_store is not None:
+            self.sqlite_store.apply_changes(table,entries)
+            logging.info("changes written to the database")
+            return
+        if len(entries)>=self.journal_compaction_threshold:
+            # the dataframe already holds the changes, one write of the .csv file is cheaper than journaling them
+            self.compact_table(table)
+            return
+        self.journals[table].append(entries)
+        logging.info("changes appended to journal")
+        if self.journals[table].entry_count>=self.journal_compaction_threshold:
+            self.compact_table(table)
+
+    # applies the journal on top of the dataframe loaded from .csv
+    def replay_journal(self,table):
+        """
+        Replays the journal of the table on top of its dataframe. Replaying is idempotent so a crash
+        between compaction's .csv write and journal removal leaves the data consistent.
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        """
+        spec=self.table_specs[table]
+        journal=self.journals[table]
+        state=journal.fold()
+        if not state:
+            return
+        frame=getattr(self,spec['frame'])
+        keys=zip(*[frame[column].tolist() for column in spec['key']])
+        present=set()
+        drop_labels=[]
+        for label,key in zip(frame.index,keys):
+            if key not in state:
+                continue
+            present.add(key)
+            row=state[key]
+            if row is None:
+                drop_labels.append(label)
+            else:
+                for column in spec['columns']:
+                    # changes journaled before a column was added do not have it
+                    frame.at[label,column]=row.get(column,"")
+        frame=frame.drop(index=drop_labels)
+        new_rows=[row for key,row in state.items() if row is not None and key not in present]
+        if new_rows:
+            frame=pd.concat([frame,pd.DataFrame(new_rows,columns=spec['columns']).fillna("")])
+        setattr(self,spec['frame'],frame.reset_index(drop=True))
+        logging.info(f"replayed {journal.entry_count} journal entries for {table}")
+        if journal.entry_count>=self.journal_compaction_threshold:
+            self.compact_table(table)
+
+    # folds the journal back into the .csv file
+    def compact_table(self,table):
+        """
+        Writes the complete dataframe to its .csv file and empties the journal.
+        The .csv is written to a temporary file first and then moved in place, so a crash never leaves half a file.
+        With the sqlite backend the database table is replaced by the dataframe instead.
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        """
+        spec=self.table_specs[table]
+        with self.storage_lock:
+            # the dataframe may have been changed in place before saving it
+            self.bump_version(table)
+            with self.pending_lock:
+                # the dataframe already holds every change still waiting to be written
+                if self.pending_changes.pop(table,None):
+                    logging.info(f"pending {table} changes folded into the compaction")
+            frame=getattr(self,spec['frame'])
+            if spec.get('before_write'):
+                frame=getattr(self,spec['before_write'])(frame)
+            if self.sqlite_store is not None:
+                self.sqlite_store.import_frame(table,frame)
+                return
+            file_path=self.return_complete_file_path(spec['file'])
+            temp_path=file_path+".tmp"
+            frame.to_csv(temp_path,index=False)
+            os.replace(temp_path,file_path)
+            if self.use_snapshots:
+                ColumnarSnapshot(file_path).write(frame)
+            self.journals[table].truncate()
+            logging.info(f"{table} journal compacted into {spec['file']}")
+
+    # compacts every table
+    def compact_all_tables(self):
+        """
+        Folds every journal back into its .csv file
+        """
+        for table in self.table_specs:
+            self.compact_table(table)
+
+    # True if reads of the table should be answered by the database
+    def reads_from_database(self,table):
+        """
+        With the sqlite backend reads are indexed queries, except while the table has changes waiting
+        to be written by the write-behind flusher, then the dataframe (which already has them) is used
+
+        Params:
+        table, one among the keys of table_specs, type=string
+
+        Return:
+        Bool
+        """
+        return self.sqlite_store is not None and not self.pending_changes.get(table)
+
+    # turns the write-behind mode on
+    def enable_write_behind(self,interval_ms=200,max_mutations=100):
+        """
+        In write-behind mode changes are not written when they happen. They are kept in memory, coalesced per row
+        (only the latest change of a row is written) and written by a background flusher at most every
+        interval_ms milliseconds, or straight away once max_mutations changes are waiting.
+        A burst of checkouts costs one write per table instead of one per checkout.
+        Whatever is still waiting is written by Exit and when the program ends.
+
+        Params:
+        interval_ms, how often the flusher writes, type=int
+        max_mutations, number of waiting changes that triggers a write, type=int
+        """
+        self.write_behind_interval_ms=interval_ms
+        self.write_behind_max_mutations=max_mutations
+        if self.write_behind:
+            return
+        self.write_behind=True
+        self.write_behind_stop=threading.Event()
+        self.write_behind_thread=threading.Thread(target=self._write_behind_loop,name="write-behind-flusher",daemon=True)
+        self.write_behind_thread.start()
+        atexit.register(self.flush_pending_writes)
+        logging.info("write-behind enabled")
+
+    # turns the write-behind mode off
+    def disable_write_behind(self):
+        """
+        Stops the background flusher and writes everything that is still waiting
+        """
+        if not self.write_behind:
+            return
+        self.write_behind_stop.set()
+        self.write_behind_thread.join()
+        self.write_behind=False
+        self.flush_pending_writes()
+        atexit.unregister(self.flush_pending_writes)
+        logging.info("write-behind disabled")
+
+    def _write_behind_loop(self):
+        while not self.write_behind_stop.wait(self.write_behind_interval_ms/1000):
+            try:
+                self.flush_pending_writes()
+            except Exception:
+                # the changes stay queued and are written by the next flush
+                logging.exception("write-behind flush failed")
+
+    # keeps changes in memory until the next flush
+    def queue_changes(self,table,entries):
+        """
+        Params:
+        table, one among the keys of table_specs, type=string
+        entries, list of dict with the keys "op","key" and "row"
+        """
+        with self.pending_lock:
+            queued=self.pending_changes.setdefault(table,{})
+            for entry in entries:
+                key=tuple(entry["key"])
+                # only the latest change of a row matters, moving it to the end keeps the order of changes
+                queued.pop(key,None)
+                queued[key]=entry
+            self.pending_mutations+=len(entries)
+            flush_now=self.pending_mutations>=self.write_behind_max_mutations
+        if flush_now:
+            self.flush_pending_writes()
+
+    # writes every change waiting in memory
+    def flush_pending_writes(self):
+        """
+        Writes the coalesced changes of every table, one journal append or one transaction per table.
+        Safe to call at any time, does nothing if nothing is waiting.
+        """
+        with self.pending_lock:
+            pending=self.pending_changes
+            self.pending_changes={}
+            self.pending_mutations=0
+            for table,queued in pending.items():
+                if queued:
+                    self.write_changes(table,list(queued.values()))
+        if pending:
+            logging.info("pending changes flushed")
+
+    # marks a table as changed
+    def bump_version(self,table):
+        """
+        Called by every path saving a table and whenever a dataframe is replaced,
+        search results cached for an older version of the table are not used any more
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        """
+        self.table_versions[table]+=1
+
+    # cached result of a search, None if it is not cached or the table changed since
+    def _cached_result(self,table,key,version):
+        result=self.query_cache.get(table,key,version)
+        # a copy, so the caller can change it without changing the cached result
+        return result.copy() if result is not None else None
+
+    # caches the result of a search and returns it
+    def _cache_result(self,table,key,version,result):
+        # version is read before the search started, a result computed while the table changed is stored
+        # under the older version and never served for the newer one
+        self.query_cache.put(table,key,version,result)
+        return result.copy()
+
+    # hits and misses of the search result cache
+    def query_cache_stats(self):
+        """
+        Return:
+        dict with "hits","misses","hit_rate","size" and "max_entries", used to tune query_cache_size
+        """
+        return self.query_cache.stats()
+
+    # the in-memory indexes of a table that are built
+    def indexes_of(self,table):
+        """
+        Only tables whose dataframe is held by a LazyFrame are indexed, for the rest None is returned
+
+        Params:
+        table, one among the keys of table_specs, type=string
+
+        Return:
+        dict, name -> index, only the indexes that were already built, these are the ones kept in sync by the row changes
+        """
+        spec=self.table_specs[table]
+        if not isinstance(getattr(type(self),spec['frame'],None),LazyFrame):
+            return None
+        getattr(self,spec['frame'])
+        return self.row_indexes.setdefault(table,{})
+
+    # a single in-memory index of a table
+    def index_of(self,table,name):
+        """
+        Returns an in-memory index of a table, building it from the dataframe the first time it is used
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        name, "key" for the KeyIndex of the table's key columns, otherwise one of the "memory_indexes" of the table
+
+        Return:
+        the index, None if the table is not indexed
+        """
+        spec=self.table_specs[table]
+        indexes=self.indexes_of(table)
+        if indexes is None:
+            return None
+        if name not in indexes:
+            with self.storage_lock:
+                # another thread may have built it while this one waited
+                indexes=self.indexes_of(table)
+                if name in indexes:
+                    return indexes[name]
+                begin=time.perf_counter()
+                index=self._new_index(table,name)
+                index.build(getattr(self,spec['frame']))
+                indexes[name]=index
+                logging.info(f"{table} {name} index built in {time.perf_counter()-begin:.4f}s")
+        return indexes[name]
+
+    # an empty in-memory index of a table
+    def _new_index(self,table,name):
+        spec=self.table_specs[table]
+        if name=="key":
+            return KeyIndex(spec['key'])
+        index_type,*params=spec['memory_indexes'][name]
+        return index_types[index_type](*params)
+
+    # label of the row with the given key
+    def _key_label(self,table,key):
+        spec=self.table_specs[table]
+        index=self.index_of(table,"key")
+        if index is not None:
+            return index.get(key)
+        frame=getattr(self,spec['frame'])
+        labels=frame.index[self._equals_mask(frame,dict(zip(spec['key'],key)))]
+        return labels[-1] if len(labels) else None
+
+    # labels of the rows matching column values, found with an index
+    def _matching_labels(self,table,equals):
+        """
+        The rows come from the key index if all the key columns are given, the candidates are then compared
+        exactly, as with a scan. Otherwise they come from a composite index on exactly the given columns,
+        which matches the values normalized like format_string (lowercase, single spaces)
+
+        Return:
+        list of labels, None if no index can answer and the table has to be scanned
+        """
+        spec=self.table_specs[table]
+        with self.storage_lock:
+            if self.index_of(table,"key") is None:
+                return None
+            if all(column in equals for column in spec['key']):
+                label=self._key_label(table,tuple(equals[column] for column in spec['key']))
+                candidates=[] if label is None else [label]
+            else:
+                for name,(index_type,*params) in spec.get('memory_indexes',{}).items():
+                    if index_type=="CompositeIndex" and sorted(params[0])==sorted(equals):
+                        # "The  Firm" by "John Grisham" finds "the firm" by "john grisham"
+                        return sorted(self.index_of(table,name).get([equals[column] for column in params[0]]))
+                return None
+            frame=getattr(self,spec['frame'])
+            return [label for label in candidates if all(frame.at[label,column]==value for column,value in equals.items())]
+
+    # replaces the dataframe of a table, keeping indexes that are already up to date
+    def _replace_frame(self,table,frame,indexes):
+        setattr(self,self.table_specs[table]['frame'],frame)
+        if indexes is not None:
+            self.row_indexes[table]=indexes
+
+    # builds a boolean mask over the dataframe for column==value conditions
+    def _equals_mask(self,frame,equals):
+        mask=pd.Series(True,index=frame.index)
+        for column,value in equals.items():
+            mask&=frame[column]==value
+        return mask
+
+    # rows of a table matching column values
+    def find_rows(self,table,**equals):
+        """
+        Finds the rows where every given column is equal to the given value,
+        example: find_rows('books',Title='dune',Author='frank herbert')
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        equals, column=value pairs
+
+        Return:
+        pandas dataframe of the matching rows
+        """
+        if self.reads_from_database(table):
+            return self.sqlite_store.find_rows(table,equals)
+        # the labels and the dataframe are read together, another thread may add or delete rows in between
+        with self.storage_lock:
+            frame=getattr(self,self.table_specs[table]['frame'])
+            labels=self._matching_labels(table,equals)
+            if labels is not None:
+                return frame.loc[labels]
+            return frame[self._equals_mask(frame,equals)]
+
+    # True if a row matching column values exists
+    def row_exists(self,table,**equals):
+        """
+        Params:
+        table, one among the keys of table_specs, type=string
+        equals, column=value pairs
+
+        Return:
+        Bool, True if at least one row matches
+        """
+        if self.reads_from_database(table):
+            return self.sqlite_store.row_exists(table,equals)
+        labels=self._matching_labels(table,equals)
+        if labels is not None:
+            return len(labels)>0
+        return not self.find_rows(table,**equals).empty
+
+    # rows of a table where a column contains a substring
+    def search_rows(self,table,column,sub_string):
+        """
+        Params:
+        table, one among the keys of table_specs, type=string
+        column, the column to search in
+        sub_string, matched literally, special characters have no regex meaning
+
+        Return:
+        pandas dataframe of the matching rows
+        """
+        # the index and the dataframe are read together, another thread may add or delete rows in between
+        with self.storage_lock:
+            key=("search_rows",column,sub_string)
+            version=self.table_versions[table]
+            cached=self._cached_result(table,key,version)
+            if cached is not None:
+                return cached
+            if self.reads_from_database(table):
+                return self._cache_result(table,key,version,self.sqlite_store.search_rows(table,column,sub_string))
+            frame=getattr(self,self.table_specs[table]['frame'])
+            return self._cache_result(table,key,version,frame[frame[column].str.contains(sub_string,regex=False,na=False)])
+
+    # rows of a table where a column has all the words of a query
+    def search_words(self,table,column,query):
+        """
+        Word search answered by the token index of the column: the rows having every word of the query,
+        in any order, are found by intersecting the rows of each word instead of scanning the column.
+        Words are normalized like format_string, lowercase and separated by whitespace
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        column, a column with a token index, example "Title"
+        query, one or more words
+
+        Return:
+        pandas dataframe of the matching rows, in the order of the table
+        """
+        # the index and the dataframe are read together, another thread may add or delete rows in between
+        with self.storage_lock:
+            version=self.table_versions[table]
+            index=self.index_of(table,f"{column}_tokens")
+            key=("search_words",column," ".join(sorted(index.tokenize(query))))
+            cached=self._cached_result(table,key,version)
+            if cached is not None:
+                return cached
+            frame=getattr(self,self.table_specs[table]['frame'])
+            return self._cache_result(table,key,version,frame.loc[sorted(index.search(query))])
+
+    # rows of a table whose isbn/id contains a partial number
+    def search_digits(self,table,column,digits):
+        """
+        Partial number search answered by the digit n-gram index of the column, only the rows having
+        every 3 digits of the partial number are checked. Shorter numbers use search_rows
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        column, a column with an n-gram index, "isbn" or "id"
+        digits, the whole or partial number, without the "isbn"/"id" prefix
+
+        Return:
+        pandas dataframe of the matching rows, in the order of the table
+        """
+        digits=str(digits).strip()
+        # the index and the dataframe are read together, another thread may add or delete rows in between
+        with self.storage_lock:
+            version=self.table_versions[table]
+            index=self.index_of(table,f"{column}_digits")
+            if len(digits)<index.n:
+                # one or two digits match most of the table, a vectorized scan is faster than the index
+                return self.search_rows(table,column,digits)
+            key=("search_digits",column,digits)
+            cached=self._cached_result(table,key,version)
+            if cached is not None:
+                return cached
+            frame=getattr(self,self.table_specs[table]['frame'])
+            return self._cache_result(table,key,version,frame.loc[sorted(index.search(digits))])
+
+    # rows whose name is within a few typos of a query
+    def search_similar(self,table,column,query,max_distance=None):
+        """
+        Typo tolerant search over the whole names of a column, answered by the BK-tree of its distinct names
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        column, a column with a fuzzy index, "Author" or "Name"
+        query, the name, possibly misspelled
+        max_distance, largest number of typos, defaults to fuzzy_max_distance
+
+        Return:
+        pandas dataframe of the matching rows with an extra "distance" column, closest names first
+        """
+        if max_distance is None:
+            max_distance=self.fuzzy_max_distance
+        # the index and the dataframe are read together, another thread may add or delete rows in between
+        with self.storage_lock:
+            version=self.table_versions[table]
+            index=self.index_of(table,f"{column}_fuzzy")
+            key=("search_similar",column,normalize(query),max_distance)
+            cached=self._cached_result(table,key,version)
+            if cached is not None:
+                return cached
+            frame=getattr(self,self.table_specs[table]['frame'])
+            matches=index.search(query,max_distance)
+            labels=[]
+            distances=[]
+            for distance,name,name_labels in matches:
+                labels.extend(sorted(name_labels))
+                distances.extend([distance]*len(name_labels))
+            output=frame.loc[labels].copy()
+            output['distance']=distances
+            return self._cache_result(table,key,version,output)
+
+    # new unique isbn/id values
+    def allocate_keys(self,table,count=1):
+        """
+        Hands out count new keys for the table, none of them in the table or handed out before.
+        Keys are checked against the key index, so the cost does not grow with the size of the table.
+        A key stays reserved until its row is added with insert_row/insert_rows
+
+        Params:
+        table, a table with "generated_key" in table_specs, "books" or "users"
+        count, number of keys needed
+
+        Return:
+        list of keys, example ["isbn6865062031291"]
+        """
+        with self.key_allocators_lock:
+            if table not in self.key_allocators:
+                prefix,digit_count=self.table_specs[table]['generated_key']
+                # the key index is looked up on every call, it is rebuilt when the whole dataframe is replaced
+                self.key_allocators[table]=KeyAllocator(prefix,digit_count,
+                                                        lambda key: self._key_label(table,(key,)) is not None)
+        return self.key_allocators[table].allocate(count)
+
+    # forgets the reservation of keys added to the table
+    def _release_keys(self,table,keys):
+        # never called while holding storage_lock: allocate holds the allocator lock while it looks up
+        # the key index, and building that index takes storage_lock
+        if table in self.key_allocators:
+            self.key_allocators[table].release(keys)
+
+    # rows of a table breaking the validation rules of their columns
+    def integrity_report(self,table):
+        """
+        Validates every column listed under "validation" of the table in one vectorized pass per column,
+        with the same rules used when adding a book or a user
+
+        Params:
+        table, one among the keys of table_specs, type=string
+
+        Return:
+        pandas dataframe with the key columns of every invalid value, its column, the value and the reason,
+        empty if the whole table is valid
+        """
+        spec=self.table_specs[table]
+        frame=getattr(self,spec['frame'])
+        reports=[]
+        for column,kind in spec.get('validation',{}).items():
+            values,reasons=self.validate_column(kind,frame[column])
+            invalid=reasons!=""
+            if invalid.any():
+                report=frame.loc[invalid,spec['key']].copy()
+                report['column']=column
+                report['value']=frame.loc[invalid,column]
+                report['reason']=reasons[invalid]
+                reports.append(report)
+        if not reports:
+            return pd.DataFrame(columns=spec['key']+['column','value','reason'])
+        return pd.concat(reports,ignore_index=True)
+
+    # rows found by every one of several searches, one page of them
+    def combine_results(self,table,outputs,limit=None,offset=0):
+        """
+        Params:
+        table, one among the keys of table_specs, type=string
+        outputs, list of dataframes returned by the search methods, all the rows of the table if empty
+        limit, max number of rows returned, None for all of them
+        offset, number of matching rows skipped, used with limit to go page by page
+
+        Return:
+        QueryResult, rows in the order of the first search
+
+        Raises:
+        ValueError if limit or offset is negative
+        """
+        if (limit is not None and limit<0) or offset<0:
+            raise ValueError("limit and offset cannot be negative")
+        spec=self.table_specs[table]
+        if not outputs:
+            outputs=[getattr(self,spec['frame'])]
+        matches=outputs[0]
+        for output in outputs[1:]:
+            # the searches may come from the database, rows are matched by key and not by dataframe label
+            keys=set(zip(*[output[column] for column in spec['key']]))
+            in_output=[key in keys for key in zip(*[matches[column] for column in spec['key']])]
+            matches=matches[pd.Series(in_output,index=matches.index,dtype=bool)]
+        end=None if limit is None else offset+limit
+        rows=matches.iloc[offset:end].reset_index(drop=True)
+        return QueryResult(rows,len(matches),offset,limit)
+
+    # adds a new row
+    def insert_row(self,table,row):
+        """
+        Appends a row to the dataframe of the table and persists it
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        row, dict of column -> value
+        """
+        spec=self.table_specs[table]
+        with self.storage_lock:
+            frame=getattr(self,spec['frame'])
+            indexes=self.indexes_of(table)
+            # labels only grow, so the new row gets the one after the last and existing labels stay valid
+            label=frame.index[-1]+1 if len(frame) else 0
+            new_row=pd.DataFrame({column:[str(row[column])] for column in spec['columns']},index=[label])
+            self._replace_frame(table,pd.concat([frame,new_row]),indexes)
+            if indexes is not None:
+                for index in indexes.values():
+                    index.add(label,row)
+            self.record_change(table,"insert",tuple(row[column] for column in spec['key']),row)
+        self._release_keys(table,[str(row[spec['key'][0]])])
+
+    # adds many rows at once
+    def insert_rows(self,table,rows):
+        """
+        Appends all the rows to the dataframe of the table with a single concat and persists them with a single write
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        rows, dataframe with the columns of the table
+        """
+        spec=self.table_specs[table]
+        if rows.empty:
+            return
+        rows=rows[spec['columns']].astype(str)
+        with self.storage_lock:
+            frame=getattr(self,spec['frame'])
+            # the indexes are rebuilt on the next lookup, one build is cheaper than adding the rows one by one
+            setattr(self,spec['frame'],pd.concat([frame,rows],ignore_index=True))
+            if self.sqlite_store is not None:
+                self.sqlite_store.import_frame(table,rows,replace=False)
+            elif len(rows)>=self.journal_compaction_threshold:
+                self.compact_table(table)
+            else:
+                records=rows.to_dict('records')
+                entries=[{"op":"insert","key":[row[column] for column in spec['key']],"row":row} for row in records]
+                self.persist_changes(table,entries)
+        self._release_keys(table,rows[spec['key'][0]].tolist())
+
+    # changes some columns of an existing row
+    def update_row(self,table,key,values):
+        """
+        Updates the given columns of the row with the given key and persists it
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        key, value of the key column, tuple of values if the table has multiple key columns
+        values, dict of column -> new value
+
+        Return:
+        False if no row has the key, True otherwise
+        """
+        spec=self.table_specs[table]
+        if not isinstance(key,(tuple,list)):
+            key=(key,)
+        with self.storage_lock:
+            frame=getattr(self,spec['frame'])
+            label=self._key_label(table,key)
+            if label is None:
+                logging.error("row to update not found")
+                return False
+            indexes=self.indexes_of(table)
+            old_row=frame.loc[label].to_dict()
+            for column,value in values.items():
+                frame.at[label,column]=str(value)
+            row=frame.loc[label].to_dict()
+            if indexes is not None:
+                for index in indexes.values():
+                    index.remove(label,old_row)
+                    index.add(label,row)
+            self.record_change(table,"update",key,row)
+            return True
+
+    # removes a row
+    def delete_row(self,table,key):
+        """
+        Removes the row with the given key from the dataframe of the table and persists it
+
+        Params:
+        table, one among the keys of table_specs, type=string
+        key, value of the key column, tuple of values if the table has multiple key columns
+
+        Return:
+        False if no row has the key, True otherwise
+        """
+        spec=self.table_specs[table]
+        if not isinstance(key,(tuple,list)):
+            key=(key,)
+        with self.storage_lock:
+            frame=getattr(self,spec['frame'])
+            label=self._key_label(table,key)
+            if label is None:
+                logging.error("row to delete not found")
+                return False
+            indexes=self.indexes_of(table)
+            row=frame.loc[label].to_dict()
+            # labels of the remaining rows are kept, so the indexes stay valid
+            self._replace_frame(table,frame.drop(index=label),indexes)
+            if indexes is not None:
+                for index in indexes.values():
+                    index.remove(label,row)
+            self.record_change(table,"delete",key)
+            return True
+
 import os
 if __name__=="__main__":
     obj=StorageManager()
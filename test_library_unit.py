@@ -0,0 +1,356 @@
+from library_manager import LibraryManager
+import unittest
+import tempfile
+import shutil
+import os
+import pandas as pd
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+import random
+import sys
+import threading
+
+
+class TestLibrary(unittest.TestCase):
+    def setUp(self):
+        # work on a copy of the .csv files so the real ones are never touched
+        self.data_dir=tempfile.mkdtemp()
+        for csv_name in ['Books_csv.csv','Users_csv.csv']:
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)),csv_name),self.data_dir)
+        LibraryManager._instance=None
+        self.library=LibraryManager(self.data_dir)
+
+    def tearDown(self):
+        LibraryManager._instance=None
+        shutil.rmtree(self.data_dir)
+
+    def reload(self):
+        LibraryManager._instance=None
+        self.library=LibraryManager(self.data_dir)
+
+    def test_bulk_import_books(self):
+        import_file=os.path.join(self.data_dir,'new_books.csv')
+        pd.DataFrame({'title':['Dune','  Emma ','x','Dune','Robinson Crusoe'],
+                      'Author':['Frank Herbert','Jane Austen','someone','frank  herbert','Daniel Defoe']}).to_csv(import_file,index=False)
+        books_before=len(self.library.books_df)
+        summary=self.library.bulk_import_books(import_file)
+        self.assertEqual(summary['imported'],2)
+        self.assertEqual(summary['rejected'],3)
+        report=pd.read_csv(summary['error_report'])
+        self.assertEqual(report['reason'].tolist(),['title_too_short','duplicate_in_file','already_in_library'])
+        self.assertEqual(report['line'].tolist(),[4,5,6])
+
+        self.reload()
+        self.assertEqual(len(self.library.books_df),books_before+2)
+        self.assertTrue(self.library.check_if_book_exists_using_title_author('emma','jane austen'))
+        self.assertEqual(self.library.books_df['isbn'].nunique(),len(self.library.books_df))
+        # a book stored before titles were normalized is found whatever its case and spacing
+        self.library.insert_row('books',{'isbn':'isbn1111111111111','Title':'The Hobbit','Author':'John  Tolkien'})
+        pd.DataFrame({'title':['the hobbit'],'Author':['john tolkien']}).to_csv(import_file,index=False)
+        self.assertEqual(self.library.bulk_import_books(import_file)['rejected'],1)
+
+    def test_bulk_import_users(self):
+        import_file=os.path.join(self.data_dir,'new_users.csv')
+        pd.DataFrame({'Name':['Ada Lovelace','R2D2','grace hopper']}).to_csv(import_file,index=False)
+        summary=self.library.bulk_import_users(import_file)
+        self.assertEqual((summary['imported'],summary['rejected']),(2,1))
+        self.reload()
+        self.assertEqual(len(self.library.find_rows('users',Name='ada lovelace')),1)
+
+    def test_autocomplete(self):
+        library=self.library
+        self.assertEqual(library.autocomplete("Alice "),['alice in wonderland'])
+        self.assertEqual(library.autocomplete("a",k=1),['alice in wonderland'])
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'alice through the looking glass','Author':'lewis carroll'})
+        self.assertEqual(library.autocomplete("alice"),['alice in wonderland','alice through the looking glass'])
+        library.update_row('books','isbn1111111111111',{'Title':'dune'})
+        self.assertEqual(library.autocomplete("alice"),['alice in wonderland'])
+        self.assertEqual(library.autocomplete("lew",column="Author"),['lewis carroll'])
+
+    def test_find_books_and_users(self):
+        library=self.library
+        result=library.find_books(title="Robinson")
+        self.assertEqual((result.total,result.rows['isbn'].tolist()),(1,['isbn6865062091293']))
+        self.assertEqual(library.find_books(author="daniel",isbn_fragment="isbn686506209").total,1)
+        self.assertEqual(library.find_books(author="agata christi").total,0)
+        self.assertEqual(library.find_books(author="agata christi",typo_tolerant=True).rows['Author'].tolist(),['agatha christie'])
+        # pages of the whole catalog
+        first=library.find_books(limit=2)
+        second=library.find_books(limit=2,offset=2)
+        self.assertEqual((len(first),first.total,first.has_more),(2,len(library.books_df),True))
+        self.assertEqual(first.rows['isbn'].tolist()+second.rows['isbn'].tolist(),library.books_df['isbn'].head(4).tolist())
+        with self.assertRaises(ValueError):
+            library.find_books(isbn_fragment="12a")
+        with self.assertRaises(ValueError):
+            library.find_books(title=" ")
+        users=library.find_users(id_fragment="293310818")
+        self.assertEqual(users.to_records()[0]['Borrowed'],'isbn6865062031291-isbn6865062091293-isbn6865062081294')
+        self.assertEqual(library.find_users(name="jon jobb",typo_tolerant=True).total,1)
+
+    def test_book_on_loan_is_not_deleted(self):
+        library=self.library
+        self.assertEqual(library.holders_of('isbn6865062031291'),['id293310818420656'])
+        self.assertEqual(library.holders_of('isbn1111111111111'),[])
+        with patch('builtins.input',return_value='isbn6865062031291'):
+            library.delete_a_book_based_on_isbn()
+        self.assertTrue(library.row_exists('books',isbn='isbn6865062031291'))
+        library.return_book_internal('id293310818420656','isbn6865062031291')
+        self.assertEqual(library.holders_of('isbn6865062031291'),[])
+        with patch('builtins.input',return_value='isbn6865062031291'):
+            library.delete_a_book_based_on_isbn()
+        self.assertFalse(library.row_exists('books',isbn='isbn6865062031291'))
+
+    def test_duplicate_book_not_added(self):
+        library=self.library
+        books=len(library.books_df)
+        for title,author in [('the firm','john grisham'),('The  Firm ','John Grisham')]:
+            with patch('builtins.input',side_effect=[title,author]),contextlib.redirect_stdout(io.StringIO()):
+                self.assertFalse(library.add_a_book())
+        self.assertEqual(len(library.books_df),books)
+        with patch('builtins.input',side_effect=['the pelican brief','john grisham']),contextlib.redirect_stdout(io.StringIO()):
+            library.add_a_book()
+        self.assertTrue(library.row_exists('books',Title='the pelican brief',Author='john grisham'))
+        # several terminals adding the same book at once add it once
+        answers=lambda prompt: 'the hobbit' if 'title' in prompt else 'john tolkien'
+        with patch('builtins.input',side_effect=answers),contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(lambda terminal: library.add_a_book(),range(4)))
+        self.assertEqual(len(library.find_rows('books',Title='the hobbit',Author='john tolkien')),1)
+        self.assertTrue(library.check_if_book_exists_using_title_author('The Hobbit','John Tolkien'))
+        # the refused adds did not keep an isbn reserved
+        self.assertFalse(library.key_allocators['books'].reserved)
+
+    def test_circulate_batch(self):
+        library=self.library
+        user='id293310818420656'
+        operations=[("return",user,'isbn6865062031291'),("return",user,'isbn6865062031291'),
+                    ("borrow",user,'isbn6865062031291'),("borrow",user,'isbn6865062031291'),
+                    ("borrow",'id000000000000000','isbn6865062031291'),("renew",user,'isbn6865062031291')]
+        journal=library.journals['loans']
+        # one write for the whole batch
+        with patch.object(journal,'append',wraps=journal.append) as append:
+            outcomes=library.circulate_batch(operations)
+        self.assertEqual(append.call_count,1)
+        self.assertEqual([outcome['outcome'] for outcome in outcomes],
+                         ['returned','not_borrowed','borrowed','already_borrowed','unknown_user','unknown_action'])
+        isbns=library.generate_unique_isbns(12)
+        library.insert_rows('books',pd.DataFrame({'isbn':isbns,'Title':['emma']*12,'Author':['jane austen']*12}))
+        outcomes=library.circulate_batch([("borrow",user,isbn) for isbn in isbns[:12]])
+        self.assertEqual(len(library.all_borrowed_book(user)),10)
+        self.assertEqual(outcomes[-1]['outcome'],'cap_reached')
+        self.reload()
+        self.assertEqual(len(self.library.all_borrowed_book(user)),10)
+
+    def test_multiple_copies(self):
+        library=self.library
+        isbn='isbn6865062031291'
+        self.assertEqual((library.copies_of(isbn),library.on_loan_count(isbn),library.available_count(isbn)),(1,1,0))
+        self.assertEqual(library.borrow_refusal('id345094123887559',isbn),'not_available')
+        self.assertEqual(library.borrow_refusal('id345094123887559','isbn0000000000000'),'unknown_book')
+        self.assertNotIn(isbn,library.available_books()['isbn'].tolist())
+        self.assertTrue(library.set_copies(isbn,3))
+        library.borrow_book_internal('id345094123887559',isbn)
+        self.assertEqual((library.on_loan_count(isbn),library.available_count(isbn)),(2,1))
+        self.assertFalse(library.set_copies(isbn,1))
+        self.reload()
+        books=self.library.available_books().set_index('isbn')
+        self.assertEqual(books.loc[isbn,['copies','on_loan','available']].tolist(),[3,2,1])
+
+    def test_concurrent_circulation(self):
+        library=self.library
+        users=library.generate_unique_ids(30)
+        library.insert_rows('users',pd.DataFrame({'id':users,'Name':['ann']*30,'Borrowed':[' ']*30}))
+        isbns=library.books_df['isbn'].tolist()
+        for isbn in isbns:
+            library.set_copies(isbn,4)
+        loans_before=len(library.loans_df)
+
+        def desk_terminal(seed):
+            generator=random.Random(seed)
+            changes=0
+            for step in range(300):
+                user,isbn=generator.choice(users),generator.choice(isbns)
+                if generator.random()<0.6:
+                    changes+=library.borrow_book_internal(user,isbn) is not False
+                else:
+                    changes-=library.return_book_internal(user,isbn) is not False
+            return changes
+
+        def drop_box(seed):
+            # batches of borrows and returns, racing the single borrows and returns of the desk terminals
+            generator=random.Random(seed)
+            changes=0
+            for step in range(60):
+                batch=[(generator.choice(["borrow","return"]),generator.choice(users),generator.choice(isbns)) for item in range(5)]
+                for outcome in library.circulate_batch(batch):
+                    changes+={"borrowed":1,"returned":-1}.get(outcome["outcome"],0)+len(outcome.get("lent_to",()))
+            return changes
+
+        def add_books(seed):
+            for isbn in library.generate_unique_isbns(20):
+                library.insert_row('books',{'isbn':isbn,'Title':f'book {seed}','Author':'anonymous'})
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                desks=pool.map(desk_terminal,range(8))
+                drop_boxes=pool.map(drop_box,range(8,12))
+                changes=sum(desks)+sum(drop_boxes)
+                list(pool.map(add_books,range(4)))
+        self.assertEqual(len(library.loans_df),loans_before+changes)
+        for isbn in isbns:
+            self.assertLessEqual(library.on_loan_count(isbn),4)
+            for user in library.loans_by_isbn.get(isbn,()):
+                self.assertIn(isbn,library.loans_by_user[user])
+        self.assertTrue(all(len(books)<=10 for books in library.loans_by_user.values()))
+        self.assertEqual(len(library.books_df),len(isbns)+80)
+        self.assertEqual(library.books_df['isbn'].nunique(),len(isbns)+80)
+        # the journals hold exactly the state in memory
+        loans=sorted(map(tuple,library.loans_df.values.tolist()))
+        self.reload()
+        self.assertEqual(sorted(map(tuple,self.library.loans_df.values.tolist())),loans)
+        self.assertEqual(len(self.library.books_df),len(isbns)+80)
+
+    def test_concurrent_search(self):
+        library=self.library
+        # every search reads the index and the dataframe, none is answered from the cache
+        library.query_cache.max_entries=0
+        isbns=library.generate_unique_isbns(200)
+        library.insert_rows('books',pd.DataFrame({'isbn':isbns,'Title':[f'dune part {i}' for i in range(200)],'Author':['frank herbert']*200}))
+
+        def desk_terminal(seed):
+            generator=random.Random(seed)
+            while not clerks_done.is_set():
+                library.find_books(title=generator.choice(['dune','part']),author=generator.choice(['frank','herbet']),typo_tolerant=True)
+                library.search_digits('books','isbn',generator.choice(isbns)[4:10])
+
+        clerks_done=threading.Event()
+
+        def clerk(seed):
+            for isbn in isbns[seed::4]:
+                library.delete_row('books',isbn)
+                library.insert_row('books',{'isbn':isbn,'Title':'dune again','Author':'frank herbert'})
+
+        # switching threads very often makes a search meet a half done change
+        switch_interval=sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                desks=pool.map(desk_terminal,range(4))
+                clerks=pool.map(clerk,range(4))
+                # an exception in any terminal is raised again here
+                try:
+                    list(clerks)
+                finally:
+                    clerks_done.set()
+                list(desks)
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(len(library.find_books(title='dune again',limit=500)),200)
+        # a book added while a search is between its index and the dataframe waits for the search to end
+        index=library.index_of('books','Title_tokens')
+        search=index.search
+        clerk=threading.Thread(target=library.insert_row,args=('books',{'isbn':'isbn1111111111111','Title':'dune again','Author':'frank herbert'}))
+        def search_while_adding(query):
+            clerk.start()
+            clerk.join(0.5)
+            return search(query)
+        index.search=search_while_adding
+        self.assertEqual(len(library.search_words('books','Title','dune again')),200)
+        index.search=search
+        clerk.join()
+        self.assertEqual(len(library.search_words('books','Title','dune again')),201)
+
+    def test_due_dates(self):
+        library=self.library
+        user='id345094123887559'
+        library.add_loan(user,'isbn6865662091295',borrowed_at='2026-01-01T10:00:00')
+        library.add_loan(user,'isbn6865062090296',borrowed_at='2026-01-10T10:00:00')
+        self.assertEqual(library.loans_by_user[user]['isbn6865662091295'],'2026-01-01T10:00:00')
+        self.assertEqual(library.overdue_loans('2026-01-16T00:00:00')['isbn'].tolist(),['isbn6865662091295'])
+        self.assertEqual(library.overdue_loans('2026-02-01T00:00:00')['due_at'].tolist(),['2026-01-15T10:00:00','2026-01-24T10:00:00'])
+        self.assertEqual(library.loans_due_within(10,'2026-01-16T00:00:00')['isbn'].tolist(),['isbn6865062090296'])
+        # the migrated loans have no due date
+        self.assertEqual(len(library.overdue_loans()),2)
+        due_at=library.renew_book_internal(user,'isbn6865662091295')
+        self.assertEqual(library.overdue_loans()['isbn'].tolist(),['isbn6865062090296'])
+        library.return_book_internal(user,'isbn6865062090296')
+        self.assertTrue(library.overdue_loans().empty)
+        self.assertFalse(library.renew_book_internal(user,'isbn6865062090296'))
+        self.reload()
+        self.assertEqual(self.library.loans_df.set_index('isbn').loc['isbn6865662091295','due_at'],due_at)
+        self.assertTrue(self.library.overdue_loans().empty)
+
+    def test_holds(self):
+        library=self.library
+        isbn='isbn6865062031291'
+        holder='id293310818420656'
+        users=library.generate_unique_ids(3)
+        library.insert_rows('users',pd.DataFrame({'id':users,'Name':['ann','bob','cy'],'Borrowed':[' ']*3}))
+        self.assertEqual(library.place_hold(holder,isbn),'already_borrowed')
+        self.assertEqual(library.place_hold(users[0],'isbn6865662091295'),'available')
+        for user in users:
+            self.assertEqual(library.place_hold(user,isbn),'on_hold')
+        self.assertEqual(library.place_hold(users[0],isbn),'already_on_hold')
+        self.assertTrue(library.cancel_hold(users[2],isbn))
+        self.assertEqual(library.hold_queue(isbn),users[:2])
+        self.assertFalse(library.renew_book_internal(holder,isbn))
+        # the first user of the queue is at the cap of 10 books, the copy goes to the next one
+        books=library.generate_unique_isbns(10)
+        library.insert_rows('books',pd.DataFrame({'isbn':books,'Title':['emma']*10,'Author':['jane austen']*10}))
+        library.circulate_batch([("borrow",users[0],book) for book in books])
+        self.reload()
+        library=self.library
+        self.assertEqual(library.hold_queue(isbn),users[:2])
+        self.assertEqual(library.holds_of(users[1]),[isbn])
+        library.return_book_internal(holder,isbn)
+        self.assertEqual(library.holders_of(isbn),[users[1]])
+        self.assertEqual(library.hold_queue(isbn),[users[0]])
+        library.return_book_internal(users[0],books[0])
+        outcomes=library.circulate_batch([("return",users[1],isbn)])
+        self.assertEqual(outcomes[0]['lent_to'],[users[0]])
+        self.assertEqual(library.hold_queue(isbn),[])
+        self.reload()
+        self.assertEqual(self.library.holders_of(isbn),[users[0]])
+        self.assertEqual(self.library.holds_of(users[0]),[])
+
+    def test_event_log(self):
+        library=self.library
+        users=library.generate_unique_ids(3)
+        library.insert_rows('users',pd.DataFrame({'id':users,'Name':['ann','bob','cy'],'Borrowed':[' ']*3}))
+        free_books=['isbn6865662091295','isbn6865062090296']
+        # the first borrows after the log is started, the loans migrated from the Borrowed column are logged once before them
+        library.borrow_book_internal(users[0],free_books[0])
+        first_events=[event['event'] for event in library.circulation_events()]
+        self.assertEqual(first_events,['existing_loan']*5+['borrow'])
+        self.assertEqual(library.replay_circulation().current_loans(),library.loans_by_user)
+        library.return_book_internal(users[0],free_books[0])
+        library.event_log.max_bytes=1000
+        for user in users:
+            library.circulate_batch([("borrow",user,isbn) for isbn in free_books])
+            library.set_copies('isbn6865662091295',library.copies_of('isbn6865662091295')+1)
+            library.set_copies('isbn6865062090296',library.copies_of('isbn6865062090296')+1)
+        library.return_book_internal(users[0],free_books[0])
+        library.renew_book_internal(users[1],free_books[1])
+        self.assertGreater(len(library.event_log.files()),1)
+        events=list(library.circulation_events())
+        self.assertEqual([event['event'] for event in events].count('borrow'),7)
+        self.assertEqual(events[-1]['event'],'renew')
+        self.assertEqual(events,sorted(events,key=lambda event: event['at']))
+        # the loans made before the log, migrated from the Borrowed column, are replayed too
+        current=lambda loans: {user:set(books) for user,books in loans.items() if books}
+        self.assertIn('existing_loan',[event['event'] for event in events])
+        self.assertEqual(current(library.replay_circulation().current_loans()),current(library.loans_by_user))
+        self.assertIn('id293310818420656',library.replay_circulation().current_loans())
+        self.assertEqual(library.loans_per_day()['loans'].sum(),7)
+        per_title=library.loans_per_title()
+        self.assertEqual(dict(zip(per_title['isbn'],per_title['loans'])),{'isbn6865662091295':4,'isbn6865062090296':3})
+        self.assertEqual(list(library.circulation_events(since=events[-1]['at'])),[events[-1]])
+        # the baseline is written once, when the log is created
+        self.reload()
+        self.assertEqual(list(self.library.circulation_events()),events)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -61,5 +61,24 @@ class TestBook(unittest.TestCase):
         self.assertFalse(result)
         result=self.utiles_obj.validate_choice_and_available_choices('4',['1','2 ','3'])
         self.assertFalse(result)
+
+    def test_validate_column(self):
+        values=pd.Series(["ISBN6865062031291"," isbn686506203129","isbn68650620312a1","book6865062031291",""])
+        isbns,reasons=self.utiles_obj.validate_column("isbn",values)
+        self.assertEqual(isbns[0],"isbn6865062031291")
+        self.assertEqual(reasons.tolist(),["","wrong_length","not_digits","wrong_prefix","empty"])
+        ids,reasons=self.utiles_obj.validate_column("id",pd.Series(["id293310818420656","id29331081842065"]))
+        self.assertEqual(reasons.tolist(),["","wrong_length"])
+        # the same result as validating one value at a time
+        names=pd.Series(["dan. Brown.","  da.n     Brown ","Jüne","O'Neil","A"*256,"r2d2","x"])
+        normalized,reasons=self.utiles_obj.validate_column("name",names)
+        for name,value,reason in zip(names,normalized,reasons):
+            expected=self.utiles_obj.validate_name(name)
+            self.assertEqual(reason=="",expected is not False)
+            if reason=="":
+                self.assertEqual(value,expected)
+        with self.assertRaises(ValueError):
+            self.utiles_obj.validate_column("isbn13",values)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,326 @@
+from library_manager import LibraryManager
+import unittest
+import tempfile
+import shutil
+import os
+import threading
+import time
+import pandas as pd
+
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        # work on a copy of the .csv files so the real ones are never touched
+        self.data_dir=tempfile.mkdtemp()
+        for csv_name in ['Books_csv.csv','Users_csv.csv']:
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)),csv_name),self.data_dir)
+        self.library=self.new_library()
+
+    def tearDown(self):
+        self.new_library()
+        LibraryManager._instance=None
+        shutil.rmtree(self.data_dir)
+
+    def new_library(self,backend="csv"):
+        # singleton, so the previous instance is released before creating the next one
+        if LibraryManager._instance is not None and LibraryManager._instance.sqlite_store is not None:
+            LibraryManager._instance.sqlite_store.close()
+        LibraryManager._instance=None
+        return LibraryManager(self.data_dir,backend)
+
+    def test_journal_replay(self):
+        books_csv=os.path.join(self.data_dir,'Books_csv.csv')
+        csv_before=open(books_csv).read()
+        new_book=pd.DataFrame({'isbn':['isbn1111111111111'],'Title':['dune'],'Author':['frank herbert']})
+        self.library.books_df=pd.concat([self.library.books_df,new_book],ignore_index=True)
+        self.library.save_book_df_to_csv("insert",'isbn1111111111111')
+        self.library.books_df.loc[self.library.books_df['isbn']=='isbn1111111111111','Title']='dune messiah'
+        self.library.save_book_df_to_csv("update",'isbn1111111111111')
+        self.library.books_df=self.library.books_df[self.library.books_df['isbn']!='isbn6865062031291']
+        self.library.save_book_df_to_csv("delete",'isbn6865062031291')
+        # the .csv file is untouched, only the journal grew
+        self.assertEqual(open(books_csv).read(),csv_before)
+
+        library=self.new_library()
+        books=library.books_df.set_index('isbn')
+        self.assertEqual(books.loc['isbn1111111111111','Title'],'dune messiah')
+        self.assertNotIn('isbn6865062031291',books.index)
+
+        # compaction folds the journal into the .csv file
+        library.compact_all_tables()
+        self.assertFalse(os.path.exists(books_csv+".journal"))
+        library=self.new_library()
+        self.assertEqual(len(library.books_df),len(books))
+
+    def test_user_update_is_journaled(self):
+        user_id='id293310818420656'
+        self.library.users_df.loc[self.library.users_df['id']==user_id,'Name']='jane job'
+        self.library.save_user_df_to_csv("update",user_id)
+        library=self.new_library()
+        self.assertEqual(library.users_df.set_index('id').loc[user_id,'Name'],'jane job')
+
+    def test_sqlite_backend(self):
+        library=self.new_library("sqlite")
+        # the .csv files are migrated into the database the first time
+        self.assertEqual(len(library.books_df),len(self.library.books_df))
+        self.assertTrue(library.check_if_book_exists_using_isbn('isbn6865062031291'))
+        self.assertTrue(library.check_if_book_exists_using_title_author('robinson crusoe','daniel defoe'))
+        self.assertFalse(library.check_if_book_exists_using_isbn('isbn0000000000000'))
+        self.assertEqual(len(library.search_rows('books','Title','crusoe')),1)
+
+        library.borrow_book_internal('id345094123887559','isbn6865662091295')
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'dune','Author':'frank herbert'})
+        library.delete_row('books','isbn6865062091293')
+        library=self.new_library("sqlite")
+        self.assertEqual(library.all_borrowed_book('id345094123887559'),['isbn6865662091295'])
+        self.assertTrue(library.check_if_book_exists_using_isbn('isbn1111111111111'))
+        self.assertFalse(library.check_if_book_exists_using_isbn('isbn6865062091293'))
+
+    def test_users_loaded_lazily(self):
+        library=self.new_library()
+        self.assertNotIn('users',library.load_timings)
+        self.assertIn('users: not loaded yet',library.startup_report())
+        self.assertEqual(library.all_borrowed_book('id345094123887559'),[])
+        self.assertIn('users',library.load_timings)
+
+    def test_snapshot_used_until_csv_changes(self):
+        # setUp built the snapshot from the .csv file, so it is loaded from now on
+        library=self.new_library()
+        self.assertIn('snapshot_load',library.load_timings['books'])
+        self.assertTrue(library.books_df.equals(self.library.books_df))
+
+        # editing the .csv file by hand makes the snapshot stale, it is rebuilt from the .csv file
+        books_csv=os.path.join(self.data_dir,'Books_csv.csv')
+        with open(books_csv,'a') as csv_file:
+            csv_file.write('isbn2222222222222,emma,jane austen\n')
+        library=self.new_library()
+        self.assertIn('csv_read',library.load_timings['books'])
+        self.assertIn('isbn2222222222222',library.books_df['isbn'].tolist())
+        library=self.new_library()
+        self.assertIn('snapshot_load',library.load_timings['books'])
+        self.assertIn('isbn2222222222222',library.books_df['isbn'].tolist())
+
+    def test_streaming_load(self):
+        LibraryManager.streaming_threshold_bytes=0
+        LibraryManager.use_snapshots=False
+        try:
+            library=self.new_library()
+            streamed=library.stream_table_csv('books',lambda chunk: self.assertLessEqual(len(chunk),2),memory_budget_bytes=200)
+            self.assertEqual(streamed['rows'],len(self.library.books_df))
+            self.assertTrue(library.books_df.equals(self.library.books_df))
+            # the indexes were built chunk by chunk while reading
+            self.assertEqual(set(library.row_indexes['books']),{'key'}|set(library.table_specs['books']['memory_indexes']))
+            self.assertEqual(library.search_words('books','Title','robinson')['Title'].tolist(),['robinson crusoe'])
+            self.assertEqual(library.find_rows('books',isbn='isbn6865062090296')['Title'].tolist(),['the firm'])
+            self.assertEqual(library.autocomplete('the f'),['the firm'])
+            LibraryManager.use_snapshots=True
+            self.new_library()
+            library=self.new_library()
+            self.assertIn('snapshot_load',library.load_timings['books'])
+            self.assertTrue(library.books_df.equals(self.library.books_df))
+            library=self.new_library("sqlite")
+            self.assertEqual(len(library.books_df),len(self.library.books_df))
+            self.assertIn('books',library.ingest_stats)
+        finally:
+            del LibraryManager.streaming_threshold_bytes
+            del LibraryManager.use_snapshots
+
+    def test_write_behind(self):
+        journal=os.path.join(self.data_dir,'Loans_csv.csv.journal')
+        for book_id in ['isbn6865062031291','isbn6865065091292','isbn6865062091293']:
+            self.library.set_copies(book_id,2)
+        self.library.enable_write_behind(interval_ms=60000,max_mutations=1000)
+        for book_id in ['isbn6865062031291','isbn6865065091292','isbn6865062091293']:
+            self.library.borrow_book_internal('id345094123887559',book_id)
+        self.library.return_book_internal('id345094123887559','isbn6865062091293')
+        self.library.borrow_book_internal('id345094123887559','isbn6865062091293')
+        # nothing written yet, the changes of the same loan are coalesced into one change
+        self.assertFalse(os.path.exists(journal))
+        self.assertEqual(len(self.library.pending_changes['loans']),3)
+        with self.assertRaises(SystemExit):
+            self.library.Exit()
+        self.assertEqual(len(open(journal).readlines()),3)
+        self.library.disable_write_behind()
+        library=self.new_library()
+        self.assertEqual(len(library.all_borrowed_book('id345094123887559')),3)
+
+    def test_loans_migrated_from_borrowed_column(self):
+        loans_csv=os.path.join(self.data_dir,'Loans_csv.csv')
+        self.assertEqual(self.library.all_borrowed_book('id293310818420656'),['isbn6865062031291','isbn6865062091293','isbn6865062081294'])
+        self.assertTrue(os.path.exists(loans_csv))
+        self.assertEqual(self.library.loans_by_isbn['isbn6865065091292'],{'id123456789123457'})
+
+        # the Borrowed column is only refreshed when the users table is written
+        self.library.borrow_book_internal('id345094123887559','isbn6865662091295')
+        self.library.compact_all_tables()
+        library=self.new_library()
+        self.assertEqual(len(library.loans_df),len(self.library.loans_df))
+        self.assertEqual(library.users_df.set_index('id').loc['id345094123887559','Borrowed'],'isbn6865662091295')
+        self.assertNotEqual(library.loans_by_user['id345094123887559']['isbn6865662091295'],"")
+
+    def test_loans_file_without_due_dates(self):
+        # a loans file and journal written before the due_at column existed
+        with open(os.path.join(self.data_dir,'Loans_csv.csv'),'w') as loans_file:
+            loans_file.write('user_id,isbn,borrowed_at\nid345094123887559,isbn6865062031291,2026-01-01T10:00:00\n')
+        with open(os.path.join(self.data_dir,'Loans_csv.csv.journal'),'w') as journal:
+            journal.write('{"op": "insert", "key": ["id345094123887559", "isbn6865065091292"], "row": {"user_id": "id345094123887559", "isbn": "isbn6865065091292", "borrowed_at": ""}}\n')
+        library=self.new_library()
+        self.assertEqual(library.loans_df['due_at'].tolist(),['',''])
+        self.assertEqual(pd.read_csv(os.path.join(self.data_dir,'Loans_csv.csv')).columns.tolist(),['user_id','isbn','borrowed_at','due_at'])
+
+    def test_write_behind_flushes_after_max_mutations(self):
+        library=self.new_library("sqlite")
+        library.enable_write_behind(interval_ms=60000,max_mutations=2)
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'dune','Author':'frank herbert'})
+        # reads see the change although it is not in the database yet
+        self.assertTrue(library.check_if_book_exists_using_isbn('isbn1111111111111'))
+        self.assertFalse(library.sqlite_store.row_exists('books',{'isbn':'isbn1111111111111'}))
+        library.insert_row('books',{'isbn':'isbn2222222222222','Title':'emma','Author':'jane austen'})
+        self.assertTrue(library.sqlite_store.row_exists('books',{'isbn':'isbn1111111111111'}))
+        library.disable_write_behind()
+
+    def test_key_index_kept_in_sync(self):
+        library=self.library
+        self.assertTrue(library.row_exists('books',isbn='isbn6865062031291'))
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'dune','Author':'frank herbert'})
+        library.update_row('books','isbn1111111111111',{'Title':'dune messiah'})
+        library.delete_row('books','isbn6865062031291')
+        self.assertIn('books',library.row_indexes)
+        self.assertEqual(library.find_rows('books',isbn='isbn1111111111111')['Title'].tolist(),['dune messiah'])
+        self.assertFalse(library.row_exists('books',isbn='isbn6865062031291'))
+        self.assertEqual(len(library.indexes_of('books')['key']),len(library.books_df))
+        # replacing the dataframe drops the index, it is rebuilt from the new dataframe
+        library.books_df=library.books_df[library.books_df['isbn']!='isbn1111111111111']
+        self.assertNotIn('books',library.row_indexes)
+        self.assertFalse(library.row_exists('books',isbn='isbn1111111111111'))
+
+    def test_word_search(self):
+        library=self.library
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'the robinson family','Author':'frank herbert'})
+        titles=library.search_words('books','Title','Robinson  the')['Title'].tolist()
+        self.assertEqual(titles,['the robinson family'])
+        self.assertIn('robinson crusoe',library.search_words('books','Title','robinson')['Title'].tolist())
+        library.update_row('books','isbn1111111111111',{'Title':'dune'})
+        self.assertEqual(library.search_words('books','Title','family')['Title'].tolist(),[])
+        library.delete_row('books','isbn1111111111111')
+        self.assertTrue(library.search_words('books','Title','dune').empty)
+        self.assertTrue(library.search_words('books','Title','robin').empty)
+        self.assertFalse(library.search_rows('books','Title','robin').empty)
+
+    def test_digit_search(self):
+        library=self.library
+        self.assertEqual(library.search_digits('books','isbn','5062031291')['isbn'].tolist(),['isbn6865062031291'])
+        library.insert_row('books',{'isbn':'isbn1115062031111','Title':'dune','Author':'frank herbert'})
+        self.assertEqual(len(library.search_digits('books','isbn','5062031')),2)
+        library.delete_row('books','isbn1115062031111')
+        for digits in ['6','86','062','9129','6865062031291']:
+            self.assertTrue(library.search_digits('books','isbn',digits).equals(library.search_rows('books','isbn',digits)))
+        self.assertEqual(library.search_digits('users','id','3310818')['id'].tolist(),['id293310818420656'])
+
+    def test_fuzzy_search(self):
+        library=self.library
+        output=library.search_similar('books','Author','agata christi')
+        self.assertEqual(output['Author'].tolist(),['agatha christie'])
+        self.assertEqual(output['distance'].tolist(),[2])
+        self.assertTrue(library.search_similar('books','Author','agata christi',max_distance=1).empty)
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'dune','Author':'agatha christi'})
+        self.assertEqual(library.search_similar('books','Author','agata christi')['distance'].tolist(),[1,2])
+        library.delete_row('books','isbn1111111111111')
+        self.assertEqual(len(library.search_similar('books','Author','agata christi')),1)
+        self.assertEqual(library.search_similar('users','Name','jon jobb')['id'].tolist(),['id293310818420656'])
+
+    def test_query_cache(self):
+        library=self.library
+        first=library.search_words('books','Title','robinson')
+        first['Title']='changed by the caller'
+        self.assertEqual(library.search_words('books','Title','Robinson ')['Title'].tolist(),['robinson crusoe'])
+        self.assertEqual((library.query_cache_stats()['hits'],library.query_cache_stats()['misses']),(1,1))
+        # a change of the table invalidates the cached results
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'robinson','Author':'frank herbert'})
+        self.assertEqual(len(library.search_words('books','Title','robinson')),2)
+        library.books_df=library.books_df[library.books_df['isbn']!='isbn1111111111111']
+        self.assertEqual(len(library.search_words('books','Title','robinson')),1)
+        self.assertEqual(library.query_cache_stats()['misses'],3)
+        library.query_cache.max_entries=2
+        for digits in ['686','506','203']:
+            library.search_digits('books','isbn',digits)
+        self.assertEqual(library.query_cache_stats()['size'],2)
+        # a result computed before another terminal changes the table is not served after the change
+        index=library.index_of('books','Title_tokens')
+        search=index.search
+        def search_then_update(query):
+            found=search(query)
+            library.update_row('books','isbn6865062031291',{'Title':'zzzz qqqq'})
+            return found
+        index.search=search_then_update
+        self.assertEqual(len(library.search_words('books','Title','zzzz')),0)
+        index.search=search
+        self.assertEqual(len(library.search_words('books','Title','zzzz')),1)
+
+    def test_title_author_index(self):
+        library=self.library
+        self.assertTrue(library.check_if_book_exists_using_title_author('robinson crusoe','daniel defoe'))
+        self.assertTrue(library.check_if_book_exists_using_isbn_title_author('isbn6865062091293','robinson crusoe','daniel defoe'))
+        self.assertFalse(library.check_if_book_exists_using_isbn_title_author('isbn6865062031291','robinson crusoe','daniel defoe'))
+        library.update_row('books','isbn6865062091293',{'Author':'defoe'})
+        self.assertFalse(library.check_if_book_exists_using_title_author('robinson crusoe','daniel defoe'))
+        self.assertTrue(library.check_if_book_exists_using_title_author('robinson crusoe','defoe'))
+        library.insert_row('books',{'isbn':'isbn1111111111111','Title':'robinson crusoe','Author':'defoe'})
+        self.assertEqual(len(library.find_rows('books',Author='defoe',Title='robinson crusoe')),2)
+        library.delete_row('books','isbn6865062091293')
+        self.assertEqual(library.find_rows('books',Title='robinson crusoe',Author='defoe')['isbn'].tolist(),['isbn1111111111111'])
+        self.assertIn('Title_Author',library.row_indexes['books'])
+
+    def test_integrity_report(self):
+        self.assertTrue(self.library.integrity_report('books').empty)
+        with open(os.path.join(self.data_dir,'Books_csv.csv'),'a') as csv_file:
+            csv_file.write('isbn123,emma,jane austen\nisbn2222222222222,x,jane austen2\n')
+        LibraryManager.validate_on_load=True
+        try:
+            library=self.new_library()
+        finally:
+            del LibraryManager.validate_on_load
+        self.assertIn('validate',library.load_timings['books'])
+        report=library.integrity_report('books')
+        self.assertEqual(report[['isbn','column','reason']].values.tolist(),
+                         [['isbn123','isbn','wrong_length'],['isbn2222222222222','Title','too_short'],
+                          ['isbn2222222222222','Author','contains_digit']])
+
+    def test_key_allocator(self):
+        used=set(self.library.books_df['isbn'])
+        isbns=[]
+        threads=[threading.Thread(target=lambda: isbns.extend(self.library.generate_unique_isbns(500))) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        isbns.append(self.library.generate_unique_isbn())
+        self.assertEqual(len(set(isbns)),2001)
+        self.assertFalse(used & set(isbns))
+        self.assertTrue(all(len(isbn)==17 and isbn.startswith('isbn') for isbn in isbns))
+        allocator=self.library.key_allocators['books']
+        self.library.insert_row('books',{'isbn':isbns[-1],'Title':'emma','Author':'jane austen'})
+        self.assertNotIn(isbns[-1],allocator.reserved)
+        self.assertTrue(allocator.is_used(isbns[-1]))
+        # a bulk insert while another terminal allocates keys, the allocator looks up the key index the insert dropped
+        rows=pd.DataFrame({'isbn':isbns[:50],'Title':['emma']*50,'Author':['jane austen']*50})
+        allocating=threading.Event()
+        is_used=allocator.is_used
+        def slow_is_used(key):
+            allocating.set()
+            time.sleep(0.2)
+            return is_used(key)
+        allocator.is_used=slow_is_used
+        allocate=threading.Thread(target=self.library.generate_unique_isbn,daemon=True)
+        insert=threading.Thread(target=self.library.insert_rows,args=('books',rows),daemon=True)
+        allocate.start()
+        allocating.wait()
+        insert.start()
+        allocate.join(5)
+        insert.join(5)
+        self.assertFalse(allocate.is_alive() or insert.is_alive())
+        self.assertFalse(allocator.reserved & set(isbns[:50]))
+
+
+if __name__ == '__main__':
+    unittest.main()
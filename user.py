@@ -1,6 +1,5 @@
 import pandas as pd
 import regex
-import random
 import logging
 from utilities import LibraryMangUntilities
 
@@ -20,6 +19,9 @@ class UsersManager(LibraryMangUntilities):
     5. list_all_user := print to screen all the users
     6. add_a_user := adds a new row with details of a new user
     7. delete_a_user_based_on_id := delete a user data based on id number
+    8. generate_unique_ids := generates many unique ids at once
+    9. bulk_import_users := adds all the users of a .csv file with a Name column in one go
+    10. find_users := searches by name and partial id from code, no input or printing, returns one page of users
     """
     def __init__(self):
         pass
@@ -44,9 +46,9 @@ class UsersManager(LibraryMangUntilities):
         id=id.strip()
 
         #format string
-        if not self.format_string(id):
-            return False
         id=self.format_string(id)
+        if not id:
+            return False
 
         #check if empty or spaces
         if id=="":
@@ -93,23 +95,24 @@ class UsersManager(LibraryMangUntilities):
         # choose the attributes you want to search by, input the values, validate it according to the type
         # 
 
-        print("\n Choose among the attributes to search from:")
-        print("1. id")
-        print("2. Name")
         # storing option number with attribute for easy access
         attribute_dict={1:"id",2:"Name"}
-        # getting the input from user, converting from string to int
-        selected_attribute= input("Enter corresponding number: ")
-        # validate the input to be one among [1,2]
-        try:
-            # converting from string to int
-            selected_attribute=int(selected_attribute)
-            if selected_attribute not in [1,2]:
-                logging.error("\nIncorrect input, choose among 1,2 only. Try again...")
-            print(f"You have chosen {selected_attribute}. {attribute_dict.get(selected_attribute, 'Incorrect input, choose among 1, 2 only. Try again...')}")
-        except ValueError:
+        # asked again until the input is one among [1,2]
+        while True:
+            print("\n Choose among the attributes to search from:")
+            print("1. id")
+            print("2. Name")
+            # getting the input from user, converting from string to int
+            selected_attribute= input("Enter corresponding number: ")
+            try:
+                # converting from string to int
+                selected_attribute=int(selected_attribute)
+            except ValueError:
+                selected_attribute=None
+            if selected_attribute in attribute_dict:
+                break
             logging.error("\nIncorrect input, choose among 1,2 only. Try again...")
-            self.search_among_user_attributes()
+        print(f"You have chosen {selected_attribute}. {attribute_dict[selected_attribute]}")
 
         if selected_attribute==1:
             #search by id value
@@ -120,60 +123,98 @@ class UsersManager(LibraryMangUntilities):
             logging.info("author search selected")
             self.search_name()
 
+    # finds users without any input or printing
+    def find_users(self,name=None,id_fragment=None,limit=50,offset=0,typo_tolerant=False):
+        """
+        Searches the users from code, nothing is asked or printed, so it can be used by a service or a benchmark.
+        The CLI search methods (search_id, search_name) only ask for the input and print the result of this.
+        Every given criterion has to match, with no criteria all the users are returned page by page.
+
+        Rules:
+        1. name, validated like validate_name. Users whose name contains name are found
+        2. id_fragment, the whole or partial id number, only digits, max 15 digits, the "id" prefix is optional
+        3. typo_tolerant, if True and no name contains name, the names within a couple of typos are used
+
+        Input:
+        name, id_fragment, type=string or None
+        limit, max number of users returned, None for all of them
+        offset, number of matching users skipped, used with limit to go page by page
+
+        Return:
+        QueryResult, with the page of users under rows (the "Borrowed" column filled from the loans)
+        and the number of matching users under total
+
+        Raises:
+        ValueError if a criterion does not follow its rules
+        """
+        outputs=[]
+        if id_fragment is not None:
+            digits=str(id_fragment).strip()
+            if digits.startswith("id"):
+                digits=digits[2:]
+            if digits=="":
+                raise ValueError("id cannot be whitespaces or empty")
+            if not digits.isdigit():
+                raise ValueError("id should only have numbers")
+            if len(digits)>15:
+                raise ValueError("id has at most 15 digits")
+            # only the rows having the digits of the input are checked, see search_digits
+            outputs.append(self.search_digits('users',"id",digits))
+        if name is not None:
+            name=self.validate_name(str(name))
+            if not name:
+                raise ValueError("Name does not follow the naming rules, refer to validate_name")
+            output=self.search_rows('users',"Name",name)
+            if output.empty and typo_tolerant:
+                # the name may be misspelled, the closest names are used
+                output=self.search_similar('users',"Name",name)
+            outputs.append(output)
+        result=self.combine_results('users',outputs,limit,offset)
+        result.rows=self.refresh_borrowed_column(result.rows)
+        return result
+
+    # asks for a search input until find_users accepts it
+    def _ask_and_find_users(self,prompt,criterion,typo_tolerant=False):
+        while True:
+            sub_string=input(prompt)
+            try:
+                return self.find_users(**{criterion:sub_string},limit=None,typo_tolerant=typo_tolerant)
+            except ValueError as error:
+                print("="*50)
+                print(f"Invalid input, {error}. Try again...")
+                print("="*50)
+                logging.error(str(error))
+
     #  searches by id number
     def search_id(self):
         """
         Used to search the library based on id number
         Rules:
         1. only numbers are inputed, prefix of "id" NOT to be inputed
-        2. since max length for  id is 13 digits, the input should not exceed that
+        2. since max length for  id is 15 digits, the input should not exceed that
 
         Returns:
         It does not return anything, it prints all rows that contain the entered string or substring to the terminal
         """
-        #Get id value as input from user
-        sub_string=input("enter the whole or partial id number to search for, (DO NOT include id as prefix): ")
-        
-        # Validate the input
-        #removing trailing spaces
-        sub_string=sub_string.strip()
-
-        #check if empty or spaces
-        if sub_string=="":
-            logging.error("\nError: input cannot be whitespaces or simpy empty, try again....\n")
-            #if input fails, we asks for input again
-            self.search_id()
-
-        #check that its only numbers
-        if not sub_string.isdigit():
-            logging.error("\nError: Ensure only numbers are entered, try again....\n")
-            # if input failed, we ask for input again
-            self.search_id()
-
-        # check if max length exceed 13
-        if len(sub_string)>15:
-            logging.error("\nError: The max possible input length is 13, try again\n")
-            self.search_id()
-        
-        #search for said substring in the id col of the dataframe
-        # print(self.users_df[self.users_df["id"].str.contains(sub_string,case=False,na=False)])
-        
-        output=self.users_df[self.users_df["id"].str.contains(sub_string,case=False,na=False)]
+        #Get id value as input from user, asked again if it is not valid
+        result=self._ask_and_find_users("enter the whole or partial id number to search for, (DO NOT include id as prefix): ","id_fragment")
         
         # if no match found
-        if (output.empty):
+        if result.total==0:
             error_message="Tried searching, no match found"
+            print(error_message)
             logging.error(error_message)
-            return self.search_id()
+            return
         logging.info("sub_string match found under id")
-        print(output)
-   
+        print(result.rows)
+
     #  search by name   
     def search_name(self):
         """
         Used to search for a string or substring within the column "Name"
         Rules:
         1. same validation rules from validate_name() function applies here, refer to validate_name's docstring
+        2. if nothing contains the entered name, names within a couple of typos are shown, closest first
 
         Input:
         input is taken from user
@@ -191,30 +232,21 @@ class UsersManager(LibraryMangUntilities):
         6. trailing dots from end like MRS. DR. 'Dr. .Ram. will be automatically removed
         7. only ASCII inputs
         8. max 255 chars""")
-        #take authors name as input from user
-        sub_str=input("Enter partial or full name: ")
-        # validate the name
-        if not self.validate_name(sub_str):
-            print("="*50)
-            print("Invalid input, please follow naming rules")
-            print("="*50)
-            self.search_name()
-
-        sub_str=self.validate_name(sub_str)
-        # print("sub_str=",sub_str)
-        # search for substring in column Name
-        output=self.users_df[self.users_df["Name"].str.contains(sub_str)]
+        #take name as input from user, asked again if it is not valid
+        result=self._ask_and_find_users("Enter partial or full name: ","name",typo_tolerant=True)
         
         # if no match found
-        if (output.empty):
+        if result.total==0:
             print("="*50)
             error_message="Tried searching, no match found"
             print(error_message)
             print("="*50)
             logging.error(error_message)
-            return self.search_name()
+            return
+        if 'distance' in result.rows.columns:
+            print("No exact match, closest names:")
         logging.info("sub_string match found under Names name")
-        print(output)
+        print(result.rows)
     
     #  generates unique id for user
     def generate_unique_id(self):
@@ -223,37 +255,28 @@ class UsersManager(LibraryMangUntilities):
 
         The function generates an unique 17char id value for every new user entered into library
         Rules:
-        1. we have to check id in the dataset before assigning to prevent duplicates 
+        1. the id must not be used by another user, nor handed out to another writer that did not add its user yet
 
         Output:
         id
         type: string
         
         """
-        def unique_id():
-            """
-            generates the unique 17char id with the prefix "id", Totalling a 17 char long string
-
-            This is used in generate_unique_id function. Its nested to follow DRY principles
+        return self.allocate_keys("users")[0]
+    
+    #  generates many unique ids at once
+    def generate_unique_ids(self,count):
+        """
+        generates count unique ids, none of them already used in the library
 
-            Output:
-            id
-            type: string
+        Input:
+        count, number of ids needed, type=int
 
-            """
-            id="id"+"".join([str(random.randint(0,9)) for i in range(15)])
-            return id
-            
-    
-        #generated number with the prefix id
-        id=unique_id()
+        Output:
+        list of id strings
+        """
+        return self.allocate_keys("users",count)
 
-        #check for duplicates
-        while id in self.users_df["id"]:
-            id=unique_id()
-        
-        return id
-    
     #  update a cell in existing dataset
     def update_an_existing_user_detail(self):
         """
@@ -324,22 +347,13 @@ class UsersManager(LibraryMangUntilities):
         udpated_name=get_new_name_and_validate_it()
         logging.info("received the new name from user via CLI")
 
-        # temparily storing the user's list of borrowed book
-        borrowed_books=(self.users_df.loc[self.users_df['id'] == input_id, 'Borrowed'].values)
-        # print("BORROWING values=",str(borrowed_books))
-        # print("BORROWING type=",type(str(borrowed_books)))
-        logging.info("removing entire row")
-        self.users_df=self.users_df[self.users_df['id']!=input_id]
-
-        
-        # logging.info("savinng data to .csv file")
-        new_book=pd.DataFrame({'id':input_id,'Name':udpated_name,'Borrowed':borrowed_books})
-        self.users_df=pd.concat([self.users_df,new_book],ignore_index=True)
-
-
-        #save the updates to the .csv file
+        # only the name changes, the user's list of borrowed book is kept as is
         logging.info("savinng data to .csv file")
-        self.save_user_df_to_csv()
+        # the user may have been deleted by another terminal while the name was typed
+        with self.row_locks.hold(("user",input_id)):
+            if not self.update_row('users',input_id,{'Name':udpated_name}):
+                print("id entered Not found in database")
+                return
         logging.info("saved to file")
 
     # show all users in file
@@ -365,7 +379,7 @@ class UsersManager(LibraryMangUntilities):
         if rows>len(self.users_df):
             print(f"The max number of rows is{len(self.users_df)}, you have requested for {rows} rows, printing available rows")
         #printing according to the user inputed number of rows
-        print(self.users_df.head(rows))
+        print(self.refresh_borrowed_column(self.users_df.head(rows)))
 
     #adds a users
     def add_a_user(self):
@@ -375,7 +389,7 @@ class UsersManager(LibraryMangUntilities):
         id=self.validate_id(id)
 
         # check if another row has the same id
-        if not self.users_df[self.users_df['id']==id].empty:
+        if self.row_exists('users',id=id):
             error_message="\nError: duplicate id exits in library"
             logging.error(error_message)
             return False
@@ -418,10 +432,8 @@ class UsersManager(LibraryMangUntilities):
         name=get_new_name_and_validate_it()
         logging.info("received the new name from user via CLI")
         logging.info("savinng data to .csv file")
-        new_user=pd.DataFrame({'id':[id],'Name':[name],'Borrowed':[" "]})
-        self.users_df=pd.concat([self.users_df,new_user],ignore_index=True)
-        print(self.users_df[self.users_df['id']==id])
-        self.save_user_df_to_csv()
+        self.insert_row('users',{'id':id,'Name':name,'Borrowed':" "})
+        print(self.find_rows('users',id=id))
         logging.info("saved to file")
     
     # delete a row according to id or title, but not according to Name, since author could have written multiple users
@@ -459,7 +471,7 @@ class UsersManager(LibraryMangUntilities):
 
         input_id=self.validate_id(input_id)
         # check if another row has the same id
-        if self.users_df[self.users_df['id']==input_id].empty:
+        if not self.row_exists('users',id=input_id):
             error_message="\nError: id entered Not found in database"
             logging.error(error_message)
             # return self.delete_a_user_based_on_id()
@@ -491,26 +503,66 @@ class UsersManager(LibraryMangUntilities):
 
         logging.info("checking if the person has any Borrowed books")
         #finding the exact row and returning the cotents of "Borrorwed"
-        logging.info('finding the exact row and returning the cotents of "Borrorwed"')
-        output=self.users_df.loc[self.users_df['id']==input_id,"Borrowed"].str.strip()
-        #the output is in Serries, converting it to string
-        if str(output)!="":
-            self.users_df=self.users_df[self.users_df['id']!=input_id]
-            logging.info("Record removed")
-            self.save_user_df_to_csv()
-            logging.info("saved to file")
-        else:
-            msg='User has Borrowed book, removing user after he/she has returned all the books'
-            logging.info(msg)
-            print(msg)
+        logging.info('finding the loans of the user')
+        # the loans are indexed by user, so this does not scan the users
+        # the user cannot borrow from another terminal between the check and the delete
+        with self.row_locks.hold(("user",input_id)):
+            if not self.loans_by_user.get(input_id):
+                self.delete_row('users',input_id)
+                self.drop_holds(user_id=input_id)
+                logging.info("Record removed")
+                logging.info("saved to file")
+            else:
+                msg='User has Borrowed book, removing user after he/she has returned all the books'
+                logging.info(msg)
+                print(msg)
+
+    # adds all the users of a .csv file in one go
+    def bulk_import_users(self,file_path,error_report_path=None):
+        """
+        Imports every user of a .csv file with the column Name.
+
+        All names are validated in one vectorized pass using the same rules as validate_name.
+        Rows that fail validation are rejected into an error report, the rest get an id each and are
+        added with a single write. Names do not have to be unique, two people can share a name.
+
+        Input:
+        file_path, path of the .csv file
+        error_report_path, where the rejected rows are written, defaults to file_path+".errors.csv"
+
+        Return:
+        dict with "imported","rejected" and "error_report" (None if no row was rejected)
+        """
+        rows=self.read_import_file(file_path,['Name'])
+        names,reasons=self.validate_name_column(rows['Name'])
+        accepted=pd.DataFrame({'Name':names[reasons==""]})
+        accepted.insert(0,'id',self.generate_unique_ids(len(accepted)))
+        accepted['Borrowed']=" "
+        self.insert_rows('users',accepted)
+
+        rejected=rows[reasons!=""].assign(reason="name_"+reasons[reasons!=""])
+        if error_report_path is None:
+            error_report_path=file_path+".errors.csv"
+        report=self.write_error_report(rejected,error_report_path)
+        summary={"imported":len(accepted),"rejected":len(rejected),"error_report":report}
+        logging.info(f"bulk import of users: {summary}")
+        return summary
 
     # saves dataset to .csv file
-    def save_user_df_to_csv(self):
+    def save_user_df_to_csv(self,op=None,id=None):
         """
-        saves dataset to .csv file
+        saves changes of the dataset.
+        If op and id are given, only the change of that row is appended to the journal,
+        otherwise the entire dataset is written to the .csv file
+
+        Params:
+        op, one among "insert","update","delete", type=string
+        id, id of the changed row, type=string
         """
-        # to do: thsi replaces the entire contnets of the csv file, how to only reflect the changes that occured?
-        self.users_df.to_csv(self.user_df_file_path,index=False)
+        if op is None:
+            self.compact_table('users')
+            return
+        self.record_change('users',op,id)
 
 if __name__=="__main__":
     pass
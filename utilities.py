@@ -1,6 +1,7 @@
 
 import logging
 import sys
+import pandas as pd
 logging.basicConfig(level=logging.ERROR)
 
 class LibraryMangUntilities:
@@ -14,6 +15,13 @@ class LibraryMangUntilities:
     2. validate_name := validates the name according to preset rules
     3. validate_choice_and_available_choices := used to check inputs from CLI and validate it
     4. Exit := exits the program gracefully
+    5. format_column := format_string applied to a whole column at once
+    6. validate_title_column := validate_title rules applied to a whole column at once
+    7. validate_name_column := validate_name rules applied to a whole column at once
+    8. read_import_file := reads a .csv file given for a bulk import
+    9. write_error_report := writes the rejected rows of a bulk import with the reason they were rejected
+    10. validate_isbn_column, validate_id_column := validate_isbn/validate_id rules applied to a whole column at once
+    11. validate_column := validates a whole column with the rules of one kind of value, "name","title","isbn" or "id"
     """
     def __init__(self):
         pass
@@ -66,10 +74,10 @@ class LibraryMangUntilities:
         # Arg: input, type=string
         """
         # check if formating is possible
-        if not self.format_string(name):
+        name=self.format_string(name)
+        if not name:
             logging.error("formating of string not possible")
             return False
-        name=self.format_string(name)
         logging.info("formatting of authors name successfull")
         
         #set max length limit for a name, should not exceed 255 chars
@@ -175,11 +183,202 @@ class LibraryMangUntilities:
 
         return choice,all_choices
     
+    def format_column(self,column):
+        """
+        formats every value of a column the same way as format_string, using vectorized string operations
+
+        Input:
+        column, pandas Series of strings, missing values are treated as empty
+
+        Return:
+        (formatted, reasons) both pandas Series aligned with column,
+        reasons is "" for values that could be formatted and "empty" otherwise
+        """
+        # one pass in python is faster than separate strip, lower and replace passes over the column
+        formatted=pd.Series([" ".join(value.split()).lower() for value in column.fillna("").astype(str).tolist()],
+                            index=column.index,dtype=object)
+        reasons=pd.Series("",index=column.index,dtype=object)
+        reasons[formatted==""]="empty"
+        return formatted,reasons
+
+    def validate_title_column(self,column):
+        """
+        applies the rules of validate_title to a whole column at once, see validate_title's docstring
+
+        Input:
+        column, pandas Series of strings
+
+        Return:
+        (titles, reasons) both pandas Series aligned with column,
+        titles holds the processed titles and reasons is "" for valid titles or the first rule that failed
+        """
+        titles,reasons=self.format_column(column)
+        valid=reasons==""
+        # the checks are applied in the same order as validate_title, only the first failing rule is reported
+        for reason,failed in [("too_long",titles.str.len()>255),
+                              ("non_ascii",titles.str.contains(r"[^\x00-\x7f]",regex=True)),
+                              ("too_short",titles.str.len()<=1)]:
+            failed=valid&failed
+            reasons[failed]=reason
+            valid&=~failed
+        return titles,reasons
+
+    def validate_name_column(self,column):
+        """
+        applies the rules of validate_name to a whole column at once, see validate_name's docstring
+
+        Input:
+        column, pandas Series of strings
+
+        Return:
+        (names, reasons) both pandas Series aligned with column,
+        names holds the processed names and reasons is "" for valid names or the first rule that failed
+        """
+        names,reasons=self.format_column(column)
+        # names of only letters, spaces and apostrophes can only fail the length rules,
+        # one match finds them and the other rules are only checked for the rest
+        simple=names.str.fullmatch(r"[a-z' ]+").astype(bool)
+        lengths=names.str.len()
+        letters=pd.Series([len(name)-name.count(" ")-name.count("'") for name in names.tolist()],index=names.index)
+        reasons[simple&(lengths>255)]="too_long"
+        reasons[simple&(lengths<=255)&(letters<=1)]="too_short"
+        checked=~simple&(reasons=="")
+        if not checked.any():
+            return names,reasons
+        rest=names[checked]
+        rest_reasons=reasons[checked]
+        valid=pd.Series(True,index=rest.index)
+        for reason,failed in [("too_long",rest.str.len()>255),
+                              ("non_ascii",rest.str.contains(r"[^\x00-\x7f]",regex=True))]:
+            failed=valid&failed
+            rest_reasons[failed]=reason
+            valid&=~failed
+        # only ascii is left, so alphanumeric is a-z and 0-9
+        failed=valid&rest.str.contains(r"[^a-z0-9\s'.]",regex=True)
+        rest_reasons[failed]="special_characters"
+        valid&=~failed
+        # remove trailing dots from the start and end of every word like MRS. DR. "Dr. .Ram."
+        rest=rest.str.replace(r"(?:(?<= )|^)\.+|\.+(?= |$)","",regex=True)
+        for reason,failed in [("dot_within_word",rest.str.contains(".",regex=False)),
+                              ("contains_digit",rest.str.contains(r"[0-9]",regex=True)),
+                              ("too_short",rest.str.count(r"[a-z]")<=1)]:
+            failed=valid&failed
+            rest_reasons[failed]=reason
+            valid&=~failed
+        names[checked]=rest
+        reasons[checked]=rest_reasons
+        return names,reasons
+
+    def validate_key_column(self,column,prefix,digit_count):
+        """
+        applies the rules of validate_isbn/validate_id to a whole column at once
+
+        Input:
+        column, pandas Series of strings
+        prefix, "isbn" or "id"
+        digit_count, number of digits after the prefix, 13 for isbn and 15 for id
+
+        Return:
+        (keys, reasons) both pandas Series aligned with column,
+        reasons is "" for valid keys or the first rule that failed among empty, wrong_prefix, not_digits, wrong_length
+        """
+        keys,reasons=self.format_column(column)
+        # most keys are well formed, one match finds them and the rules are only checked for the rest
+        checked=(reasons=="")&~keys.str.fullmatch(f"{prefix}[0-9]{{{digit_count}}}").astype(bool)
+        if checked.any():
+            rest=keys[checked]
+            valid=pd.Series(True,index=rest.index)
+            for reason,failed in [("wrong_prefix",~rest.str.startswith(prefix)),
+                                  ("not_digits",~rest.str.slice(len(prefix)).str.isdigit().astype(bool)),
+                                  ("wrong_length",rest.str.len()!=len(prefix)+digit_count)]:
+                failed=valid&failed
+                reasons[failed[failed].index]=reason
+                valid&=~failed
+        return keys,reasons
+
+    def validate_isbn_column(self,column):
+        """
+        applies the rules of validate_isbn to a whole column at once, see validate_key_column
+        """
+        return self.validate_key_column(column,"isbn",13)
+
+    def validate_id_column(self,column):
+        """
+        applies the rules of validate_id to a whole column at once, see validate_key_column
+        """
+        return self.validate_key_column(column,"id",15)
+
+    # the column validator of every kind of value
+    column_validators={"name":"validate_name_column","title":"validate_title_column",
+                       "isbn":"validate_isbn_column","id":"validate_id_column"}
+
+    def validate_column(self,kind,column):
+        """
+        validates a whole column with the same rules the single value validators use, with vectorized string operations.
+        Used for bulk imports and to check the integrity of a whole table
+
+        Input:
+        kind, one among "name","title","isbn","id"
+        column, pandas Series of strings
+
+        Return:
+        (values, reasons) both pandas Series aligned with column,
+        values holds the normalized values and reasons is "" for valid values or the first rule that failed
+        """
+        if kind not in self.column_validators:
+            raise ValueError(f"kind should be one among {','.join(self.column_validators)}")
+        return getattr(self,self.column_validators[kind])(column)
+
+    def read_import_file(self,file_path,required_columns):
+        """
+        reads a .csv file used for a bulk import, the header is matched ignoring case and spaces
+
+        Input:
+        file_path, path of the .csv file
+        required_columns, list of the column names that must be present, ex:['Title','Author']
+
+        Return:
+        pandas dataframe with the required columns, every value as string
+        Raises ValueError if a required column is missing
+        """
+        rows=pd.read_csv(file_path,dtype=object,keep_default_na=False)
+        columns={str(column).strip().lower():column for column in rows.columns}
+        missing=[column for column in required_columns if column.lower() not in columns]
+        if missing:
+            raise ValueError(f"{file_path} is missing the columns {missing}")
+        rows=rows[[columns[column.lower()] for column in required_columns]]
+        rows.columns=required_columns
+        return rows
+
+    def write_error_report(self,rejected,file_path):
+        """
+        writes the rejected rows of a bulk import to a .csv file
+
+        Input:
+        rejected, dataframe of the rejected rows with a "reason" column, its index is the row number in the import file
+        file_path, path of the report
+
+        Return:
+        file_path, or None if nothing was rejected and no report was written
+        """
+        if rejected.empty:
+            return None
+        report=rejected.copy()
+        # row number as seen in the import file, the header is line 1
+        report.insert(0,"line",report.index+2)
+        report.to_csv(file_path,index=False)
+        logging.info(f"{len(report)} rejected rows written to {file_path}")
+        return file_path
+
     def Exit(self):
         """
         Exits the program. No params or returns
+        Changes still waiting to be written in write-behind mode are flushed first
         """
         logging.info("Exiting the program gracefully")
+        flush_pending_writes=getattr(self,"flush_pending_writes",None)
+        if flush_pending_writes is not None:
+            flush_pending_writes()
         sys.exit(0)
 
 